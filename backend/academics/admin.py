@@ -1,29 +1,71 @@
-from django.contrib import admin
+from django.conf import settings
+from django.contrib import admin, messages
+from django.db import router, transaction
+from django.db.models import Count, Q
 from django.utils import timezone
 from django.contrib.auth.models import User
-from .models import College, Branch, Subject, PreviousYearQuestion, UserRole
+from pyqachu_backend.pagination import EstimatedCountPaginator
+from .models import (
+    College, Branch, Subject, PreviousYearQuestion, UserRole, DailyUsage, ModerationEvent, ArchivePack, ArchivedPYQ,
+)
 from .permissions import RoleBasedPermissionMixin
+from .exports import export_response
+from . import moderation_log
+from .archive import RestoreError, restore
+from .sharding import mirror_later
+
+
+def update_in_chunks(queryset, before_update=None, **changes):
+    """
+    queryset.update(**changes) in primary key order, ADMIN_ACTION_CHUNK_SIZE
+    rows per statement, so an action over "all N rows" never holds locks on
+    the whole selection at once. before_update(pks) runs in each chunk's
+    transaction, ahead of its UPDATE. Returns the number of rows updated.
+    """
+    updated, last_pk = 0, None
+    queryset = queryset.order_by('pk')
+    while True:
+        remaining = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        pks = list(remaining.values_list('pk', flat=True)[:settings.ADMIN_ACTION_CHUNK_SIZE])
+        if not pks:
+            return updated
+        with transaction.atomic(using=router.db_for_write(queryset.model)):
+            if before_update:
+                before_update(pks)
+            updated += queryset.model.objects.filter(pk__in=pks).update(**changes)
+            # update() sends no post_save for the shards' copies of the directory
+            mirror_later(queryset.model, pks)
+        last_pk = pks[-1]
 
 
 @admin.register(College)
 class CollegeAdmin(admin.ModelAdmin):
-    list_display = ['name', 'location', 'is_active', 'created_at', 'get_admin_count']
+    list_display = ['name', 'location', 'is_active', 'shard', 'created_at', 'get_admin_count']
     search_fields = ['name', 'location']
     list_filter = ['is_active', 'created_at']
     ordering = ['name']
+    # Changed with the move_college command, which moves the college's rows too
+    readonly_fields = ['shard']
     actions = ['activate_colleges', 'deactivate_colleges']
 
+    def get_queryset(self, request):
+        # Counted in the changelist query instead of one query per college
+        return super().get_queryset(request).annotate(
+            admin_count=Count('user_roles', filter=Q(user_roles__role='admin', user_roles__is_active=True)),
+        )
+
     def get_admin_count(self, obj):
-        return obj.user_roles.filter(role='admin', is_active=True).count()
+        return obj.admin_count
     get_admin_count.short_description = 'Active Admins'
+    get_admin_count.admin_order_field = 'admin_count'
 
     def activate_colleges(self, request, queryset):
-        updated = queryset.update(is_active=True)
+        updated = update_in_chunks(queryset, is_active=True)
         self.message_user(request, f'{updated} colleges were activated.')
     activate_colleges.short_description = "Activate selected colleges"
 
     def deactivate_colleges(self, request, queryset):
-        updated = queryset.update(is_active=False)
+        updated = update_in_chunks(queryset, is_active=False)
         self.message_user(request, f'{updated} colleges were deactivated.')
     deactivate_colleges.short_description = "Deactivate selected colleges"
 
@@ -35,6 +77,10 @@ class UserRoleAdmin(admin.ModelAdmin):
     list_filter = ['role', 'is_active', 'college', 'created_at']
     ordering = ['college', 'role', 'user']
     actions = ['activate_roles', 'deactivate_roles']
+    list_select_related = ['user', 'college', 'assigned_by']
+    autocomplete_fields = ['user', 'college', 'assigned_by']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
     def get_user_email(self, obj):
         return obj.user.email
@@ -46,12 +92,12 @@ class UserRoleAdmin(admin.ModelAdmin):
         super().save_model(request, obj, form, change)
 
     def activate_roles(self, request, queryset):
-        updated = queryset.update(is_active=True)
+        updated = update_in_chunks(queryset, is_active=True)
         self.message_user(request, f'{updated} user roles were activated.')
     activate_roles.short_description = "Activate selected roles"
 
     def deactivate_roles(self, request, queryset):
-        updated = queryset.update(is_active=False)
+        updated = update_in_chunks(queryset, is_active=False)
         self.message_user(request, f'{updated} user roles were deactivated.')
     deactivate_roles.short_description = "Deactivate selected roles"
 
@@ -63,6 +109,12 @@ class BranchAdmin(admin.ModelAdmin):
     list_filter = ['college', 'is_active', 'created_at']
     ordering = ['college', 'name']
     actions = ['activate_branches', 'deactivate_branches']
+    autocomplete_fields = ['college', 'created_by']
+
+    def get_queryset(self, request):
+        # __str__ shows the college, in autocomplete results too. Used instead of
+        # list_select_related, which the changelist skips once a queryset has joins
+        return super().get_queryset(request).select_related('college', 'created_by')
 
     def save_model(self, request, obj, form, change):
         if not change:  # If creating new branch
@@ -70,12 +122,12 @@ class BranchAdmin(admin.ModelAdmin):
         super().save_model(request, obj, form, change)
 
     def activate_branches(self, request, queryset):
-        updated = queryset.update(is_active=True)
+        updated = update_in_chunks(queryset, is_active=True)
         self.message_user(request, f'{updated} branches were activated.')
     activate_branches.short_description = "Activate selected branches"
 
     def deactivate_branches(self, request, queryset):
-        updated = queryset.update(is_active=False)
+        updated = update_in_chunks(queryset, is_active=False)
         self.message_user(request, f'{updated} branches were deactivated.')
     deactivate_branches.short_description = "Deactivate selected branches"
 
@@ -87,6 +139,11 @@ class SubjectAdmin(admin.ModelAdmin):
     list_filter = ['branch__college', 'branch', 'is_active', 'created_at']
     ordering = ['branch', 'name']
     actions = ['activate_subjects', 'deactivate_subjects']
+    autocomplete_fields = ['branch', 'created_by']
+
+    def get_queryset(self, request):
+        # __str__ shows the branch, in autocomplete results too; see BranchAdmin
+        return super().get_queryset(request).select_related('branch__college', 'created_by')
 
     def get_college(self, obj):
         return obj.branch.college.name
@@ -98,12 +155,12 @@ class SubjectAdmin(admin.ModelAdmin):
         super().save_model(request, obj, form, change)
 
     def activate_subjects(self, request, queryset):
-        updated = queryset.update(is_active=True)
+        updated = update_in_chunks(queryset, is_active=True)
         self.message_user(request, f'{updated} subjects were activated.')
     activate_subjects.short_description = "Activate selected subjects"
 
     def deactivate_subjects(self, request, queryset):
-        updated = queryset.update(is_active=False)
+        updated = update_in_chunks(queryset, is_active=False)
         self.message_user(request, f'{updated} subjects were deactivated.')
     deactivate_subjects.short_description = "Deactivate selected subjects"
 
@@ -114,29 +171,44 @@ class PreviousYearQuestionAdmin(admin.ModelAdmin):
     search_fields = ['subject__name', 'year', 'regulation', 'uploaded_by__username']
     list_filter = ['status', 'year', 'semester', 'subject__branch__college', 'uploaded_at']
     ordering = ['-uploaded_at']
-    actions = ['approve_pyqs', 'reject_pyqs', 'reset_to_pending']
+    actions = ['approve_pyqs', 'reject_pyqs', 'reset_to_pending', 'export_csv', 'export_xlsx']
     readonly_fields = ['uploaded_at', 'reviewed_at']
+    list_select_related = ['subject__branch', 'uploaded_by', 'reviewed_by']
+    autocomplete_fields = ['subject', 'uploaded_by', 'reviewed_by', 'claimed_by']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
     def approve_pyqs(self, request, queryset):
-        updated = queryset.update(
+        # Reviewed papers leave the moderation queue, as in the API
+        updated = update_in_chunks(
+            queryset,
+            before_update=lambda pks: moderation_log.record_bulk(pks, request.user, 'approved'),
             status='approved',
             reviewed_by=request.user,
-            reviewed_at=timezone.now()
+            reviewed_at=timezone.now(),
+            claimed_by=None,
+            claim_expires_at=None,
         )
         self.message_user(request, f'{updated} PYQs were approved.')
     approve_pyqs.short_description = "Approve selected PYQs"
 
     def reject_pyqs(self, request, queryset):
-        updated = queryset.update(
+        updated = update_in_chunks(
+            queryset,
+            before_update=lambda pks: moderation_log.record_bulk(pks, request.user, 'rejected'),
             status='rejected',
             reviewed_by=request.user,
-            reviewed_at=timezone.now()
+            reviewed_at=timezone.now(),
+            claimed_by=None,
+            claim_expires_at=None,
         )
         self.message_user(request, f'{updated} PYQs were rejected.')
     reject_pyqs.short_description = "Reject selected PYQs"
 
     def reset_to_pending(self, request, queryset):
-        updated = queryset.update(
+        updated = update_in_chunks(
+            queryset,
+            before_update=lambda pks: moderation_log.record_bulk(pks, request.user, 'pending'),
             status='pending',
             reviewed_by=None,
             reviewed_at=None,
@@ -144,3 +216,94 @@ class PreviousYearQuestionAdmin(admin.ModelAdmin):
         )
         self.message_user(request, f'{updated} PYQs were reset to pending.')
     reset_to_pending.short_description = "Reset to pending review"
+
+    def export_csv(self, request, queryset):
+        return export_response('pyqs', queryset.order_by('id'), 'csv')
+    export_csv.short_description = "Export selected PYQs as CSV"
+
+    def export_xlsx(self, request, queryset):
+        return export_response('pyqs', queryset.order_by('id'), 'xlsx')
+    export_xlsx.short_description = "Export selected PYQs as XLSX"
+
+
+@admin.register(ModerationEvent)
+class ModerationEventAdmin(admin.ModelAdmin):
+    """Read-only view of the moderation history"""
+    list_display = ['created_at', 'action', 'pyq_id', 'college', 'moderator', 'from_status', 'to_status']
+    list_filter = ['action', 'college']
+    search_fields = ['moderator__username']
+    list_select_related = ['college', 'moderator']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ArchivedPYQ)
+class ArchivedPYQAdmin(admin.ModelAdmin):
+    """Papers in cold storage; the restore action puts them back"""
+    list_display = ['pyq_id', 'college', 'subject', 'year', 'semester', 'status', 'reason', 'pack', 'archived_at']
+    list_filter = ['reason', 'status', 'college']
+    search_fields = ['=pyq_id', 'subject__name']
+    list_select_related = ['college', 'subject', 'pack']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ['restore_pyqs']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def restore_pyqs(self, request, queryset):
+        restored = 0
+        for stub in queryset:
+            try:
+                restore(stub)
+            except RestoreError as e:
+                self.message_user(request, str(e), messages.WARNING)
+            else:
+                restored += 1
+        self.message_user(request, f'{restored} PYQs were restored.')
+    restore_pyqs.short_description = "Restore selected PYQs"
+
+
+@admin.register(ArchivePack)
+class ArchivePackAdmin(admin.ModelAdmin):
+    list_display = ['name', 'paper_count', 'original_bytes', 'packed_bytes', 'created_at']
+    date_hierarchy = 'created_at'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(DailyUsage)
+class DailyUsageAdmin(admin.ModelAdmin):
+    """Read-only view of the rollups built by the rollup_usage command"""
+    list_display = ['day', 'kind', 'college', 'subject', 'events', 'users']
+    list_filter = ['kind', 'day', 'college']
+    list_select_related = ['college', 'subject']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    date_hierarchy = 'day'
+    ordering = ['-day', 'kind']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
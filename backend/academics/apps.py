@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class AcademicsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'academics'
+
+    def ready(self):
+        # Connects the receivers that mirror users, roles and colleges to the shards
+        from . import sharding
+
+        post_migrate.connect(sharding.reserve_id_blocks_after_migrate, sender=self)
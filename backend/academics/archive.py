@@ -0,0 +1,222 @@
+import logging
+import os
+import shutil
+import tempfile
+import zipfile
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from django.contrib.auth.models import User
+from django.core.files import File
+from django.core.files.storage import default_storage, storages
+from django.conf import settings
+from django.db import IntegrityError, router, transaction
+from django.db.models import Case, CharField, FileField, Q, Value, When
+from django.utils import timezone
+
+from .models import ArchivedPYQ, ArchivePack, Bookmark, PreviousYearQuestion, Subject
+from .sharding import use_shard
+
+
+logger = logging.getLogger(__name__)
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+class RestoreError(Exception):
+    """An archived paper can't be put back, e.g. its subject was deleted"""
+
+
+def archive_storage():
+    return storages['archive']
+
+
+def candidates(now, rejected_days, stale_days):
+    """
+    Papers due for cold storage, oldest id first, annotated with the reason:
+    rejected more than rejected_days ago, or reviewed papers that nobody has
+    opened, reviewed or uploaded in the last stale_days. Pending papers are
+    never archived.
+    """
+    rejected = Q(status='rejected', reviewed_at__lt=now - timedelta(days=rejected_days))
+    stale_cutoff = now - timedelta(days=stale_days)
+    stale = (
+        ~Q(status='pending') & Q(uploaded_at__lt=stale_cutoff)
+        & (Q(last_accessed_at__isnull=True) | Q(last_accessed_at__lt=stale_cutoff))
+        & (Q(reviewed_at__isnull=True) | Q(reviewed_at__lt=stale_cutoff))
+    )
+    return PreviousYearQuestion.objects.filter(rejected | stale).annotate(
+        archive_reason=Case(When(rejected, then=Value('rejected')), default=Value('stale'), output_field=CharField()),
+    ).order_by('id')
+
+
+def _snapshot(pyq):
+    """The paper's row as JSON-ready values keyed by column attribute"""
+    record = {}
+    for field in pyq._meta.concrete_fields:
+        value = field.value_from_object(pyq)
+        if isinstance(field, FileField):
+            value = value.name
+        elif isinstance(value, datetime):
+            # DjangoJSONEncoder would drop the microseconds
+            value = value.isoformat()
+        record[field.attname] = value
+    return record
+
+
+def _write_pack(pyqs, output):
+    """
+    Copy the papers' files into a zip on output, LZMA-compressed per member so
+    one can be restored without reading the rest. Returns {pyq id: (member,
+    size)}; papers whose file is missing get no member.
+    """
+    members = {}
+    with zipfile.ZipFile(output, 'w', compression=zipfile.ZIP_LZMA) as pack:
+        for pyq in pyqs:
+            member = f'{pyq.id}/{os.path.basename(pyq.paper_file.name)}'
+            try:
+                with pyq.paper_file.open('rb') as paper, pack.open(member, 'w', force_zip64=True) as out:
+                    shutil.copyfileobj(paper, out, COPY_CHUNK_SIZE)
+            except (FileNotFoundError, ValueError):
+                logger.warning('Archiving PYQ %s without its missing file %s', pyq.id, pyq.paper_file.name)
+                continue
+            members[pyq.id] = (member, pack.getinfo(member).file_size)
+    return members
+
+
+def _delete_files(names):
+    # Imports can point several papers at one file, on any shard; keep those still in use
+    in_use = set()
+    for alias in settings.DATABASE_SHARDS:
+        in_use.update(
+            PreviousYearQuestion.objects.using(alias).filter(paper_file__in=names).values_list('paper_file', flat=True)
+        )
+    for name in set(names) - in_use:
+        default_storage.delete(name)
+
+
+def archive_batch(ids, now, rejected_days, stale_days):
+    """
+    Move one batch of papers into a new pack. The rows are locked and
+    re-checked first, so a paper approved or opened since it was picked
+    stays hot. Returns the pack, or None if nothing was left to archive.
+    """
+    storage = archive_storage()
+    with transaction.atomic(using=router.db_for_write(PreviousYearQuestion)):
+        pyqs = list(
+            candidates(now, rejected_days, stale_days).filter(id__in=ids)
+            .select_for_update(of=('self',)).select_related('subject__branch')
+        )
+        if not pyqs:
+            return None
+
+        with tempfile.TemporaryFile() as output:
+            members = _write_pack(pyqs, output)
+            packed_bytes = output.tell()
+            output.seek(0)
+            name = storage.save(f'{now:%Y/%m}/pack-{now:%Y%m%d-%H%M%S}-{pyqs[0].id}-{pyqs[-1].id}.zip', File(output))
+
+        try:
+            pack = ArchivePack.objects.create(
+                name=name, paper_count=len(pyqs), packed_bytes=packed_bytes,
+                original_bytes=sum(size for _, size in members.values()),
+            )
+            bookmarked_by = defaultdict(list)
+            for user_id, pyq_id in Bookmark.objects.filter(pyq__in=pyqs).values_list('user_id', 'pyq_id'):
+                bookmarked_by[pyq_id].append(user_id)
+            ArchivedPYQ.objects.bulk_create([
+                ArchivedPYQ(
+                    pyq_id=pyq.id, college_id=pyq.subject.branch.college_id, subject_id=pyq.subject_id,
+                    year=pyq.year, semester=pyq.semester, status=pyq.status, reason=pyq.archive_reason,
+                    record=_snapshot(pyq), bookmarked_by=bookmarked_by[pyq.id], pack=pack,
+                    member=members.get(pyq.id, ('', 0))[0], size=members.get(pyq.id, ('', 0))[1],
+                )
+                for pyq in pyqs
+            ])
+            # Bookmarks, fingerprints and related-paper rows go with them
+            PreviousYearQuestion.objects.filter(id__in=[pyq.id for pyq in pyqs]).delete()
+        except Exception:
+            storage.delete(name)
+            raise
+
+        names = [pyq.paper_file.name for pyq in pyqs if pyq.id in members]
+        transaction.on_commit(lambda: _delete_files(names), using=router.db_for_write(PreviousYearQuestion))
+    return pack
+
+
+def archive(pack_size, limit=None, rejected_days=30, stale_days=730, now=None):
+    """
+    Archive due papers in packs of pack_size, at most limit papers per run.
+    Each pack commits on its own, so an interrupted run keeps its progress
+    and the next run carries on. Yields the packs written.
+    """
+    now = now or timezone.now()
+    ids = candidates(now, rejected_days, stale_days).values_list('id', flat=True)
+    if limit is not None:
+        ids = ids[:limit]
+    ids = list(ids)
+    for start in range(0, len(ids), pack_size):
+        pack = archive_batch(ids[start:start + pack_size], now, rejected_days, stale_days)
+        if pack is not None:
+            yield pack
+
+
+def restore(stub):
+    """
+    Put an archived paper back under its original id, with its file and
+    bookmarks, on the shard holding the stub. Packs are deleted once their
+    last paper is restored.
+    """
+    with use_shard(stub._state.db if stub._state.db in settings.DATABASE_SHARDS else 'default'):
+        return _restore(stub)
+
+
+def _restore(stub):
+    storage = archive_storage()
+    with transaction.atomic(using=router.db_for_write(ArchivedPYQ)):
+        stub = ArchivedPYQ.objects.select_for_update().select_related('pack').get(pk=stub.pk)
+        fields = {field.attname: field for field in PreviousYearQuestion._meta.concrete_fields}
+        values = {
+            attname: None if value is None else fields[attname].to_python(value)
+            for attname, value in stub.record.items() if attname in fields
+        }
+        if not Subject.objects.filter(id=values['subject_id']).exists():
+            raise RestoreError(f'The subject of PYQ {stub.pyq_id} no longer exists.')
+        if not User.objects.filter(id=values['uploaded_by_id']).exists():
+            raise RestoreError(f'The uploader of PYQ {stub.pyq_id} no longer exists.')
+        pyq = PreviousYearQuestion(**values)
+
+        saved_name = None
+        if stub.member:
+            with storage.open(stub.pack.name, 'rb') as packfile, zipfile.ZipFile(packfile) as pack:
+                with pack.open(stub.member) as member, tempfile.TemporaryFile() as paper:
+                    shutil.copyfileobj(member, paper, COPY_CHUNK_SIZE)
+                    paper.seek(0)
+                    saved_name = default_storage.save(pyq.paper_file.name, File(paper))
+            pyq.paper_file.name = saved_name
+
+        try:
+            pyq.save(force_insert=True)
+        except IntegrityError:
+            if saved_name:
+                default_storage.delete(saved_name)
+            raise RestoreError(f'PYQ {stub.pyq_id} could not be restored; its id may be in use.')
+        # auto_now_add stamped the restore time over the original upload time
+        PreviousYearQuestion.objects.filter(pk=pyq.pk).update(uploaded_at=values['uploaded_at'])
+        pyq.uploaded_at = values['uploaded_at']
+
+        users = User.objects.filter(id__in=stub.bookmarked_by).values_list('id', flat=True)
+        Bookmark.objects.bulk_create([Bookmark(user_id=user_id, pyq=pyq) for user_id in users])
+
+        pack = stub.pack
+        stub.delete()
+        if pack is not None and not pack.papers.exists():
+            pack.delete()
+            transaction.on_commit(lambda: _delete_pack_file(pack.name), using=pack._state.db)
+    return pyq
+
+
+def _delete_pack_file(name):
+    # A college moved to another shard took a copy of its packs along
+    if not any(ArchivePack.objects.using(alias).filter(name=name).exists() for alias in settings.DATABASE_SHARDS):
+        archive_storage().delete(name)
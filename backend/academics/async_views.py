@@ -0,0 +1,239 @@
+"""
+Native async versions of the hot endpoints, used when running under ASGI
+(see ASYNC_VIEWS in settings). They mirror the permission rules of the
+synchronous views in views.py but use the async ORM, so a request never
+holds a worker thread while it waits on the database or a slow client.
+"""
+import asyncio
+import os
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.http import Http404, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
+from django.shortcuts import aget_object_or_404
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.authentication import CSRFCheck
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import PermissionDenied
+from rest_framework.request import Request
+
+from pyqachu_backend.db_routers import areplica_reads, amark_recent_write
+from pyqachu_backend.throttling import acharge_bytes, acheck, throttled_message
+from .events import record_event
+from .files import is_local, presigned_url
+from .models import PreviousYearQuestion, Bookmark
+from .paper_cache import get_paper_cache
+from .permissions import RoleBasedPermissionMixin
+from .serializers import PreviousYearQuestionSerializer, BookmarkSerializer
+from .signing import SIGNED_URL, signed_user, verify_download
+from .views import (
+    PreviousYearQuestionListView, get_download_filename, get_content_type, paper_size, pyq_queryset,
+    record_paper_access,
+)
+
+
+FILE_CHUNK_SIZE = 64 * 1024
+
+
+def _csrf_passes(request):
+    check = CSRFCheck(lambda req: None)
+    check.process_request(request)
+    return check.process_view(request, None, (), {}) is None
+
+
+async def aauthenticate(request):
+    """Token or session authentication, matching REST_FRAMEWORK's authentication classes"""
+    keyword, _, key = request.headers.get('Authorization', '').partition(' ')
+    if keyword == 'Token' and key.strip():
+        try:
+            token = await Token.objects.select_related('user').aget(key=key.strip())
+        except Token.DoesNotExist:
+            return None
+        return token.user if token.user.is_active else None
+
+    user = await request.auser()
+    if not user.is_authenticated:
+        return None
+    # Session-authenticated unsafe requests need a CSRF token, as in DRF
+    if request.method not in ('GET', 'HEAD', 'OPTIONS') and not _csrf_passes(request):
+        raise PermissionDenied('CSRF Failed')
+    return user
+
+
+def async_api_view(methods, throttle=None, signed=False):
+    """
+    Async counterpart of @api_view + IsAuthenticated for plain Django async
+    views; throttle names a THROTTLE_RATES scope, like throttle_classes.
+    With signed, a signed download URL for the pk authenticates the request
+    without a database query, as SignedDownloadAuthentication does.
+    """
+    def decorator(view):
+        @csrf_exempt
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                return JsonResponse({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+            try:
+                request.auth = None
+                if signed and 'signature' in request.GET:
+                    user_id = verify_download(kwargs.get('pk'), request.GET)
+                    if user_id is None:
+                        # 403 like the sync view, whose first authenticator sends no challenge
+                        return JsonResponse({'detail': 'Invalid or expired download link.'}, status=403)
+                    user, request.auth = signed_user(user_id), SIGNED_URL
+                else:
+                    user = await aauthenticate(request)
+                if user is None:
+                    return JsonResponse(
+                        {'detail': 'Authentication credentials were not provided.'}, status=401
+                    )
+                request.user = user
+                if throttle:
+                    wait = await acheck(throttle, request, user)
+                    if wait is not None:
+                        response = JsonResponse({'detail': throttled_message(wait)}, status=429)
+                        response['Retry-After'] = str(wait)
+                        return response
+                return await view(request, *args, **kwargs)
+            except PermissionDenied as e:
+                return JsonResponse({'detail': str(e.detail)}, status=403)
+            except Http404 as e:
+                return JsonResponse({'detail': str(e) or 'Not found.'}, status=404)
+        return wrapper
+    return decorator
+
+
+async def _get_accessible_pyq(request, pk, action):
+    """Fetch a PYQ and apply the same college and approval checks as the sync views"""
+    pyq = await aget_object_or_404(pyq_queryset(), pk=pk)
+    college = pyq.subject.branch.college
+
+    user_colleges = RoleBasedPermissionMixin.get_user_colleges(request.user)
+    if not await user_colleges.filter(id=college.id).aexists():
+        raise PermissionDenied("You don't have access to this PYQ")
+
+    if pyq.status != 'approved' and not request.user.is_superuser:
+        if not await RoleBasedPermissionMixin.acan_moderate_pyqs(request.user, college):
+            raise PermissionDenied(f"This PYQ is not approved for {action}")
+
+    return pyq
+
+
+async def stream_file(paper, chunk_size=FILE_CHUNK_SIZE):
+    """Read an open file in chunks off the event loop, one chunk per send"""
+    try:
+        while chunk := await asyncio.to_thread(paper.read, chunk_size):
+            yield chunk
+    finally:
+        await asyncio.to_thread(paper.close)
+
+
+@async_api_view(['GET'], throttle='search')
+async def pyq_list(request):
+    """
+    GET /api/pyqs/ - Async version of PreviousYearQuestionListView
+    """
+    PreviousYearQuestionListView.record_search(request.user, request.GET)
+    async with areplica_reads(request.user):
+        user_colleges = RoleBasedPermissionMixin.get_user_colleges(request.user)
+        grants = await sync_to_async(RoleBasedPermissionMixin.get_download_grants)(request.user)
+        queryset = PreviousYearQuestionListView.build_queryset(user_colleges, any(grants.values()), request.GET)
+
+        # Reuse the sync view's search and ordering configuration
+        view = PreviousYearQuestionListView(request=Request(request), format_kwarg=None, kwargs={})
+        # Picking the shards to fan out to may query the directory
+        queryset = await sync_to_async(view.filter_queryset)(queryset)
+        pyqs = [pyq async for pyq in queryset]
+
+    # As in the sync view, only sign URLs for papers the download rules allow
+    serializer = PreviousYearQuestionSerializer(
+        pyqs, many=True, context={'request': request, 'download_grants': grants}
+    )
+    return JsonResponse(serializer.data, safe=False)
+
+
+@async_api_view(['GET'], throttle='download', signed=True)
+async def pyq_download(request, pk):
+    """
+    GET /api/pyqs/<id>/download/ - Async version of pyq_download with chunked streaming
+    """
+    async with areplica_reads(request.user):
+        if request.auth == SIGNED_URL:
+            pyq = await aget_object_or_404(pyq_queryset(), pk=pk)
+        else:
+            pyq = await _get_accessible_pyq(request, pk, 'viewing')
+
+    if not pyq.paper_file:
+        raise Http404("File not found")
+
+    download = request.GET.get('download', 'false').lower() == 'true'
+    descriptive_filename = get_download_filename(pyq)
+    content_type = get_content_type(pyq.paper_file.name)
+    paper_cache = get_paper_cache()
+
+    if is_local(pyq.paper_file):
+        try:
+            paper = await asyncio.to_thread(open, pyq.paper_file.path, 'rb')
+        except FileNotFoundError:
+            raise Http404("File not found")
+    elif paper_cache is None:
+        record_paper_access(request.user, pyq, download)
+        # Papers in object storage are served by the bucket itself
+        response = HttpResponseRedirect(presigned_url(
+            pyq.paper_file, descriptive_filename, content_type, download=download,
+        ))
+        await acharge_bytes('download', request, response, size=await sync_to_async(paper_size)(pyq))
+        return response
+    else:
+        paper = await asyncio.to_thread(paper_cache.open, pyq.paper_file)
+    record_paper_access(request.user, pyq, download)
+
+    response = StreamingHttpResponse(stream_file(paper), content_type=content_type)
+    response['Content-Length'] = str(os.fstat(paper.fileno()).st_size)
+    disposition = 'attachment' if download else 'inline'
+    response['Content-Disposition'] = f'{disposition}; filename="{descriptive_filename}"'
+    await acharge_bytes('download', request, response)
+    return response
+
+
+@async_api_view(['POST', 'DELETE'])
+async def bookmark_toggle(request, pyq_id):
+    """
+    POST/DELETE /api/pyqs/<pyq_id>/bookmark/ - Async version of bookmark_toggle
+    """
+    pyq = await _get_accessible_pyq(request, pyq_id, 'bookmarking')
+
+    if request.method == 'POST':
+        bookmark, created = await Bookmark.objects.aget_or_create(user=request.user, pyq=pyq)
+
+        if created:
+            await amark_recent_write(request.user)
+            record_event('bookmark', request.user, pyq=pyq)
+            # _get_accessible_pyq has applied the download rules; checking them again
+            # in the serializer would run sync queries on the event loop
+            serializer = BookmarkSerializer(bookmark, context={'request': request, 'downloads_authorized': True})
+            return JsonResponse({
+                'message': 'PYQ bookmarked successfully',
+                'bookmark': serializer.data
+            }, status=201)
+        return JsonResponse({'message': 'PYQ is already bookmarked'}, status=200)
+
+    deleted, _ = await Bookmark.objects.filter(user=request.user, pyq=pyq).adelete()
+    if deleted:
+        await amark_recent_write(request.user)
+        record_event('unbookmark', request.user, pyq=pyq)
+        return JsonResponse({'message': 'Bookmark removed successfully'}, status=200)
+    return JsonResponse({'message': 'PYQ is not bookmarked'}, status=404)
+
+
+@async_api_view(['GET'])
+async def check_bookmark_status(request, pyq_id):
+    """
+    GET /api/pyqs/<pyq_id>/bookmark-status/ - Async version of check_bookmark_status
+    """
+    async with areplica_reads(request.user):
+        if not await PreviousYearQuestion.objects.filter(pk=pyq_id).aexists():
+            raise Http404("PYQ not found")
+        is_bookmarked = await Bookmark.objects.filter(user=request.user, pyq_id=pyq_id).aexists()
+
+    return JsonResponse({'is_bookmarked': is_bookmarked})
@@ -0,0 +1,62 @@
+import atexit
+import logging
+import threading
+
+from django.db import connections
+
+
+logger = logging.getLogger(__name__)
+
+
+class BufferedWriter:
+    """
+    Base for in-process write buffers that are flushed to the database in
+    batches by a background thread, every flush_seconds or sooner when
+    wake() is called, and once more at interpreter exit. A worker killed
+    outright loses at most flush_seconds of data.
+
+    Subclasses keep their pending data under self._lock and implement
+    _take() (swap it out; called with the lock held) and _write(data),
+    which must hand anything it could not write back to the buffer.
+    """
+
+    thread_name = 'buffer-flush'
+
+    def __init__(self, flush_seconds):
+        self.flush_seconds = flush_seconds
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def _ensure_thread(self):
+        # Called with the lock held; the thread starts with the first write
+        if self._thread is None and self.flush_seconds > 0:
+            self._thread = threading.Thread(target=self._run, name=self.thread_name, daemon=True)
+            self._thread.start()
+            atexit.register(self.flush)
+
+    def wake(self):
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_seconds)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Flushing %s failed; will retry', type(self).__name__)
+            finally:
+                # This thread's connections would otherwise stay open forever
+                connections.close_all()
+
+    def _take(self):
+        raise NotImplementedError
+
+    def _write(self, data):
+        raise NotImplementedError
+
+    def flush(self):
+        with self._lock:
+            data = self._take()
+        return self._write(data)
@@ -0,0 +1,96 @@
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+
+from .buffers import BufferedWriter
+from .models import PreviousYearQuestion
+
+
+COUNTER_FIELDS = ('download_count', 'view_count')
+
+
+class CounterBuffer(BufferedWriter):
+    """
+    Per-process buffer of PYQ download and view counts.
+
+    Increments only touch an in-memory Counter, so hot papers never contend
+    on their row; each flush writes the aggregated deltas with one UPDATE
+    per batch of papers.
+    """
+
+    thread_name = 'pyq-counter-flush'
+
+    def __init__(self, flush_seconds, batch_size):
+        super().__init__(flush_seconds)
+        self.batch_size = batch_size
+        self._pending = {field: Counter() for field in COUNTER_FIELDS}
+
+    def add(self, field, pyq_id, amount=1):
+        with self._lock:
+            self._pending[field][pyq_id] += amount
+            self._ensure_thread()
+
+    def _restore(self, field, deltas):
+        with self._lock:
+            self._pending[field].update(deltas)
+
+    def _take(self):
+        pending = self._pending
+        self._pending = {field: Counter() for field in COUNTER_FIELDS}
+        return pending
+
+    def _write(self, pending):
+        """Returns the number of increments written"""
+        written = 0
+        now = timezone.now()
+        fields = list(pending.items())
+        for index, (field, deltas) in enumerate(fields):
+            ids = list(deltas)
+            for start in range(0, len(ids), self.batch_size):
+                batch = ids[start:start + self.batch_size]
+                try:
+                    # Ids are unique across shards, so each paper is updated where it lives
+                    for alias in settings.DATABASE_SHARDS:
+                        PreviousYearQuestion.objects.filter(pk__in=batch).using(alias).update(**{
+                            field: F(field) + Case(
+                                *[When(pk=pk, then=Value(deltas[pk])) for pk in batch],
+                                default=Value(0),
+                            ),
+                            'last_accessed_at': now,
+                        })
+                except Exception:
+                    # Keep what wasn't written for the next flush
+                    self._restore(field, {pk: deltas[pk] for pk in ids[start:]})
+                    for later_field, later_deltas in fields[index + 1:]:
+                        self._restore(later_field, later_deltas)
+                    raise
+                written += sum(deltas[pk] for pk in batch)
+        return written
+
+    def pending(self):
+        with self._lock:
+            return {field: dict(counts) for field, counts in self._pending.items()}
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_counter_buffer():
+    global _buffer
+    with _buffer_lock:
+        if _buffer is None:
+            _buffer = CounterBuffer(settings.PYQ_COUNTER_FLUSH_SECONDS, settings.PYQ_COUNTER_BATCH_SIZE)
+        return _buffer
+
+
+def record_access(pyq_id, download):
+    """Count a download (download=True) or an inline view of a paper"""
+    get_counter_buffer().add('download_count' if download else 'view_count', pyq_id)
+
+
+def flush_counters():
+    return get_counter_buffer().flush()
@@ -0,0 +1,237 @@
+import hashlib
+import io
+import logging
+import random
+import re
+import threading
+
+from django.conf import settings
+from django.db import DatabaseError, router, transaction
+from PIL import Image, UnidentifiedImageError
+
+try:
+    import pypdf
+except ImportError:  # without pypdf only image uploads and exact copies are matched
+    pypdf = None
+
+from .buffers import BufferedWriter
+from .models import DuplicateCandidate, PaperFingerprint, PreviousYearQuestion, SimilarityBucket
+from .sharding import use_shard
+
+
+logger = logging.getLogger(__name__)
+
+MAX_PAGES = 5
+SHINGLE_WORDS = 5
+# 16 bands of 8 rows: papers whose text Jaccard similarity is about 0.7 or
+# more share a band with high probability
+MINHASH_BANDS = 16
+MINHASH_ROWS = 8
+TEXT_THRESHOLD = 0.7
+# Page hashes are split into 8 bytes; two hashes within 7 bits of each other
+# always share one (pigeonhole), so every such pair is a candidate
+IMAGE_CHUNKS = 8
+IMAGE_MAX_DISTANCE = 7
+
+_MERSENNE = (1 << 61) - 1
+_rng = random.Random(20240601)
+# Fixed so signatures stay comparable across processes and releases
+_PERMUTATIONS = [
+    (_rng.randrange(1, _MERSENNE), _rng.randrange(0, _MERSENNE))
+    for _ in range(MINHASH_BANDS * MINHASH_ROWS)
+]
+_WORD = re.compile(r'[a-z0-9]+')
+
+
+def difference_hash(image):
+    """64-bit dHash: which of each pair of neighbouring pixels is brighter in a 9x8 thumbnail"""
+    pixels = list(image.convert('L').resize((9, 8), Image.LANCZOS).getdata())
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = (value << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return value
+
+
+def minhash(text):
+    """MinHash signature of the text's word shingles, or [] if it has too few words"""
+    words = _WORD.findall(text.lower())
+    if len(words) < SHINGLE_WORDS:
+        return []
+    shingles = {
+        int.from_bytes(hashlib.blake2b(' '.join(words[i:i + SHINGLE_WORDS]).encode(), digest_size=8).digest(), 'big')
+        for i in range(len(words) - SHINGLE_WORDS + 1)
+    }
+    return [min((a * shingle + b) % _MERSENNE for shingle in shingles) for a, b in _PERMUTATIONS]
+
+
+def extract_features(data):
+    """
+    (page hashes, text) of a PDF or image upload. Scanned PDFs are hashed
+    through their embedded page images; PDFs with a text layer contribute
+    text. Pages aren't rasterized, so vector-only pages give text alone.
+    """
+    if not data.startswith(b'%PDF'):
+        try:
+            return [difference_hash(Image.open(io.BytesIO(data)))], ''
+        except (UnidentifiedImageError, OSError):
+            return [], ''
+    if pypdf is None:
+        return [], ''
+
+    reader = pypdf.PdfReader(io.BytesIO(data))
+    page_hashes, text = [], []
+    for page in reader.pages[:MAX_PAGES]:
+        text.append(page.extract_text() or '')
+        images = [image.image for image in page.images]
+        if images:
+            # The largest image is the page scan; smaller ones are logos and stamps
+            page_hashes.append(difference_hash(max(images, key=lambda image: image.width * image.height)))
+    # The rest of the text still counts towards the signature
+    for page in reader.pages[MAX_PAGES:]:
+        text.append(page.extract_text() or '')
+    return page_hashes, '\n'.join(text)
+
+
+def bucket_keys(pyq, fingerprint):
+    scope = f'{pyq.subject_id}:{pyq.year}'
+    keys = set()
+    signature = fingerprint.minhash
+    for band in range(MINHASH_BANDS if signature else 0):
+        rows = signature[band * MINHASH_ROWS:(band + 1) * MINHASH_ROWS]
+        digest = hashlib.blake2b(repr(rows).encode(), digest_size=8).hexdigest()
+        keys.add(f't:{scope}:{band}:{digest}')
+    for page_hash in fingerprint.page_hashes:
+        for chunk in range(IMAGE_CHUNKS):
+            keys.add(f'i:{scope}:{chunk}:{(page_hash >> (chunk * 8)) & 0xff}')
+    return keys
+
+
+def _text_similarity(a, b):
+    if not a or not b:
+        return 0.0
+    return sum(x == y for x, y in zip(a, b)) / len(a)
+
+
+def _image_similarity(a, b):
+    if not a or not b:
+        return 0.0
+    distance = min(bin(x ^ y).count('1') for x in a for y in b)
+    return 1 - distance / 64 if distance <= IMAGE_MAX_DISTANCE else 0.0
+
+
+def find_duplicates(pyq, fingerprint, keys):
+    """
+    Earlier papers that pyq likely duplicates, as {pyq id: (method,
+    similarity)}: identical or similar papers of the same subject and year.
+    Only papers sharing an LSH bucket are compared, so the cost doesn't grow
+    with the number of papers.
+    """
+    found = {}
+    if pyq.file_hash:
+        identical = PreviousYearQuestion.objects.filter(
+            file_hash=pyq.file_hash, subject_id=pyq.subject_id, year=pyq.year, pk__lt=pyq.pk,
+        )
+        for other_id in identical.values_list('id', flat=True):
+            found[other_id] = ('exact', 1.0)
+
+    candidates = (
+        SimilarityBucket.objects.filter(key__in=keys, pyq_id__lt=pyq.pk)
+        .values_list('pyq_id', flat=True).distinct()
+    )
+    for other in PaperFingerprint.objects.filter(pyq_id__in=candidates).exclude(pyq_id__in=list(found)):
+        text = _text_similarity(fingerprint.minhash, other.minhash)
+        image = _image_similarity(fingerprint.page_hashes, other.page_hashes)
+        if text >= TEXT_THRESHOLD and text >= image:
+            found[other.pyq_id] = ('text', text)
+        elif image:
+            found[other.pyq_id] = ('image', image)
+    return found
+
+
+def scan(pyq):
+    """Fingerprint one paper, index it and record what it likely duplicates"""
+    with pyq.paper_file.open('rb') as paper:
+        page_hashes, text = extract_features(paper.read())
+
+    fingerprint = PaperFingerprint(pyq=pyq, page_hashes=page_hashes, minhash=minhash(text))
+    keys = bucket_keys(pyq, fingerprint)
+    duplicates = find_duplicates(pyq, fingerprint, keys)
+    with transaction.atomic(using=router.db_for_write(PaperFingerprint)):
+        fingerprint.save()
+        SimilarityBucket.objects.filter(pyq=pyq).delete()
+        SimilarityBucket.objects.bulk_create([SimilarityBucket(key=key, pyq=pyq) for key in sorted(keys)])
+        DuplicateCandidate.objects.filter(pyq=pyq).delete()
+        DuplicateCandidate.objects.bulk_create([
+            DuplicateCandidate(pyq=pyq, duplicate_of_id=other_id, method=method, similarity=round(similarity, 4))
+            for other_id, (method, similarity) in duplicates.items()
+        ])
+    return duplicates
+
+
+class DuplicateScanQueue(BufferedWriter):
+    """
+    Per-process queue of uploaded papers waiting for the similarity stage,
+    worked through by the flush thread so uploads never wait on PDF parsing.
+    Papers that fail to parse are logged and skipped; scan_duplicates picks
+    up anything left without a fingerprint.
+    """
+
+    thread_name = 'duplicate-scan'
+
+    def __init__(self, flush_seconds):
+        super().__init__(flush_seconds)
+        self._ids = []
+
+    def add(self, pyq_id):
+        with self._lock:
+            self._ids.append(pyq_id)
+            self._ensure_thread()
+            self.wake()
+
+    def _take(self):
+        ids = self._ids
+        self._ids = []
+        return ids
+
+    def _write(self, ids):
+        """Returns the number of papers scanned"""
+        scanned = 0
+        pyqs = sorted(
+            (pyq for alias in settings.DATABASE_SHARDS
+             for pyq in PreviousYearQuestion.objects.using(alias).filter(pk__in=ids)),
+            key=lambda pyq: pyq.pk,
+        )
+        for index, pyq in enumerate(pyqs):
+            try:
+                with use_shard(pyq._state.db):
+                    scan(pyq)
+            except DatabaseError:
+                with self._lock:
+                    self._ids[:0] = [later.pk for later in pyqs[index:]]
+                raise
+            except Exception:
+                logger.exception('Could not scan PYQ %s for duplicates', pyq.pk)
+                continue
+            scanned += 1
+        return scanned
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_scan_queue():
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = DuplicateScanQueue(settings.DUPLICATE_SCAN_FLUSH_SECONDS)
+        return _queue
+
+
+def queue_duplicate_scan(pyq):
+    get_scan_queue().add(pyq.pk)
+
+
+def scan_queued():
+    return get_scan_queue().flush()
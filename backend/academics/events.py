@@ -0,0 +1,138 @@
+import threading
+from datetime import timedelta
+from itertools import groupby
+
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from .buffers import BufferedWriter
+from .models import UsageEvent, DailyUsage
+from .sharding import shard_of_college
+
+
+class EventBuffer(BufferedWriter):
+    """
+    Per-process buffer of usage events, written with bulk inserts. The
+    flush thread is woken early once a full batch is waiting. If the
+    database stays unavailable, events beyond max_pending are dropped
+    rather than growing without bound.
+    """
+
+    thread_name = 'usage-event-flush'
+
+    def __init__(self, flush_seconds, batch_size, max_pending):
+        super().__init__(flush_seconds)
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.dropped = 0
+        self._events = []
+
+    def add(self, event):
+        with self._lock:
+            if len(self._events) >= self.max_pending:
+                self.dropped += 1
+                return
+            self._events.append(event)
+            self._ensure_thread()
+            if len(self._events) >= self.batch_size:
+                self.wake()
+
+    def _take(self):
+        events = self._events
+        self._events = []
+        return events
+
+    def _write(self, events):
+        """Returns the number of events written, each on its college's shard"""
+        shards = {college_id: shard_of_college(college_id) for college_id in {event.college_id for event in events}}
+        events = sorted(events, key=lambda event: shards[event.college_id])
+        written = 0
+        for alias, group in groupby(events, key=lambda event: shards[event.college_id]):
+            group = list(group)
+            for start in range(0, len(group), self.batch_size):
+                try:
+                    UsageEvent.objects.using(alias).bulk_create(group[start:start + self.batch_size])
+                except Exception:
+                    # Put the unwritten events back in front for the next flush
+                    with self._lock:
+                        self._events[:0] = events[written + start:]
+                    raise
+            written += len(group)
+        return len(events)
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_event_buffer():
+    global _buffer
+    with _buffer_lock:
+        if _buffer is None:
+            _buffer = EventBuffer(
+                settings.USAGE_EVENT_FLUSH_SECONDS,
+                settings.USAGE_EVENT_BATCH_SIZE,
+                settings.USAGE_EVENT_MAX_PENDING,
+            )
+        return _buffer
+
+
+def record_event(kind, user, pyq=None, subject_id=None, college_id=None, query=''):
+    """
+    Queue a usage event. When pyq is given its subject and college are
+    recorded too, so it should come with subject__branch selected.
+    """
+    if pyq is not None:
+        subject_id = pyq.subject_id
+        college_id = pyq.subject.branch.college_id
+    now = timezone.now()
+    get_event_buffer().add(UsageEvent(
+        kind=kind,
+        day=timezone.localdate(now),
+        occurred_at=now,
+        user_id=user.id,
+        college_id=college_id,
+        subject_id=subject_id,
+        pyq_id=pyq.id if pyq is not None else None,
+        query=query[:200],
+    ))
+
+
+def flush_events():
+    return get_event_buffer().flush()
+
+
+def rollup_day(day):
+    """Rebuild the DailyUsage rows of one day from the raw events; safe to re-run"""
+    rows = (
+        UsageEvent.objects.filter(day=day)
+        .values('kind', 'college_id', 'subject_id')
+        .annotate(events=Count('id'), users=Count('user_id', distinct=True))
+        .order_by()
+    )
+    with transaction.atomic(using=router.db_for_write(DailyUsage)):
+        DailyUsage.objects.filter(day=day).delete()
+        created = DailyUsage.objects.bulk_create([DailyUsage(day=day, **row) for row in rows])
+    return len(created)
+
+
+def prune_events(before):
+    """
+    Delete raw events older than the given day, one day at a time so each
+    DELETE is a bounded range on the day index.
+    """
+    deleted = 0
+    days = (
+        UsageEvent.objects.filter(day__lt=before)
+        .values_list('day', flat=True).distinct().order_by('day')
+    )
+    for day in list(days):
+        count, _ = UsageEvent.objects.filter(day=day).delete()
+        deleted += count
+    return deleted
+
+
+def retention_cutoff(days=None):
+    return timezone.localdate() - timedelta(days=settings.USAGE_EVENT_RETENTION_DAYS if days is None else days)
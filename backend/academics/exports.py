@@ -0,0 +1,96 @@
+from datetime import datetime, timezone as dt_timezone
+from itertools import chain
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from .models import PreviousYearQuestion
+from .sharding import per_shard
+from .spreadsheets import csv_chunks, xlsx_chunks
+
+
+# (column header, PreviousYearQuestion lookup) for each export
+EXPORTS = {
+    'pyqs': [
+        ('id', 'id'),
+        ('college', 'subject__branch__college__name'),
+        ('branch', 'subject__branch__name'),
+        ('subject', 'subject__name'),
+        ('subject_code', 'subject__code'),
+        ('year', 'year'),
+        ('semester', 'semester'),
+        ('regulation', 'regulation'),
+        ('status', 'status'),
+        ('uploaded_by', 'uploaded_by__username'),
+        ('uploaded_at', 'uploaded_at'),
+        ('downloads', 'download_count'),
+        ('views', 'view_count'),
+    ],
+    'moderation': [
+        ('id', 'id'),
+        ('college', 'subject__branch__college__name'),
+        ('subject', 'subject__name'),
+        ('year', 'year'),
+        ('semester', 'semester'),
+        ('uploaded_by', 'uploaded_by__username'),
+        ('uploaded_at', 'uploaded_at'),
+        ('decision', 'status'),
+        ('reviewed_by', 'reviewed_by__username'),
+        ('reviewed_at', 'reviewed_at'),
+        ('review_notes', 'review_notes'),
+    ],
+}
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+# Spreadsheet apps run cells starting with these as formulas
+_FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def export_queryset(dataset, colleges):
+    """The rows of an export, limited to the given colleges"""
+    queryset = PreviousYearQuestion.objects.filter(subject__branch__college__in=colleges)
+    if dataset == 'moderation':
+        return queryset.filter(reviewed_at__isnull=False).order_by('reviewed_at', 'id')
+    return queryset.order_by('id')
+
+
+def _cell(value):
+    if isinstance(value, datetime):
+        # Excel has no time zones; exports are in UTC
+        return timezone.make_naive(value, dt_timezone.utc) if timezone.is_aware(value) else value
+    if isinstance(value, str) and value.startswith(_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def export_rows(dataset, queryset):
+    """
+    Stream the export's columns as tuples. values_list() skips building
+    model instances, and iterator() fetches EXPORT_CHUNK_SIZE rows at a time
+    (through a server-side cursor on PostgreSQL) instead of caching them all.
+    """
+    lookups = [lookup for _, lookup in EXPORTS[dataset]]
+    for row in queryset.values_list(*lookups).iterator(chunk_size=settings.EXPORT_CHUNK_SIZE):
+        yield [_cell(value) for value in row]
+
+
+def export_response(dataset, queryset, file_type):
+    """A StreamingHttpResponse with the export as a CSV or XLSX attachment"""
+    # The rows are read after the view returns; keep them on the databases chosen now.
+    # Colleges on several shards are exported one shard after the other.
+    header = [column for column, _ in EXPORTS[dataset]]
+    rows = chain.from_iterable(export_rows(dataset, part) for part in per_shard(queryset))
+    if file_type == 'xlsx':
+        chunks = xlsx_chunks(header, rows, title=dataset)
+    else:
+        chunks = csv_chunks(header, rows)
+
+    filename = f"{dataset}-{timezone.now():%Y%m%d-%H%M%S}.{file_type}"
+    response = StreamingHttpResponse(chunks, content_type=CONTENT_TYPES[file_type])
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
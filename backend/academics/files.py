@@ -0,0 +1,42 @@
+import hashlib
+
+from django.conf import settings
+
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def sha256_of(fileobj):
+    """Hash a file object in chunks and rewind it when possible"""
+    digest = hashlib.sha256()
+    if hasattr(fileobj, 'chunks'):
+        for chunk in fileobj.chunks(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    else:
+        for chunk in iter(lambda: fileobj.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    if hasattr(fileobj, 'seek'):
+        fileobj.seek(0)
+    return digest.hexdigest()
+
+
+def is_local(fieldfile):
+    """Whether a stored paper is on this machine's disk (False for object storage)"""
+    try:
+        fieldfile.path
+    except NotImplementedError:
+        return False
+    return True
+
+
+def presigned_url(fieldfile, filename, content_type, download=False):
+    """Short-lived URL that serves a remote paper straight from the bucket"""
+    disposition = 'attachment' if download else 'inline'
+    return fieldfile.storage.url(
+        fieldfile.name,
+        parameters={
+            'ResponseContentDisposition': f'{disposition}; filename="{filename}"',
+            'ResponseContentType': content_type,
+        },
+        expire=settings.PAPER_URL_EXPIRE_SECONDS,
+    )
@@ -0,0 +1,62 @@
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from django.utils import timezone
+
+from academics.archive import archive, candidates
+from academics.sharding import use_shard
+
+
+class Command(BaseCommand):
+    help = (
+        'Move rejected and long-unaccessed PYQs into compressed archive packs, '
+        'leaving a small ArchivedPYQ stub per paper to restore it from. Runs '
+        'incrementally: each pack commits on its own and --limit caps a run, '
+        'so it can run nightly from cron.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pack-size', type=int, default=settings.ARCHIVE_PACK_SIZE, help='Papers per pack')
+        parser.add_argument('--limit', type=int, help='Archive at most this many papers')
+        parser.add_argument('--rejected-days', type=int, default=settings.ARCHIVE_REJECTED_AFTER_DAYS,
+                            help='Archive rejected papers this long after review')
+        parser.add_argument('--stale-days', type=int, default=settings.ARCHIVE_STALE_AFTER_DAYS,
+                            help='Archive reviewed papers not opened for this long')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the papers due')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        if options['dry_run']:
+            counts = Counter()
+            for alias in settings.DATABASE_SHARDS:
+                with use_shard(alias):
+                    due = candidates(now, options['rejected_days'], options['stale_days'])
+                    counts.update(dict(due.order_by().values_list('archive_reason').annotate(count=Count('id'))))
+            self.stdout.write(
+                f"{counts.get('rejected', 0)} rejected and {counts.get('stale', 0)} stale papers are due"
+            )
+            return
+
+        started = time.perf_counter()
+        papers = original = packed = 0
+        for alias in settings.DATABASE_SHARDS:
+            limit = None if options['limit'] is None else options['limit'] - papers
+            if limit is not None and limit <= 0:
+                break
+            with use_shard(alias):
+                for pack in archive(
+                    max(options['pack_size'], 1), limit,
+                    options['rejected_days'], options['stale_days'], now=now,
+                ):
+                    papers += pack.paper_count
+                    original += pack.original_bytes
+                    packed += pack.packed_bytes
+                    self.stdout.write(f'{pack.name}: {pack.paper_count} papers, {pack.packed_bytes / 2 ** 20:.1f} MB')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {papers} papers ({original / 2 ** 20:.1f} MB packed into {packed / 2 ** 20:.1f} MB) '
+            f'in {time.perf_counter() - started:.2f}s'
+        ))
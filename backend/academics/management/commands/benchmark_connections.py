@@ -0,0 +1,102 @@
+import statistics
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.db import connections
+from django.test import RequestFactory
+from rest_framework.authtoken.models import Token
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare API request latency with and without persistent database '
+        'connections. Requests go through the real WSGI handler, so connections '
+        'are opened and closed exactly as they would be under gunicorn. Run it '
+        'with DATABASE_URL pointing at a local PostgreSQL.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', required=True, help='User the requests authenticate as')
+        parser.add_argument('--path', default='/api/colleges/')
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--requests', type=int, default=200, help='Requests per thread')
+        parser.add_argument('--conn-max-age', type=int, default=600,
+                            help='CONN_MAX_AGE used for the persistent run')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f'User {options["username"]} does not exist')
+        token, _ = Token.objects.get_or_create(user=user)
+
+        settings_dict = connections.settings['default']
+        vendor = connections['default'].vendor
+        if vendor != 'postgresql':
+            self.stderr.write(f'Warning: running against {vendor}; connection setup cost will be unrepresentative')
+
+        application = get_wsgi_application()
+        environ = RequestFactory().get(
+            options['path'], HTTP_AUTHORIZATION=f'Token {token.key}'
+        ).environ
+        original = settings_dict.get('CONN_MAX_AGE', 0)
+
+        try:
+            for label, conn_max_age in (('per-request', 0), ('persistent', options['conn_max_age'])):
+                # Each thread builds its own connection from this shared settings dict
+                settings_dict['CONN_MAX_AGE'] = conn_max_age
+                latencies, elapsed = self.run(application, environ, options['threads'], options['requests'])
+                self.report(label, conn_max_age, latencies, elapsed)
+        finally:
+            settings_dict['CONN_MAX_AGE'] = original
+
+    def run(self, application, environ, threads, requests):
+        latencies = []
+        errors = []
+        lock = threading.Lock()
+
+        def start_response(status, headers, exc_info=None):
+            if not status.startswith('2'):
+                errors.append(status)
+
+        def worker():
+            timings = []
+            for _ in range(requests):
+                started = time.perf_counter()
+                response = application(dict(environ), start_response)
+                for _chunk in response:
+                    pass
+                # Closing fires request_finished, which is where Django drops
+                # connections older than CONN_MAX_AGE
+                response.close()
+                timings.append(time.perf_counter() - started)
+            connections.close_all()
+            with lock:
+                latencies.extend(timings)
+
+        workers = [threading.Thread(target=worker) for _ in range(threads)]
+        started = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        if errors:
+            raise CommandError(f'{len(errors)} requests failed, e.g. {errors[0]}')
+        return latencies, elapsed
+
+    def report(self, label, conn_max_age, latencies, elapsed):
+        latencies.sort()
+
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+        self.stdout.write(
+            f'{label:12} (CONN_MAX_AGE={conn_max_age}): {len(latencies)} requests in {elapsed:.2f}s, '
+            f'{len(latencies) / elapsed:.0f} req/s, mean {statistics.mean(latencies) * 1000:.1f}ms, '
+            f'p50 {percentile(0.50):.1f}ms, p95 {percentile(0.95):.1f}ms, p99 {percentile(0.99):.1f}ms'
+        )
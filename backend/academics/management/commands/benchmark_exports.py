@@ -0,0 +1,89 @@
+import random
+import resource
+import time
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from academics.exports import EXPORTS, export_queryset, export_rows
+from academics.models import College
+from academics.spreadsheets import csv_chunks, xlsx_chunks
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def synthetic_rows(count, seed=0):
+    """Rows shaped like the pyqs export, generated on the fly"""
+    rng = random.Random(seed)
+    uploaded = datetime(2020, 1, 1)
+    for i in range(1, count + 1):
+        yield [
+            i, f'College {rng.randrange(50)}', 'CSE', f'Subject {rng.randrange(400)}', f'CS{rng.randrange(1000):03}',
+            rng.randrange(2010, 2025), rng.randrange(1, 9), 'R20', 'approved', f'student{rng.randrange(100000)}',
+            uploaded + timedelta(seconds=i * 37), rng.randrange(5000), rng.randrange(20000),
+        ]
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure export throughput and memory at scale. Rows are generated '
+        '(default) or read from the database, written as CSV and/or XLSX and '
+        'discarded; the process\'s peak RSS is sampled every 10% of the rows '
+        'to show it stays flat. --naive loads every row into a list first, as '
+        'a non-streaming export would; run it separately for comparison, since '
+        'peak RSS never goes down within a process.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000)
+        parser.add_argument('--format', choices=['csv', 'xlsx', 'both'], default='both')
+        parser.add_argument('--from-db', action='store_true',
+                            help='Export the PYQ table (all colleges) instead of generated rows; --rows is ignored')
+        parser.add_argument('--naive', action='store_true', help='Materialize the rows before writing')
+
+    def handle(self, *args, **options):
+        formats = ['csv', 'xlsx'] if options['format'] == 'both' else [options['format']]
+        if options['from_db']:
+            total = export_queryset('pyqs', College.objects.all()).count()
+            if not total:
+                raise CommandError('No PYQs to export; run generate_dataset first or drop --from-db')
+        else:
+            total = options['rows']
+
+        for file_type in formats:
+            self.run(file_type, total, options)
+
+    def rows(self, total, options):
+        if options['from_db']:
+            return export_rows('pyqs', export_queryset('pyqs', College.objects.all()))
+        return synthetic_rows(total)
+
+    def run(self, file_type, total, options):
+        header = [column for column, _ in EXPORTS['pyqs']]
+        step = max(total // 10, 1)
+        samples = []
+
+        def sampled(rows):
+            for count, row in enumerate(rows, start=1):
+                yield row
+                if count % step == 0:
+                    samples.append(peak_rss_mb())
+
+        started = time.perf_counter()
+        rows = self.rows(total, options)
+        if options['naive']:
+            rows = list(rows)
+        writer = xlsx_chunks if file_type == 'xlsx' else csv_chunks
+        size = sum(len(chunk) for chunk in writer(header, sampled(rows)))
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(
+            f'{file_type:4}{" (naive)" if options["naive"] else ""}: {total} rows, {size / 2 ** 20:.1f} MB '
+            f'in {elapsed:.1f}s ({total / elapsed:,.0f} rows/s), peak RSS {peak_rss_mb():.0f} MB'
+        )
+        self.stdout.write(
+            '  peak RSS after each 10% of rows (MB): ' + ' '.join(f'{sample:.0f}' for sample in samples)
+        )
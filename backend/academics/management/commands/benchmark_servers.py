@@ -0,0 +1,155 @@
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.authtoken.models import Token
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def _wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            _, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.2)
+    raise CommandError(f'Server on port {port} did not start')
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare how many concurrent slow PYQ downloads gunicorn (WSGI, sync '
+        'workers) and uvicorn (ASGI, async views) can hold open, and how long a '
+        'quick request waits while they are in flight. The servers run with '
+        'THROTTLE_ENABLED=0: every download authenticates as one user, so the '
+        'download rate limits would otherwise turn most of them into 429s.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', required=True, help='User the requests authenticate as')
+        parser.add_argument('--pyq', type=int, required=True, help='Id of an approved PYQ to download')
+        parser.add_argument('--connections', type=int, default=200, help='Concurrent slow downloads')
+        parser.add_argument('--read-delay', type=float, default=0.05,
+                            help='Seconds a slow client waits between 16KB reads')
+        parser.add_argument('--workers', type=int, default=2, help='Server worker processes')
+        parser.add_argument('--threads', type=int, default=4, help='gunicorn threads per worker')
+        parser.add_argument('--duration', type=float, default=10.0, help='Seconds to hold the downloads open')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f'User {options["username"]} does not exist')
+        self.token = Token.objects.get_or_create(user=user)[0].key
+
+        servers = {
+            'WSGI/gunicorn': lambda port: [
+                sys.executable, '-m', 'gunicorn', 'pyqachu_backend.wsgi:application',
+                '--bind', f'127.0.0.1:{port}', '--workers', str(options['workers']),
+                '--threads', str(options['threads']), '--log-level', 'warning',
+            ],
+            'ASGI/uvicorn': lambda port: [
+                sys.executable, '-m', 'uvicorn', 'pyqachu_backend.asgi:application',
+                '--host', '127.0.0.1', '--port', str(port), '--workers', str(options['workers']),
+                '--log-level', 'warning',
+            ],
+        }
+
+        for label, command in servers.items():
+            port = _free_port()
+            # One user from one IP; measure the servers, not the rate limits
+            env = dict(os.environ, THROTTLE_ENABLED='0')
+            process = subprocess.Popen(command(port), cwd=settings.BASE_DIR, env=env)
+            try:
+                result = asyncio.run(self.measure(port, options))
+            finally:
+                process.terminate()
+                process.wait(timeout=10)
+            self.stdout.write(
+                f"{label:14} {result['streaming']}/{options['connections']} downloads streaming, "
+                f"time to first byte p50 {result['ttfb_p50']:.0f}ms p95 {result['ttfb_p95']:.0f}ms, "
+                f"probe latency p50 {result['probe_p50']:.0f}ms max {result['probe_max']:.0f}ms, "
+                f"{result['failed']} failed"
+            )
+
+    async def request(self, port, path, read_delay=0.0, hold_until=None, first_byte=None):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        started = time.monotonic()
+        writer.write(
+            f'GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\n'
+            f'Authorization: Token {self.token}\r\nConnection: close\r\n\r\n'.encode()
+        )
+        await writer.drain()
+        try:
+            status_line = await reader.readline()
+            if not status_line.startswith(b'HTTP/1.1 2'):
+                raise ConnectionError(status_line.decode(errors='replace').strip())
+            if first_byte is not None:
+                first_byte.append(time.monotonic() - started)
+            while await reader.read(16 * 1024):
+                if hold_until is not None and time.monotonic() > hold_until:
+                    break
+                if read_delay:
+                    await asyncio.sleep(read_delay)
+        finally:
+            writer.close()
+        return time.monotonic() - started
+
+    async def measure(self, port, options):
+        await _wait_for_port(port)
+        hold_until = time.monotonic() + options['duration']
+        first_bytes = []
+
+        downloads = [
+            asyncio.create_task(self.request(
+                port, f"/api/pyqs/{options['pyq']}/download/",
+                read_delay=options['read_delay'],
+                hold_until=hold_until, first_byte=first_bytes,
+            ))
+            for _ in range(options['connections'])
+        ]
+
+        # Probe a cheap endpoint while the downloads hold their connections
+        await asyncio.sleep(min(2.0, options['duration'] / 2))
+        streaming = len(first_bytes)
+        probes = []
+        while time.monotonic() < hold_until:
+            try:
+                probes.append(await asyncio.wait_for(
+                    self.request(port, f"/api/pyqs/{options['pyq']}/bookmark-status/"),
+                    timeout=max(0.1, hold_until - time.monotonic()),
+                ))
+            except (asyncio.TimeoutError, ConnectionError, OSError):
+                probes.append(options['duration'])
+                break
+
+        results = await asyncio.gather(*downloads, return_exceptions=True)
+        failed = sum(1 for result in results if isinstance(result, Exception))
+
+        def percentile(values, p):
+            if not values:
+                return float('nan')
+            values = sorted(values)
+            return values[min(len(values) - 1, int(len(values) * p))] * 1000
+
+        return {
+            'streaming': streaming,
+            'failed': failed,
+            'ttfb_p50': percentile(first_bytes, 0.50),
+            'ttfb_p95': percentile(first_bytes, 0.95),
+            'probe_p50': percentile(probes, 0.50),
+            'probe_max': max(probes, default=float('nan')) * 1000,
+        }
@@ -0,0 +1,42 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from academics.recommendations import build_related
+from academics.sharding import use_shard
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild the "related papers" table from co-bookmarks and co-downloads. '
+        'By default only papers with new activity since the last run (and the '
+        'papers sharing users with them) are recomputed; run it from cron.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Recompute every paper')
+        parser.add_argument('--top-k', type=int, default=settings.RELATED_PYQS_TOP_K,
+                            help='Neighbours kept per paper')
+        parser.add_argument('--min-common', type=int, default=settings.RELATED_PYQS_MIN_COMMON,
+                            help='Users two papers must share to be related')
+        parser.add_argument('--max-user-items', type=int, default=settings.RELATED_PYQS_MAX_USER_ITEMS,
+                            help='Ignore users who interacted with more papers than this')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        papers = rows = 0
+        # Related papers are found within a shard, where the bookmarks and downloads live
+        for alias in settings.DATABASE_SHARDS:
+            with use_shard(alias):
+                shard_papers, shard_rows = build_related(
+                    options['top_k'],
+                    min_common=options['min_common'],
+                    max_user_items=options['max_user_items'],
+                    full=options['full'],
+                )
+            papers += shard_papers
+            rows += shard_rows
+        self.stdout.write(self.style.SUCCESS(
+            f'Refreshed {papers} papers ({rows} neighbours) in {time.perf_counter() - started:.2f}s'
+        ))
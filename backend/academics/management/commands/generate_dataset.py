@@ -0,0 +1,194 @@
+import hashlib
+import random
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from academics.models import College, Branch, Subject, PreviousYearQuestion, Bookmark
+from accounts.roster import create_roster_users
+
+
+STATUS_WEIGHTS = {'approved': 80, 'pending': 15, 'rejected': 5}
+REGULATIONS = ['2015', '2019', '2024']
+
+
+def dummy_pdf(title, size, rng):
+    """A valid one-page PDF showing title, padded to roughly size bytes"""
+    padding = max(0, size - 600) // 65
+    lines = [f'BT /F1 18 Tf 72 770 Td ({title}) Tj ET']
+    # Random comment lines keep every generated paper distinct
+    lines += ['%' + rng.getrandbits(256).to_bytes(32, 'big').hex() for _ in range(padding)]
+    content = '\n'.join(lines).encode()
+
+    objects = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        b'<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+        b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents 4 0 R '
+        b'/Resources << /Font << /F1 5 0 R >> >> >>',
+        b'<< /Length %d >>\nstream\n%s\nendstream' % (len(content), content),
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>',
+    ]
+    pdf = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += b'%d 0 obj\n%s\nendobj\n' % (number, body)
+    xref = len(pdf)
+    pdf += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    pdf += b''.join(b'%010d 00000 n \n' % offset for offset in offsets)
+    pdf += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref)
+    return bytes(pdf)
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate a synthetic dataset at production scale: colleges with '
+        'branches and subjects, users with roles, PYQs backed by dummy PDFs and '
+        'bookmarks, all inserted in bulk. Every generated user has the same '
+        'password, so load_test can log in as them.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--colleges', type=int, default=5)
+        parser.add_argument('--branches', type=int, default=4, help='Branches per college')
+        parser.add_argument('--subjects', type=int, default=6, help='Subjects per branch')
+        parser.add_argument('--pyqs', type=int, default=10, help='PYQs per subject')
+        parser.add_argument('--students', type=int, default=200, help='Students per college')
+        parser.add_argument('--moderators', type=int, default=3, help='Moderators per college')
+        parser.add_argument('--admins', type=int, default=1, help='Admins per college')
+        parser.add_argument('--bookmarks', type=int, default=5, help='Bookmarks per student')
+        parser.add_argument('--files', type=int, default=50,
+                            help='Distinct dummy PDFs; PYQs share them round-robin')
+        parser.add_argument('--pdf-kb', type=int, default=64, help='Approximate size of each dummy PDF')
+        parser.add_argument('--prefix', default='synthetic', help='Prefix for generated usernames and colleges')
+        parser.add_argument('--password', default='synthetic-pass-123')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=f'{prefix}-').exists():
+            raise CommandError(f'Users with prefix "{prefix}" already exist; pick another --prefix')
+        if not options['students'] + options['moderators'] + options['admins']:
+            raise CommandError('Each college needs at least one user to upload its PYQs')
+
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        started = time.perf_counter()
+
+        papers = self.write_papers(options['files'], options['pdf_kb'] * 1024)
+        self.stdout.write(f'Wrote {len(papers)} dummy PDFs in {time.perf_counter() - started:.1f}s')
+
+        # Hashing is deliberately slow; every generated user shares one hash
+        password_hash = make_password(options['password'])
+
+        totals = {'users': 0, 'pyqs': 0, 'bookmarks': 0}
+        for index in range(1, options['colleges'] + 1):
+            with transaction.atomic():
+                counts = self.generate_college(index, options, papers, password_hash)
+            for key, value in counts.items():
+                totals[key] += value
+            self.stdout.write(
+                f'College {index}/{options["colleges"]}: {counts["users"]} users, '
+                f'{counts["pyqs"]} PYQs, {counts["bookmarks"]} bookmarks '
+                f'({time.perf_counter() - started:.1f}s)'
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {options["colleges"]} colleges, {totals["users"]} users, '
+            f'{totals["pyqs"]} PYQs and {totals["bookmarks"]} bookmarks '
+            f'in {time.perf_counter() - started:.1f}s'
+        ))
+
+    def write_papers(self, count, size):
+        """Store the dummy PDFs under content-addressed names; return (name, hash) pairs"""
+        papers = []
+        for number in range(1, count + 1):
+            data = dummy_pdf(f'Synthetic question paper {number}', size, self.rng)
+            file_hash = hashlib.sha256(data).hexdigest()
+            name = f'{file_hash}.pdf'
+            if not default_storage.exists(name):
+                name = default_storage.save(name, ContentFile(data))
+            papers.append((name, file_hash))
+        return papers
+
+    def generate_college(self, index, options, papers, password_hash):
+        prefix = options['prefix']
+        college = College.objects.create(name=f'{prefix} college {index}', location=f'City {index}')
+
+        entries = []
+        for role, count in (('admin', options['admins']), ('moderator', options['moderators']),
+                            ('student', options['students'])):
+            for number in range(1, count + 1):
+                username = f'{prefix}-{index}-{role}-{number}'
+                entries.append({
+                    'username': username,
+                    'email': f'{username}@example.com',
+                    'first_name': role.title(),
+                    'last_name': str(number),
+                    'password_hash': password_hash,
+                    'role': role,
+                    'college': college,
+                })
+        create_roster_users(entries, batch_size=self.batch_size)
+        users = dict(User.objects.filter(
+            username__in=[entry['username'] for entry in entries]
+        ).values_list('username', 'id'))
+        admins = [users[e['username']] for e in entries if e['role'] == 'admin']
+        moderators = [users[e['username']] for e in entries if e['role'] == 'moderator'] or admins
+        students = [users[e['username']] for e in entries if e['role'] == 'student'] or moderators
+
+        creator = admins[0] if admins else None
+        Branch.objects.bulk_create([
+            Branch(college=college, name=f'Branch {number}', code=f'B{number}', created_by_id=creator)
+            for number in range(1, options['branches'] + 1)
+        ])
+        branches = list(Branch.objects.filter(college=college))
+        Subject.objects.bulk_create([
+            Subject(branch=branch, name=f'{branch.code} Subject {number}',
+                    code=f'{branch.code}S{number}', created_by_id=creator)
+            for branch in branches
+            for number in range(1, options['subjects'] + 1)
+        ])
+        subjects = list(Subject.objects.filter(branch__college=college))
+
+        now = timezone.now()
+        statuses = list(STATUS_WEIGHTS)
+        weights = list(STATUS_WEIGHTS.values())
+        pyqs = []
+        for subject in subjects:
+            for _ in range(options['pyqs']):
+                status = self.rng.choices(statuses, weights)[0]
+                name, file_hash = papers[len(pyqs) % len(papers)] if papers else ('', '')
+                reviewed = status != 'pending' and bool(moderators)
+                pyqs.append(PreviousYearQuestion(
+                    subject=subject,
+                    year=self.rng.randint(2015, 2024),
+                    semester=self.rng.randint(1, 8),
+                    regulation=self.rng.choice(REGULATIONS),
+                    paper_file=name,
+                    file_hash=file_hash,
+                    uploaded_by_id=self.rng.choice(students),
+                    status=status,
+                    reviewed_by_id=self.rng.choice(moderators) if reviewed else None,
+                    reviewed_at=now if reviewed else None,
+                ))
+        PreviousYearQuestion.objects.bulk_create(pyqs, batch_size=self.batch_size)
+
+        approved = list(PreviousYearQuestion.objects.filter(
+            subject__branch__college=college, status='approved'
+        ).values_list('id', flat=True))
+        bookmarks = []
+        per_student = min(options['bookmarks'], len(approved))
+        for student in students:
+            for pyq_id in self.rng.sample(approved, per_student):
+                bookmarks.append(Bookmark(user_id=student, pyq_id=pyq_id))
+        Bookmark.objects.bulk_create(bookmarks, batch_size=self.batch_size)
+
+        return {'users': len(entries), 'pyqs': len(pyqs), 'bookmarks': len(bookmarks)}
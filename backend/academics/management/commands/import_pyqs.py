@@ -0,0 +1,200 @@
+import os
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.contrib.auth.models import User
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import router, transaction
+from django.utils import timezone
+
+from academics.files import sha256_of
+from academics.models import College, Subject, PreviousYearQuestion
+from academics.sharding import use_shard
+from academics.spreadsheets import iter_rows
+
+
+class PaperSource:
+    """Opens papers by relative name from either a directory or a zip archive"""
+
+    def __init__(self, path):
+        self.path = path
+        self.is_zip = zipfile.is_zipfile(path)
+        if not self.is_zip and not os.path.isdir(path):
+            raise CommandError(f'{path} is neither a directory nor a zip archive')
+        if self.is_zip:
+            with zipfile.ZipFile(path) as archive:
+                self.names = set(archive.namelist())
+
+    def exists(self, name):
+        if self.is_zip:
+            return name in self.names
+        return os.path.isfile(os.path.join(self.path, name))
+
+    @contextmanager
+    def open(self, name):
+        if self.is_zip:
+            # ZipFile handles are not thread-safe, so each worker opens its own
+            with zipfile.ZipFile(self.path) as archive, archive.open(name) as member:
+                yield member
+        else:
+            with open(os.path.join(self.path, name), 'rb') as paper:
+                yield paper
+
+
+class Command(BaseCommand):
+    help = (
+        'Import a back catalog of PYQ PDFs from a directory or zip archive. '
+        'The metadata sheet (CSV/XLSX) needs columns: file, branch (code), '
+        'subject (code), year, semester and optionally regulation. Files this '
+        'uploader already imported into the college (matched by SHA-256) are '
+        'skipped, so the command can be re-run after an interruption.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', help='Directory or .zip containing the PDFs')
+        parser.add_argument('metadata', help='CSV/XLSX metadata sheet')
+        parser.add_argument('--college', type=int, required=True, help='College id the papers belong to')
+        parser.add_argument('--uploaded-by', required=True, help='Username recorded as the uploader')
+        parser.add_argument('--approve', action='store_true', help='Import papers as already approved')
+        parser.add_argument('--workers', type=int, default=8, help='Parallel hash/copy threads')
+        parser.add_argument('--batch-size', type=int, default=200)
+
+    def handle(self, *args, **options):
+        try:
+            college = College.objects.get(id=options['college'])
+        except College.DoesNotExist:
+            raise CommandError(f'College {options["college"]} does not exist')
+        try:
+            uploader = User.objects.get(username=options['uploaded_by'])
+        except User.DoesNotExist:
+            raise CommandError(f'User {options["uploaded_by"]} does not exist')
+
+        source = PaperSource(options['source'])
+        with open(options['metadata'], 'rb') as metadata:
+            try:
+                rows = list(iter_rows(metadata, options['metadata']))
+            except ValueError as e:
+                raise CommandError(str(e))
+
+        # The papers go on the college's shard
+        with use_shard(college.shard):
+            entries = self.resolve_rows(rows, college, source)
+
+            started = time.perf_counter()
+            imported = skipped = 0
+            with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+                for start in range(0, len(entries), options['batch_size']):
+                    batch = entries[start:start + options['batch_size']]
+                    created, duplicates = self.import_batch(
+                        batch, source, pool, college, uploader, options['approve']
+                    )
+                    imported += created
+                    skipped += duplicates
+                    elapsed = time.perf_counter() - started
+                    self.stdout.write(
+                        f'{start + len(batch)}/{len(entries)} processed, {imported} imported, '
+                        f'{skipped} already present ({(start + len(batch)) / elapsed:.1f} files/s)'
+                    )
+
+        elapsed = time.perf_counter() - started
+        rate = len(entries) / elapsed if elapsed > 0 else 0.0
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {imported} PYQs, skipped {skipped} already imported, '
+            f'{len(rows) - len(entries)} invalid rows in {elapsed:.2f}s ({rate:.1f} files/s)'
+        ))
+
+    def resolve_rows(self, rows, college, source):
+        """Validate rows and resolve every (branch code, subject code) in one query"""
+        keys = {(row.get('branch', ''), row.get('subject', '')) for row in rows}
+        subjects = {
+            (subject.branch.code, subject.code): subject
+            for subject in Subject.objects.select_related('branch').filter(
+                branch__college=college,
+                branch__code__in={branch for branch, _ in keys},
+                code__in={code for _, code in keys},
+            )
+        }
+
+        entries = []
+        for line, row in enumerate(rows, start=2):
+            subject = subjects.get((row.get('branch', ''), row.get('subject', '')))
+            name = row.get('file', '')
+            if subject is None:
+                self.stderr.write(f'Line {line}: unknown subject {row.get("branch")}/{row.get("subject")}')
+                continue
+            if not name or not source.exists(name):
+                self.stderr.write(f'Line {line}: file "{name}" not found')
+                continue
+            try:
+                year = int(row['year'])
+                semester = int(row['semester'])
+            except (KeyError, ValueError):
+                self.stderr.write(f'Line {line}: year and semester must be numbers')
+                continue
+            entries.append({
+                'file': name,
+                'subject': subject,
+                'year': year,
+                'semester': semester,
+                'regulation': row.get('regulation') or None,
+            })
+        return entries
+
+    def hash_file(self, source, name):
+        with source.open(name) as paper:
+            return sha256_of(paper)
+
+    def copy_file(self, source, entry):
+        _, ext = os.path.splitext(entry['file'])
+        # Content-addressed names make re-running after an interruption idempotent
+        stored_name = f"{entry['file_hash']}{ext.lower()}"
+        if not default_storage.exists(stored_name):
+            with source.open(entry['file']) as paper:
+                stored_name = default_storage.save(stored_name, File(paper))
+        entry['stored_name'] = stored_name
+
+    def import_batch(self, batch, source, pool, college, uploader, approve):
+        hashes = pool.map(lambda entry: self.hash_file(source, entry['file']), batch)
+        for entry, file_hash in zip(batch, hashes):
+            entry['file_hash'] = file_hash
+
+        # Only this import's own earlier rows count: the same file uploaded by a
+        # student, or belonging to another college, doesn't give this college the paper
+        existing = set(PreviousYearQuestion.objects.filter(
+            subject__branch__college=college,
+            uploaded_by=uploader,
+            file_hash__in=[entry['file_hash'] for entry in batch],
+        ).values_list('file_hash', flat=True))
+
+        pending = []
+        for entry in batch:
+            if entry['file_hash'] in existing:
+                continue
+            existing.add(entry['file_hash'])
+            pending.append(entry)
+
+        list(pool.map(lambda entry: self.copy_file(source, entry), pending))
+
+        reviewed_at = timezone.now() if approve else None
+        with transaction.atomic(using=router.db_for_write(PreviousYearQuestion)):
+            PreviousYearQuestion.objects.bulk_create([
+                PreviousYearQuestion(
+                    subject=entry['subject'],
+                    year=entry['year'],
+                    semester=entry['semester'],
+                    regulation=entry['regulation'],
+                    paper_file=entry['stored_name'],
+                    file_hash=entry['file_hash'],
+                    uploaded_by=uploader,
+                    status='approved' if approve else 'pending',
+                    reviewed_by=uploader if approve else None,
+                    reviewed_at=reviewed_at,
+                )
+                for entry in pending
+            ])
+
+        return len(pending), len(batch) - len(pending)
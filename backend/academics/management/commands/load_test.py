@@ -0,0 +1,246 @@
+import random
+import statistics
+import threading
+import time
+from collections import defaultdict
+
+import requests
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+
+DEFAULT_MIX = 'browse=30,list=35,download=20,bookmark=15'
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in VirtualUser.SCENARIOS:
+            raise CommandError(f'Unknown scenario "{name}"; choose from {", ".join(VirtualUser.SCENARIOS)}')
+        try:
+            mix[name] = float(weight)
+        except ValueError:
+            raise CommandError(f'Scenario weight "{weight}" is not a number')
+    return mix
+
+
+def percentile(latencies, p):
+    """Nearest-rank percentile of a sorted list"""
+    return latencies[min(len(latencies) - 1, int(len(latencies) * p))]
+
+
+class Recorder:
+    """Per-endpoint latencies and errors, shared by all virtual users"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def add(self, endpoint, seconds, ok):
+        with self.lock:
+            self.latencies[endpoint].append(seconds)
+            if not ok:
+                self.errors[endpoint] += 1
+
+
+class VirtualUser:
+    """
+    One simulated client. It logs in, then repeatedly picks a scenario by
+    weight, discovering ids the way the app does, by walking the API.
+    """
+
+    SCENARIOS = {
+        'browse': 'browse',
+        'list': 'list_pyqs',
+        'download': 'download',
+        'bookmark': 'bookmark',
+        'moderate': 'moderate',
+    }
+
+    def __init__(self, base_url, username, password, recorder, rng, is_moderator):
+        self.base_url = base_url.rstrip('/')
+        self.username = username
+        self.password = password
+        self.recorder = recorder
+        self.rng = rng
+        self.is_moderator = is_moderator
+        self.session = requests.Session()
+        self.colleges = []
+        self.branches = []
+        self.subjects = []
+        self.pyqs = []
+
+    def request(self, endpoint, method, path, **kwargs):
+        started = time.perf_counter()
+        try:
+            # Downloads follow presigned redirects and read the whole body
+            response = self.session.request(method, self.base_url + path, timeout=60, **kwargs)
+            ok = response.status_code < 400
+        except requests.RequestException:
+            response, ok = None, False
+        self.recorder.add(endpoint, time.perf_counter() - started, ok)
+        return response if ok else None
+
+    def json(self, endpoint, method, path, **kwargs):
+        response = self.request(endpoint, method, path, **kwargs)
+        return response.json() if response is not None else None
+
+    def login(self):
+        data = self.json('login', 'POST', '/api/accounts/login/', json={
+            'username': self.username, 'password': self.password,
+        })
+        if data is None:
+            return False
+        self.session.headers['Authorization'] = f"Token {data['token']}"
+        return True
+
+    def run_once(self, mix):
+        if self.is_moderator:
+            # Moderators mostly work the queue
+            scenario = self.rng.choice(['moderate', 'moderate', 'list'])
+        else:
+            scenarios = [name for name in mix if name != 'moderate'] or list(mix)
+            scenario = self.rng.choices(scenarios, [mix[name] for name in scenarios])[0]
+        getattr(self, self.SCENARIOS[scenario])()
+
+    def browse(self):
+        self.colleges = self.json('colleges', 'GET', '/api/colleges/') or self.colleges
+        if self.colleges:
+            college = self.rng.choice(self.colleges)
+            self.branches = self.json('branches', 'GET', f"/api/branches/?college_id={college['id']}") or []
+        if self.branches:
+            branch = self.rng.choice(self.branches)
+            self.subjects = self.json('subjects', 'GET', f"/api/subjects/?branch_id={branch['id']}") or []
+
+    def list_pyqs(self):
+        if not self.subjects:
+            self.browse()
+        path = '/api/pyqs/'
+        if self.subjects:
+            path += f"?subject_id={self.rng.choice(self.subjects)['id']}"
+        self.pyqs = self.json('pyq-list', 'GET', path) or self.pyqs
+
+    def download(self):
+        if not self.pyqs:
+            self.list_pyqs()
+        if self.pyqs:
+            pyq = self.rng.choice(self.pyqs)
+            self.request('download', 'GET', f"/api/pyqs/{pyq['id']}/download/")
+
+    def bookmark(self):
+        if not self.pyqs:
+            self.list_pyqs()
+        if not self.pyqs:
+            return
+        pyq_id = self.rng.choice(self.pyqs)['id']
+        status = self.json('bookmark-status', 'GET', f'/api/pyqs/{pyq_id}/bookmark-status/')
+        if status is not None:
+            method = 'DELETE' if status['is_bookmarked'] else 'POST'
+            self.request('bookmark-toggle', method, f'/api/pyqs/{pyq_id}/bookmark/')
+
+    def moderate(self):
+        pending = self.json('pending', 'GET', '/api/pyqs/pending/')
+        if pending:
+            pyq = self.rng.choice(pending)
+            action = 'approve' if self.rng.random() < 0.8 else 'reject'
+            self.request('moderate', 'POST', f"/api/pyqs/{pyq['id']}/moderate-action/",
+                         json={'action': action, 'notes': 'load test'})
+
+
+class Command(BaseCommand):
+    help = (
+        'Drive a running server with simulated users logging in, browsing the '
+        'catalog, listing and downloading PYQs, toggling bookmarks and '
+        'moderating, then report throughput and p50/p95/p99 latency per '
+        'endpoint. Log in as users made by generate_dataset (same --prefix and '
+        '--password). Moderation approves or rejects real pending PYQs, so run '
+        'it against a disposable dataset.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='Base URL of the server under test')
+        parser.add_argument('--prefix', default='synthetic', help='Username prefix used by generate_dataset')
+        parser.add_argument('--password', default='synthetic-pass-123')
+        parser.add_argument('--users', type=int, default=20, help='Concurrent simulated users')
+        parser.add_argument('--moderators', type=int, default=2,
+                            help='How many of the simulated users are moderators')
+        parser.add_argument('--duration', type=float, default=60.0, help='Seconds to run')
+        parser.add_argument('--think-time', type=float, default=0.0,
+                            help='Mean seconds a user pauses between actions')
+        parser.add_argument('--mix', default=DEFAULT_MIX, help='Scenario weights for students; moderators work the pending queue')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        mix = parse_mix(options['mix'])
+        rng = random.Random(options['seed'])
+        moderators = min(options['moderators'], options['users'])
+        students = options['users'] - moderators
+
+        accounts = [
+            (username, False) for username in self.pick_users(options['prefix'], 'student', students, rng)
+        ] + [
+            (username, True) for username in self.pick_users(options['prefix'], 'moderator', moderators, rng)
+        ]
+
+        recorder = Recorder()
+        deadline = time.monotonic() + options['duration']
+
+        def worker(username, is_moderator, seed):
+            user = VirtualUser(options['url'], username, options['password'], recorder,
+                               random.Random(seed), is_moderator)
+            if not user.login():
+                return
+            while time.monotonic() < deadline:
+                user.run_once(mix)
+                if options['think_time']:
+                    time.sleep(user.rng.expovariate(1 / options['think_time']))
+
+        threads = [
+            threading.Thread(target=worker, args=(username, is_moderator, rng.random()))
+            for username, is_moderator in accounts
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        self.report(recorder, elapsed)
+
+    def pick_users(self, prefix, role, count, rng):
+        if not count:
+            return []
+        usernames = list(User.objects.filter(
+            username__startswith=f'{prefix}-', roles__role=role, is_active=True
+        ).values_list('username', flat=True).distinct())
+        if not usernames:
+            raise CommandError(f'No {role}s with prefix "{prefix}"; run generate_dataset first')
+        # Reuse accounts when asked for more users than exist
+        return [usernames[i % len(usernames)] for i in rng.sample(range(max(count, len(usernames))), count)]
+
+    def report(self, recorder, elapsed):
+        self.stdout.write(
+            f'{"endpoint":16} {"requests":>9} {"errors":>7} {"req/s":>8} '
+            f'{"mean":>8} {"p50":>8} {"p95":>8} {"p99":>8}'
+        )
+        total = errors = 0
+        for endpoint in sorted(recorder.latencies):
+            latencies = sorted(recorder.latencies[endpoint])
+            total += len(latencies)
+            errors += recorder.errors[endpoint]
+            self.stdout.write(
+                f'{endpoint:16} {len(latencies):9d} {recorder.errors[endpoint]:7d} '
+                f'{len(latencies) / elapsed:8.1f} '
+                f'{statistics.mean(latencies) * 1000:6.1f}ms '
+                f'{percentile(latencies, 0.50) * 1000:6.1f}ms '
+                f'{percentile(latencies, 0.95) * 1000:6.1f}ms '
+                f'{percentile(latencies, 0.99) * 1000:6.1f}ms'
+            )
+        if not total:
+            raise CommandError('No requests completed; is the server running and are the users valid?')
+        summary = f'{total} requests in {elapsed:.1f}s ({total / elapsed:.1f} req/s), {errors} errors'
+        self.stdout.write(self.style.SUCCESS(summary) if not errors else self.style.WARNING(summary))
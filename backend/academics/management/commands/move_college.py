@@ -0,0 +1,45 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from academics.models import College
+from academics.sharding import college_rows, move_college
+
+
+class Command(BaseCommand):
+    help = (
+        'Move a college\'s branches, subjects, papers and their history to '
+        'another database shard (see DATABASE_SHARD_URLS). The college is '
+        'inactive, so hidden from its users, while it moves; an interrupted '
+        'move can simply be re-run.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('college_id', type=int)
+        parser.add_argument('shard', help='Alias of the target shard, e.g. shard1')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per INSERT and DELETE')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the rows that would move')
+
+    def handle(self, *args, **options):
+        try:
+            college = College.objects.get(id=options['college_id'])
+        except College.DoesNotExist:
+            raise CommandError(f'College {options["college_id"]} does not exist')
+        target = options['shard']
+        if target not in settings.DATABASE_SHARDS:
+            raise CommandError(f'{target} is not one of the shards: {", ".join(settings.DATABASE_SHARDS)}')
+        if target == college.shard:
+            raise CommandError(f'{college} is already on {target}')
+
+        if options['dry_run']:
+            for queryset in college_rows(college, college.shard):
+                self.stdout.write(f'{queryset.count()} {queryset.model._meta.verbose_name_plural}')
+            return
+
+        started = time.perf_counter()
+        counts = move_college(college, target, max(options['batch_size'], 1), log=self.stdout.write)
+        self.stdout.write(self.style.SUCCESS(
+            f'Moved {college} from {college.shard} to {target}: {sum(counts.values())} rows '
+            f'in {time.perf_counter() - started:.1f}s'
+        ))
@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from academics.archive import RestoreError, restore
+from academics.models import ArchivedPYQ
+
+
+class Command(BaseCommand):
+    help = 'Restore archived PYQs, by their original ids, from cold storage'
+
+    def add_arguments(self, parser):
+        parser.add_argument('pyq_ids', nargs='+', type=int)
+
+    def handle(self, *args, **options):
+        stubs = {
+            stub.pyq_id: stub
+            for alias in settings.DATABASE_SHARDS
+            for stub in ArchivedPYQ.objects.using(alias).filter(pyq_id__in=options['pyq_ids'])
+        }
+        failed = 0
+        for pyq_id in options['pyq_ids']:
+            stub = stubs.get(pyq_id)
+            if stub is None:
+                self.stderr.write(f'PYQ {pyq_id} is not archived')
+                failed += 1
+                continue
+            try:
+                pyq = restore(stub)
+            except RestoreError as e:
+                self.stderr.write(str(e))
+                failed += 1
+                continue
+            self.stdout.write(f'Restored PYQ {pyq.id} ({pyq.paper_file.name})')
+        if failed:
+            raise CommandError(f'{failed} PYQs were not restored')
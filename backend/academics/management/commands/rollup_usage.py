@@ -0,0 +1,58 @@
+import time
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from academics.events import prune_events, retention_cutoff, rollup_day
+from academics.models import UsageEvent
+from academics.sharding import use_shard
+
+
+class Command(BaseCommand):
+    help = (
+        'Aggregate usage events into daily per-college/per-subject counts '
+        '(DailyUsage) and delete raw events older than the retention period. '
+        'Run it daily from cron; re-rolling a day replaces its aggregates.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=2,
+                            help='Roll up this many days ending today (default: yesterday and today)')
+        parser.add_argument('--since', help='Roll up every day from this date (YYYY-MM-DD) instead')
+        parser.add_argument('--retention-days', type=int, default=settings.USAGE_EVENT_RETENTION_DAYS,
+                            help='Keep raw events for this many days')
+        parser.add_argument('--no-prune', action='store_true', help='Skip deleting old raw events')
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        if options['since']:
+            try:
+                first = date.fromisoformat(options['since'])
+            except ValueError:
+                raise CommandError('--since must be a date like 2025-01-31')
+        else:
+            first = today - timedelta(days=max(options['days'], 1) - 1)
+
+        started = time.perf_counter()
+        kept = 0
+        # Each shard holds the events of its colleges
+        for alias in settings.DATABASE_SHARDS:
+            with use_shard(alias):
+                day = first
+                while day <= today:
+                    rows = rollup_day(day)
+                    self.stdout.write(f'{alias} {day}: {rows} aggregate rows')
+                    day += timedelta(days=1)
+
+                if not options['no_prune']:
+                    cutoff = retention_cutoff(options['retention_days'])
+                    deleted = prune_events(cutoff)
+                    self.stdout.write(f'{alias}: deleted {deleted} events from before {cutoff}')
+                kept += UsageEvent.objects.count()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Rolled up {(today - first).days + 1} days in {time.perf_counter() - started:.2f}s; '
+            f'{kept} raw events kept'
+        ))
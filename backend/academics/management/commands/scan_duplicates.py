@@ -0,0 +1,49 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from academics.duplicates import scan
+from academics.models import PreviousYearQuestion
+from academics.sharding import use_shard
+
+
+class Command(BaseCommand):
+    help = (
+        'Fingerprint papers for near-duplicate detection and flag likely '
+        'duplicates of earlier papers. By default only papers without a '
+        'fingerprint are scanned (backfill, or uploads whose background scan failed).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Rescan every paper')
+        parser.add_argument('--status', choices=['pending', 'approved', 'rejected'],
+                            help='Only scan papers with this status')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        scanned = flagged = failed = 0
+        # Papers are compared with the others on their shard
+        for alias in settings.DATABASE_SHARDS:
+            with use_shard(alias):
+                pyqs = PreviousYearQuestion.objects.order_by('pk')
+                if not options['all']:
+                    pyqs = pyqs.filter(fingerprint__isnull=True)
+                if options['status']:
+                    pyqs = pyqs.filter(status=options['status'])
+
+                # Oldest first, so each paper is compared against everything before it
+                for pyq in pyqs.iterator(chunk_size=200):
+                    try:
+                        duplicates = scan(pyq)
+                    except Exception as e:
+                        failed += 1
+                        self.stderr.write(f'PYQ {pyq.pk}: {e}')
+                        continue
+                    scanned += 1
+                    flagged += bool(duplicates)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Scanned {scanned} papers in {time.perf_counter() - started:.1f}s: '
+            f'{flagged} likely duplicates, {failed} failed'
+        ))
@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from academics.sharding import sync_directory
+
+
+class Command(BaseCommand):
+    help = (
+        'Copy every user, college and role from default to the other shards. '
+        'Saves are mirrored as they happen; run this after adding a shard, or '
+        'after changing the directory with raw SQL or queryset updates.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('shards', nargs='*', help='Shard aliases (default: all but default)')
+
+    def handle(self, *args, **options):
+        shards = options['shards'] or [alias for alias in settings.DATABASE_SHARDS if alias != 'default']
+        for alias in shards:
+            if alias == 'default' or alias not in settings.DATABASE_SHARDS:
+                raise CommandError(f'{alias} is not a shard to sync')
+        for label, count in sync_directory(shards).items():
+            self.stdout.write(f'{label}: {count} rows')
+        self.stdout.write(self.style.SUCCESS(f'Synced the directory to {", ".join(shards) or "no shards"}'))
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-19 06:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('academics', '0006_bookmark'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='previousyearquestion',
+            name='file_hash',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=64),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.6 on 2026-10-19 06:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('academics', '0007_previousyearquestion_file_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='previousyearquestion',
+            name='download_count',
+            field=models.PositiveIntegerField(db_index=True, default=0),
+        ),
+        migrations.AddField(
+            model_name='previousyearquestion',
+            name='view_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
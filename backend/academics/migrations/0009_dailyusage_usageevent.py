@@ -0,0 +1,49 @@
+# Generated by Django 5.1.6 on 2026-10-19 06:54
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('academics', '0008_previousyearquestion_download_count_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('kind', models.CharField(choices=[('download', 'Download'), ('view', 'View'), ('search', 'Search'), ('bookmark', 'Bookmark'), ('unbookmark', 'Remove bookmark'), ('upload', 'Upload')], max_length=20)),
+                ('events', models.PositiveIntegerField()),
+                ('users', models.PositiveIntegerField(help_text='Distinct users')),
+                ('college', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='academics.college')),
+                ('subject', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='academics.subject')),
+            ],
+            options={
+                'ordering': ['-day', 'kind'],
+                'indexes': [models.Index(fields=['day'], name='academics_d_day_e5d0bb_idx'), models.Index(fields=['college', 'day'], name='academics_d_college_3f3cec_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='UsageEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('download', 'Download'), ('view', 'View'), ('search', 'Search'), ('bookmark', 'Bookmark'), ('unbookmark', 'Remove bookmark'), ('upload', 'Upload')], max_length=20)),
+                ('day', models.DateField()),
+                ('occurred_at', models.DateTimeField()),
+                ('query', models.CharField(blank=True, default='', max_length=200)),
+                ('college', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='academics.college')),
+                ('pyq', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='academics.previousyearquestion')),
+                ('subject', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='academics.subject')),
+                ('user', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day', 'kind'], name='academics_u_day_6e4143_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.6 on 2026-10-19 06:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('academics', '0009_dailyusage_usageevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelatedPYQ',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+                ('computed_at', models.DateTimeField()),
+                ('pyq', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='related_pyqs', to='academics.previousyearquestion')),
+                ('related', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='academics.previousyearquestion')),
+            ],
+            options={
+                'ordering': ['pyq', 'rank'],
+                'constraints': [models.UniqueConstraint(fields=('pyq', 'rank'), name='unique_related_pyq_rank')],
+            },
+        ),
+    ]
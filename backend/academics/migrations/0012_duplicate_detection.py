@@ -0,0 +1,46 @@
+# Generated by Django 5.1.6 on 2026-10-19 07:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('academics', '0011_pyq_moderation_claim'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaperFingerprint',
+            fields=[
+                ('pyq', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='fingerprint', serialize=False, to='academics.previousyearquestion')),
+                ('page_hashes', models.JSONField(default=list, help_text='64-bit difference hash per page image')),
+                ('minhash', models.JSONField(default=list, help_text='MinHash signature of word shingles; empty without text')),
+                ('computed_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SimilarityBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(db_index=True, max_length=80)),
+                ('pyq', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='academics.previousyearquestion')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DuplicateCandidate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('method', models.CharField(choices=[('exact', 'Identical file'), ('text', 'Similar text'), ('image', 'Similar page images')], max_length=10)),
+                ('similarity', models.FloatField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('duplicate_of', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='academics.previousyearquestion')),
+                ('pyq', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='duplicate_candidates', to='academics.previousyearquestion')),
+            ],
+            options={
+                'ordering': ['-similarity'],
+                'unique_together': {('pyq', 'duplicate_of')},
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.1.6 on 2026-10-19 07:33
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('academics', '0012_duplicate_detection'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ModerationEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action', models.CharField(choices=[('approve', 'Approved'), ('reject', 'Rejected'), ('reset', 'Reset to pending'), ('edit', 'Edited details')], max_length=10)),
+                ('from_status', models.CharField(choices=[('pending', 'Pending Review'), ('approved', 'Approved'), ('rejected', 'Rejected')], max_length=20)),
+                ('to_status', models.CharField(choices=[('pending', 'Pending Review'), ('approved', 'Approved'), ('rejected', 'Rejected')], max_length=20)),
+                ('notes', models.TextField(blank=True, default='')),
+                ('changes', models.JSONField(blank=True, default=dict, help_text='Edited fields as {field: [old, new]}')),
+                ('uploaded_at', models.DateTimeField(help_text="The paper's upload time, for time-to-review")),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('college', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='academics.college')),
+                ('moderator', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('pyq', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='academics.previousyearquestion')),
+            ],
+            options={
+                'ordering': ['-id'],
+                'indexes': [models.Index(fields=['college', 'id'], name='academics_m_college_003c82_idx'), models.Index(fields=['moderator', 'id'], name='academics_m_moderat_f6e8f2_idx'), models.Index(fields=['college', 'created_at'], name='academics_m_college_225f4f_idx')],
+            },
+        ),
+    ]
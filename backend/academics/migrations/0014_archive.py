@@ -0,0 +1,57 @@
+# Generated by Django 5.1.6 on 2026-10-19 07:39
+
+import django.core.serializers.json
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('academics', '0013_moderationevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivePack',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text='Path in the archive storage', max_length=255, unique=True)),
+                ('paper_count', models.PositiveIntegerField()),
+                ('original_bytes', models.BigIntegerField()),
+                ('packed_bytes', models.BigIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='previousyearquestion',
+            name='last_accessed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='ArchivedPYQ',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pyq_id', models.PositiveIntegerField(help_text='Id of the archived PreviousYearQuestion', unique=True)),
+                ('year', models.IntegerField()),
+                ('semester', models.IntegerField()),
+                ('status', models.CharField(choices=[('pending', 'Pending Review'), ('approved', 'Approved'), ('rejected', 'Rejected')], max_length=20)),
+                ('reason', models.CharField(choices=[('rejected', 'Rejected'), ('stale', 'Not accessed')], max_length=10)),
+                ('record', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder, help_text='The PreviousYearQuestion row')),
+                ('bookmarked_by', models.JSONField(default=list, help_text='Ids of users who had bookmarked it')),
+                ('member', models.CharField(blank=True, default='', help_text="The file's name in the pack", max_length=255)),
+                ('size', models.BigIntegerField(default=0)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('college', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='academics.college')),
+                ('subject', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='academics.subject')),
+                ('pack', models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='papers', to='academics.archivepack')),
+            ],
+            options={
+                'ordering': ['-archived_at'],
+                'indexes': [models.Index(fields=['college', 'archived_at'], name='academics_a_college_dd5428_idx')],
+            },
+        ),
+    ]
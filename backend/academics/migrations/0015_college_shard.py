@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-19 07:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('academics', '0014_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='college',
+            name='shard',
+            field=models.CharField(default='default', max_length=50),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-19 08:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('academics', '0015_college_shard'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='archivedpyq',
+            name='pyq_id',
+            field=models.PositiveBigIntegerField(help_text='Id of the archived PreviousYearQuestion', unique=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+from django.db import migrations
+from django.utils import timezone
+
+
+def backfill_last_accessed_at(apps, schema_editor):
+    # Accesses before 0014 were never recorded, so without this archive_pyqs
+    # would treat every paper older than the stale period as unused, however
+    # often it is downloaded. Count them as accessed now instead.
+    PreviousYearQuestion = apps.get_model('academics', 'PreviousYearQuestion')
+    PreviousYearQuestion.objects.using(schema_editor.connection.alias).filter(
+        last_accessed_at__isnull=True,
+    ).update(last_accessed_at=timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('academics', '0016_archivedpyq_big_id'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_last_accessed_at, migrations.RunPython.noop),
+    ]
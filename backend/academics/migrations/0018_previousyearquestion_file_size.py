@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-19 08:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('academics', '0017_backfill_last_accessed_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='previousyearquestion',
+            name='file_size',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -1,6 +1,8 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
 
 
 class College(models.Model):
@@ -8,6 +10,9 @@ class College(models.Model):
     name = models.CharField(max_length=255)
     location = models.CharField(max_length=255, blank=True, null=True)
     is_active = models.BooleanField(default=True)
+    # Database alias holding the college's branches, subjects and papers when
+    # sharding is on (see academics/sharding.py); change it with move_college
+    shard = models.CharField(max_length=50, default='default')
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
@@ -88,18 +93,33 @@ class PreviousYearQuestion(models.Model):
     semester = models.IntegerField()
     regulation = models.CharField(max_length=100, blank=True, null=True)
     paper_file = models.FileField(upload_to='')
+    file_hash = models.CharField(max_length=64, blank=True, default='', db_index=True)
     uploaded_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='uploaded_pyqs')
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     reviewed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='reviewed_pyqs')
     review_notes = models.TextField(blank=True, null=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
     reviewed_at = models.DateTimeField(null=True, blank=True)
+    # Written in batches by academics.counters, so they lag by a few seconds
+    download_count = models.PositiveIntegerField(default=0, db_index=True)
+    view_count = models.PositiveIntegerField(default=0)
+    # Moderation queue lease (academics.moderation_queue); free once it expires
+    claimed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='claimed_pyqs')
+    claim_expires_at = models.DateTimeField(null=True, blank=True)
+    # Set when buffered download/view counts are flushed; archive_pyqs uses it to find stale papers
+    last_accessed_at = models.DateTimeField(null=True, blank=True)
+    # Charged to the download byte budget when the download is a redirect to object storage
+    file_size = models.PositiveBigIntegerField(null=True, blank=True)
 
     def __str__(self):
         return f"{self.subject.name} - {self.year} (Sem {self.semester})"
 
     class Meta:
         ordering = ['-year', 'semester', 'subject']
+        indexes = [
+            # The moderation queue walks pending papers oldest first
+            models.Index(fields=['status', 'uploaded_at']),
+        ]
 
     @property
     def approved(self):
@@ -119,3 +139,215 @@ class Bookmark(models.Model):
 
     def __str__(self):
         return f"{self.user.username} - {self.pyq}"
+
+
+class UsageEvent(models.Model):
+    """
+    Append-only log of user activity, written in batches by academics.events.
+    Ids are kept without foreign key constraints so the log never blocks or
+    cascades from deletes elsewhere.
+    """
+    KIND_CHOICES = [
+        ('download', 'Download'),
+        ('view', 'View'),
+        ('search', 'Search'),
+        ('bookmark', 'Bookmark'),
+        ('unbookmark', 'Remove bookmark'),
+        ('upload', 'Upload'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    # Stored separately so rollups and retention work on whole-day ranges
+    day = models.DateField()
+    occurred_at = models.DateTimeField()
+    user = models.ForeignKey(User, on_delete=models.DO_NOTHING, null=True, db_constraint=False, related_name='+')
+    college = models.ForeignKey(College, on_delete=models.DO_NOTHING, null=True, db_constraint=False, related_name='+')
+    subject = models.ForeignKey(Subject, on_delete=models.DO_NOTHING, null=True, db_constraint=False, related_name='+')
+    pyq = models.ForeignKey(PreviousYearQuestion, on_delete=models.DO_NOTHING, null=True, db_constraint=False, related_name='+')
+    query = models.CharField(max_length=200, blank=True, default='')
+
+    def __str__(self):
+        return f"{self.get_kind_display()} by {self.user_id} at {self.occurred_at}"
+
+    class Meta:
+        indexes = [models.Index(fields=['day', 'kind'])]
+
+
+class ModerationEvent(models.Model):
+    """
+    Append-only history of moderation decisions and edits, written in the
+    same transaction as the change (see academics.moderation_log). Like
+    UsageEvent, ids are kept without foreign key constraints so the history
+    outlives the papers and users it mentions.
+    """
+    ACTION_CHOICES = [
+        ('approve', 'Approved'),
+        ('reject', 'Rejected'),
+        ('reset', 'Reset to pending'),
+        ('edit', 'Edited details'),
+    ]
+
+    pyq = models.ForeignKey(PreviousYearQuestion, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    # Copied from the paper so timelines and throughput need no joins
+    college = models.ForeignKey(College, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    moderator = models.ForeignKey(User, on_delete=models.DO_NOTHING, null=True, db_constraint=False, related_name='+')
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    from_status = models.CharField(max_length=20, choices=PreviousYearQuestion.STATUS_CHOICES)
+    to_status = models.CharField(max_length=20, choices=PreviousYearQuestion.STATUS_CHOICES)
+    notes = models.TextField(blank=True, default='')
+    changes = models.JSONField(default=dict, blank=True, help_text='Edited fields as {field: [old, new]}')
+    uploaded_at = models.DateTimeField(help_text="The paper's upload time, for time-to-review")
+    created_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.get_action_display()} {self.pyq_id} by {self.moderator_id} at {self.created_at}"
+
+    class Meta:
+        ordering = ['-id']
+        indexes = [
+            # Timelines page backwards by id within a college or moderator
+            models.Index(fields=['college', 'id']),
+            models.Index(fields=['moderator', 'id']),
+            # Throughput over a time window
+            models.Index(fields=['college', 'created_at']),
+        ]
+
+
+class DailyUsage(models.Model):
+    """Daily event counts per college and subject, built by the rollup_usage command"""
+    day = models.DateField()
+    kind = models.CharField(max_length=20, choices=UsageEvent.KIND_CHOICES)
+    college = models.ForeignKey(College, on_delete=models.DO_NOTHING, null=True, db_constraint=False, related_name='+')
+    subject = models.ForeignKey(Subject, on_delete=models.DO_NOTHING, null=True, db_constraint=False, related_name='+')
+    events = models.PositiveIntegerField()
+    users = models.PositiveIntegerField(help_text='Distinct users')
+
+    def __str__(self):
+        return f"{self.day} {self.kind}: {self.events}"
+
+    class Meta:
+        ordering = ['-day', 'kind']
+        indexes = [
+            models.Index(fields=['day']),
+            models.Index(fields=['college', 'day']),
+        ]
+
+
+class RelatedPYQ(models.Model):
+    """
+    Precomputed "related papers" for a PYQ: its top neighbours by co-bookmark
+    and co-download similarity, built by the build_related_pyqs command.
+    """
+    pyq = models.ForeignKey(PreviousYearQuestion, on_delete=models.CASCADE, related_name='related_pyqs')
+    related = models.ForeignKey(PreviousYearQuestion, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+    computed_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.pyq_id} -> {self.related_id} ({self.score:.3f})"
+
+    class Meta:
+        ordering = ['pyq', 'rank']
+        constraints = [
+            # Also the index the related endpoint reads through
+            models.UniqueConstraint(fields=['pyq', 'rank'], name='unique_related_pyq_rank'),
+        ]
+
+
+class PaperFingerprint(models.Model):
+    """
+    Similarity features of a paper, computed in the background by
+    academics.duplicates: perceptual hashes of its page images and a MinHash
+    signature of its text.
+    """
+    pyq = models.OneToOneField(PreviousYearQuestion, on_delete=models.CASCADE, primary_key=True, related_name='fingerprint')
+    page_hashes = models.JSONField(default=list, help_text='64-bit difference hash per page image')
+    minhash = models.JSONField(default=list, help_text='MinHash signature of word shingles; empty without text')
+    computed_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Fingerprint of {self.pyq_id}"
+
+
+class SimilarityBucket(models.Model):
+    """
+    LSH index over fingerprints: papers sharing a bucket key are candidate
+    duplicates. Keys include the subject and year, so lookups stay within
+    papers of the same exam.
+    """
+    key = models.CharField(max_length=80, db_index=True)
+    pyq = models.ForeignKey(PreviousYearQuestion, on_delete=models.CASCADE, related_name='+')
+
+    def __str__(self):
+        return f"{self.key}: {self.pyq_id}"
+
+
+class DuplicateCandidate(models.Model):
+    """An earlier paper that a newly uploaded one likely duplicates, shown to moderators"""
+    METHOD_CHOICES = [
+        ('exact', 'Identical file'),
+        ('text', 'Similar text'),
+        ('image', 'Similar page images'),
+    ]
+
+    pyq = models.ForeignKey(PreviousYearQuestion, on_delete=models.CASCADE, related_name='duplicate_candidates')
+    duplicate_of = models.ForeignKey(PreviousYearQuestion, on_delete=models.CASCADE, related_name='+')
+    method = models.CharField(max_length=10, choices=METHOD_CHOICES)
+    similarity = models.FloatField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.pyq_id} ~ {self.duplicate_of_id} ({self.method} {self.similarity:.2f})"
+
+    class Meta:
+        unique_together = ['pyq', 'duplicate_of']
+        ordering = ['-similarity']
+
+
+class ArchivePack(models.Model):
+    """A compressed zip of archived papers in the archive storage"""
+    name = models.CharField(max_length=255, unique=True, help_text='Path in the archive storage')
+    paper_count = models.PositiveIntegerField()
+    original_bytes = models.BigIntegerField()
+    packed_bytes = models.BigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        ordering = ['-created_at']
+
+
+class ArchivedPYQ(models.Model):
+    """
+    Stub left behind when archive_pyqs moves a paper to cold storage: the
+    paper's row as it was, who had bookmarked it, and where its file is in
+    its pack. academics.archive.restore puts it back under the same id.
+    """
+    REASON_CHOICES = [
+        ('rejected', 'Rejected'),
+        ('stale', 'Not accessed'),
+    ]
+
+    pyq_id = models.PositiveBigIntegerField(unique=True, help_text='Id of the archived PreviousYearQuestion')
+    college = models.ForeignKey(College, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    subject = models.ForeignKey(Subject, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    year = models.IntegerField()
+    semester = models.IntegerField()
+    status = models.CharField(max_length=20, choices=PreviousYearQuestion.STATUS_CHOICES)
+    reason = models.CharField(max_length=10, choices=REASON_CHOICES)
+    record = models.JSONField(encoder=DjangoJSONEncoder, help_text='The PreviousYearQuestion row')
+    bookmarked_by = models.JSONField(default=list, help_text='Ids of users who had bookmarked it')
+    pack = models.ForeignKey(ArchivePack, on_delete=models.PROTECT, null=True, related_name='papers')
+    member = models.CharField(max_length=255, blank=True, default='', help_text="The file's name in the pack")
+    size = models.BigIntegerField(default=0)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Archived PYQ {self.pyq_id} ({self.reason})"
+
+    class Meta:
+        ordering = ['-archived_at']
+        indexes = [models.Index(fields=['college', 'archived_at'])]
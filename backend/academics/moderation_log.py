@@ -0,0 +1,129 @@
+from datetime import timedelta
+
+from django.db.models import Avg, Count, DurationField, ExpressionWrapper, F, Max, Min, Q
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from .models import ModerationEvent, PreviousYearQuestion
+from .sharding import per_shard
+
+
+# The action recorded when a paper moves to each status
+STATUS_ACTIONS = {'approved': 'approve', 'rejected': 'reject', 'pending': 'reset'}
+REVIEW_ACTIONS = ['approve', 'reject']
+TIMELINE_LIMIT = 50
+
+
+def record(pyq, moderator, from_status, notes='', changes=None):
+    """
+    Log a change just saved to pyq. Call it inside the transaction that
+    saved the change, so the history never misses or invents a decision.
+    """
+    action = 'edit' if pyq.status == from_status else STATUS_ACTIONS[pyq.status]
+    return ModerationEvent.objects.create(
+        pyq_id=pyq.id, college_id=pyq.subject.branch.college_id, moderator=moderator,
+        action=action, from_status=from_status, to_status=pyq.status,
+        notes=notes or '', changes=changes or {}, uploaded_at=pyq.uploaded_at,
+    )
+
+
+def record_bulk(pks, moderator, to_status, notes=''):
+    """
+    Log a bulk status change of the given papers with one INSERT. Call it in
+    the transaction that makes the change, before the UPDATE, so from_status
+    is read while the rows are locked.
+    """
+    rows = (
+        PreviousYearQuestion.objects.select_for_update(of=('self',)).filter(pk__in=pks).order_by()
+        .values_list('id', 'status', 'subject__branch__college_id', 'uploaded_at')
+    )
+    now = timezone.now()
+    return ModerationEvent.objects.bulk_create([
+        ModerationEvent(
+            pyq_id=pyq_id, college_id=college_id, moderator=moderator,
+            action=STATUS_ACTIONS[to_status], from_status=from_status, to_status=to_status,
+            notes=notes, uploaded_at=uploaded_at, created_at=now,
+        )
+        for pyq_id, from_status, college_id, uploaded_at in rows
+    ])
+
+
+def timeline(events, before=None, limit=TIMELINE_LIMIT):
+    """
+    One page of events, newest first, and the cursor for the next page (or
+    None). Keyset pagination on id: each page is an index range scan, however
+    deep into the history it is, and events added meanwhile don't shift it.
+    """
+    if before is not None:
+        events = events.filter(id__lt=before)
+    page = list(events.order_by('-id')[:limit + 1])
+    if len(page) > limit:
+        return page[:limit], page[limit - 1].id
+    return page, None
+
+
+def throughput(events, since, until):
+    """
+    Per-moderator review statistics over [since, until): reviews, reviews per
+    hour of the window and per hour they were active, and time from upload
+    to review. Computed in one grouped query over the event log per shard.
+    """
+    time_to_review = ExpressionWrapper(F('created_at') - F('uploaded_at'), output_field=DurationField())
+    rows = {}
+    for part in per_shard(events):
+        part_rows = (
+            part.filter(action__in=REVIEW_ACTIONS, created_at__gte=since, created_at__lt=until)
+            .values('moderator_id', 'moderator__username')
+            .annotate(
+                reviews=Count('id'),
+                approved=Count('id', filter=Q(action='approve')),
+                rejected=Count('id', filter=Q(action='reject')),
+                active_hours=Count(TruncHour('created_at'), distinct=True),
+                avg_time_to_review=Avg(time_to_review),
+                fastest_review=Min(time_to_review),
+                slowest_review=Max(time_to_review),
+            )
+            .order_by()
+        )
+        for row in part_rows:
+            if row['moderator_id'] in rows:
+                _combine(rows[row['moderator_id']], row)
+            else:
+                rows[row['moderator_id']] = row
+
+    hours = max((until - since) / timedelta(hours=1), 1)
+    stats = []
+    for row in sorted(rows.values(), key=lambda row: (-row['reviews'], row['moderator_id'] or 0)):
+        stats.append({
+            'moderator_id': row['moderator_id'],
+            'moderator_username': row['moderator__username'],
+            'reviews': row['reviews'],
+            'approved': row['approved'],
+            'rejected': row['rejected'],
+            'reviews_per_hour': round(row['reviews'] / hours, 2),
+            'reviews_per_active_hour': round(row['reviews'] / max(row['active_hours'], 1), 2),
+            'avg_hours_to_review': _hours(row['avg_time_to_review']),
+            'fastest_hours_to_review': _hours(row['fastest_review']),
+            'slowest_hours_to_review': _hours(row['slowest_review']),
+        })
+    return stats
+
+
+def _combine(row, other):
+    """Fold another shard's statistics for the same moderator into row"""
+    if other['avg_time_to_review'] is not None:
+        if row['avg_time_to_review'] is None:
+            row['avg_time_to_review'] = other['avg_time_to_review']
+        else:
+            row['avg_time_to_review'] = (
+                row['avg_time_to_review'] * row['reviews'] + other['avg_time_to_review'] * other['reviews']
+            ) / (row['reviews'] + other['reviews'])
+    for key, pick in (('fastest_review', min), ('slowest_review', max)):
+        row[key] = pick((value for value in (row[key], other[key]) if value is not None), default=None)
+    # Hours active on two shards are counted twice
+    for key in ('reviews', 'approved', 'rejected', 'active_hours'):
+        row[key] += other[key]
+
+
+def _hours(duration):
+    return None if duration is None else round(duration / timedelta(hours=1), 2)
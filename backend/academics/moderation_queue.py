@@ -0,0 +1,109 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from .models import PreviousYearQuestion
+from .permissions import RoleBasedPermissionMixin
+
+
+# Rounds of fresh candidates when other moderators win the race for a batch
+CLAIM_ATTEMPTS = 3
+
+
+class ClaimedByOther(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'This PYQ is claimed by another moderator.'
+    default_code = 'claimed'
+
+
+def unclaimed(now):
+    """Papers with no live lease: never claimed, released, or expired"""
+    return Q(claimed_by__isnull=True) | Q(claim_expires_at__isnull=True) | Q(claim_expires_at__lte=now)
+
+
+def queue(user):
+    """Pending papers the user may moderate, oldest first"""
+    return PreviousYearQuestion.objects.filter(
+        status='pending',
+        subject__branch__college__in=RoleBasedPermissionMixin.get_moderated_colleges(user),
+    ).order_by('uploaded_at', 'id')
+
+
+def _claim_skip_locked(user, wanted, now, expires_at):
+    # Rows another moderator's transaction is claiming are skipped, not waited on
+    with transaction.atomic(using=router.db_for_write(PreviousYearQuestion)):
+        ids = list(
+            queue(user).filter(unclaimed(now))
+            .select_for_update(skip_locked=True, of=('self',))
+            .values_list('id', flat=True)[:wanted]
+        )
+        PreviousYearQuestion.objects.filter(id__in=ids).update(claimed_by=user, claim_expires_at=expires_at)
+
+
+def _claim_conditional(user, wanted, now, expires_at):
+    """
+    Without SKIP LOCKED, claim candidates with one UPDATE that re-checks they
+    are still free. Writes are serialized, so a paper two moderators both
+    picked goes to whichever UPDATE runs first; the loser tops up its batch
+    from fresh candidates.
+    """
+    claimed = 0
+    for _ in range(CLAIM_ATTEMPTS):
+        ids = list(queue(user).filter(unclaimed(now)).values_list('id', flat=True)[:wanted - claimed])
+        if not ids:
+            break
+        claimed += PreviousYearQuestion.objects.filter(unclaimed(now), id__in=ids, status='pending').update(
+            claimed_by=user, claim_expires_at=expires_at,
+        )
+        if claimed >= wanted:
+            break
+
+
+def claim_batch(user, size, lease_seconds=None):
+    """
+    Lease up to size pending papers to user, counting the ones the user
+    already holds (their leases are renewed). Every moderator calling this
+    gets a different batch. Returns the claimed papers and the lease expiry.
+    """
+    now = timezone.now()
+    expires_at = now + timedelta(seconds=lease_seconds or settings.MODERATION_LEASE_SECONDS)
+    held = PreviousYearQuestion.objects.filter(
+        status='pending', claimed_by=user, claim_expires_at__gt=now, subject__branch__college__is_active=True,
+    ).update(claim_expires_at=expires_at)
+
+    wanted = size - held
+    if wanted > 0:
+        connection = connections[router.db_for_write(PreviousYearQuestion)]
+        if connection.features.has_select_for_update_skip_locked:
+            _claim_skip_locked(user, wanted, now, expires_at)
+        else:
+            _claim_conditional(user, wanted, now, expires_at)
+
+    claimed = PreviousYearQuestion.objects.filter(
+        status='pending', claimed_by=user, claim_expires_at=expires_at,
+    ).order_by('uploaded_at', 'id')
+    return claimed, expires_at
+
+
+def release(user, pyq_ids=None):
+    """Hand the user's claims (or just pyq_ids among them) back to the queue"""
+    claims = PreviousYearQuestion.objects.filter(claimed_by=user)
+    if pyq_ids is not None:
+        claims = claims.filter(id__in=pyq_ids)
+    return claims.update(claimed_by=None, claim_expires_at=None)
+
+
+def ensure_not_claimed_by_other(pyq, user):
+    """Raise ClaimedByOther if another moderator holds a live lease on pyq"""
+    if (
+        pyq.claimed_by_id is not None and pyq.claimed_by_id != user.id
+        and pyq.claim_expires_at is not None and pyq.claim_expires_at > timezone.now()
+    ):
+        raise ClaimedByOther(
+            f'This PYQ is claimed by another moderator until {pyq.claim_expires_at.isoformat()}.'
+        )
@@ -0,0 +1,219 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+from pyqachu_backend.metrics import PAPER_CACHE_EVENTS
+
+
+class _Fill:
+    """A download in progress that other requests for the same paper wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.error = None
+
+
+class PaperCache:
+    """
+    Read-through disk cache for papers kept in remote storage.
+
+    Files are evicted least-recently-used first once their total size
+    exceeds max_bytes. Fills are written to a temp file and renamed into
+    place, so readers never see a partial paper, and concurrent misses for
+    the same paper share a single remote download.
+
+    The LRU index lives in memory, so each worker process needs its own
+    directory; get_paper_cache gives it one under PAPER_CACHE_DIR.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = str(directory)
+        self.max_bytes = max_bytes
+        self.pid = os.getpid()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # cache key -> size, least recent first
+        self._total_bytes = 0
+        self._fills = {}
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        """Index papers left by a previous run, oldest access first"""
+        found = []
+        for root, _, files in os.walk(self.directory):
+            for file_name in files:
+                path = os.path.join(root, file_name)
+                if file_name.endswith('.part'):
+                    os.remove(path)
+                    continue
+                stat = os.stat(path)
+                found.append((stat.st_atime, file_name, stat.st_size))
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._total_bytes += size
+        with self._lock:
+            self._evict(keep=None)
+
+    def _key(self, name):
+        return hashlib.sha256(name.encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def open(self, fieldfile):
+        """Return an open binary file for the paper, fetching it on a miss"""
+        key = self._key(fieldfile.name)
+        path = self._path(key)
+
+        with self._lock:
+            if key in self._entries:
+                try:
+                    # Opened under the lock so eviction can't remove it first
+                    paper = open(path, 'rb')
+                except FileNotFoundError:
+                    # Removed behind our back; treat it as a miss
+                    self._total_bytes -= self._entries.pop(key)
+                else:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    PAPER_CACHE_EVENTS.labels('hit').inc()
+                    return paper
+
+            fill = self._fills.get(key)
+            leader = fill is None
+            if leader:
+                fill = self._fills[key] = _Fill()
+                self.misses += 1
+                PAPER_CACHE_EVENTS.labels('miss').inc()
+            else:
+                self.coalesced += 1
+                PAPER_CACHE_EVENTS.labels('coalesced').inc()
+
+        if not leader:
+            fill.done.wait()
+            if fill.error is not None:
+                raise fill.error
+            with self._lock:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    return open(path, 'rb')
+            # Evicted again before we got to it
+            return self.open(fieldfile)
+
+        try:
+            size = self._fetch(fieldfile, path)
+            with self._lock:
+                self._entries[key] = size
+                self._total_bytes += size
+                self._evict(keep=key)
+                return open(path, 'rb')
+        except Exception as e:
+            fill.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._fills[key]
+            fill.done.set()
+
+    def _fetch(self, fieldfile, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as target, fieldfile.storage.open(fieldfile.name, 'rb') as source:
+                shutil.copyfileobj(source, target, 1024 * 1024)
+            os.replace(temp_path, path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return os.path.getsize(path)
+
+    def _evict(self, keep):
+        # Called with the lock held; open readers keep their unlinked file
+        while self._total_bytes > self.max_bytes and self._entries:
+            key, size = next(iter(self._entries.items()))
+            if key == keep:
+                break
+            del self._entries[key]
+            self._total_bytes -= size
+            self.evictions += 1
+            PAPER_CACHE_EVENTS.labels('eviction').inc()
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'evictions': self.evictions,
+                'files': len(self._entries),
+                'bytes': self._total_bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+
+_paper_cache = None
+_paper_cache_lock = threading.Lock()
+
+WORKER_PREFIX = 'worker-'
+
+
+def _is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # Alive, but owned by another user
+    return True
+
+
+def worker_directory(root):
+    """
+    This process's directory under root. The first one left behind by a dead
+    worker is taken over, so a restarted worker keeps its papers warm; any
+    others are removed, or their bytes would never be evicted.
+    """
+    directory = os.path.join(root, f'{WORKER_PREFIX}{os.getpid()}')
+    os.makedirs(root, exist_ok=True)
+    adopted = os.path.isdir(directory)
+    for entry in os.scandir(root):
+        pid = entry.name[len(WORKER_PREFIX):]
+        if not (entry.name.startswith(WORKER_PREFIX) and pid.isdigit() and entry.is_dir()):
+            continue
+        if _is_running(int(pid)):
+            continue
+        if not adopted:
+            try:
+                os.rename(entry.path, directory)
+                adopted = True
+                continue
+            except FileNotFoundError:
+                continue  # Another worker took it over first
+        shutil.rmtree(entry.path, ignore_errors=True)
+    return directory
+
+
+def get_paper_cache():
+    """The process-wide cache, or None when PAPER_CACHE_DIR isn't set"""
+    global _paper_cache
+    if not settings.PAPER_CACHE_DIR:
+        return None
+    with _paper_cache_lock:
+        # A forked worker must not share its parent's index
+        if _paper_cache is None or _paper_cache.pid != os.getpid():
+            _paper_cache = PaperCache(worker_directory(settings.PAPER_CACHE_DIR), settings.PAPER_CACHE_MAX_BYTES)
+        return _paper_cache
@@ -28,6 +28,29 @@ class RoleBasedPermissionMixin:
         
         return 'student'  # Default role
     
+    @staticmethod
+    async def aget_user_role(user, college=None):
+        """Async version of get_user_role for async views"""
+        if not user.is_authenticated:
+            return None
+
+        if user.is_superuser:
+            return 'superuser'
+
+        if college:
+            roles = [
+                role async for role in UserRole.objects.filter(
+                    user=user, college=college, is_active=True
+                ).values_list('role', flat=True)
+            ]
+
+            role_hierarchy = ['admin', 'moderator', 'student']
+            for role in role_hierarchy:
+                if role in roles:
+                    return role
+
+        return 'student'
+
     @staticmethod
     def can_manage_college(user, college):
         """Check if user can manage a specific college"""
@@ -37,9 +60,20 @@ class RoleBasedPermissionMixin:
     @staticmethod
     def can_moderate_pyqs(user, college):
         """Check if user can moderate PYQs for a college"""
+        if not college.is_active:
+            # Nobody, superusers included, while move_college copies it to another shard
+            return False
         role = RoleBasedPermissionMixin.get_user_role(user, college)
         return user.is_superuser or role in ['admin', 'moderator']
     
+    @staticmethod
+    async def acan_moderate_pyqs(user, college):
+        """Async version of can_moderate_pyqs for async views"""
+        if not college.is_active:
+            return False
+        role = await RoleBasedPermissionMixin.aget_user_role(user, college)
+        return user.is_superuser or role in ['admin', 'moderator']
+
     @staticmethod
     def can_assign_roles(user, college, target_role):
         """Check if user can assign a specific role"""
@@ -55,6 +89,63 @@ class RoleBasedPermissionMixin:
         
         return False
     
+    @staticmethod
+    def get_college_roles(user):
+        """Map college id to the user's highest role there, in one query"""
+        if not user.is_authenticated or user.is_superuser:
+            return {}
+        
+        role_hierarchy = ['admin', 'moderator', 'student']
+        college_roles = {}
+        for college_id, role in UserRole.objects.filter(
+            user=user, is_active=True
+        ).values_list('college_id', 'role'):
+            current = college_roles.get(college_id)
+            if current is None or role_hierarchy.index(role) < role_hierarchy.index(current):
+                college_roles[college_id] = role
+        return college_roles
+    
+    @staticmethod
+    def get_download_grants(user):
+        """
+        Map the id of each active college whose papers the user may download
+        to whether unapproved papers are included (moderators and admins), in
+        one query
+        """
+        if user.is_superuser:
+            return dict.fromkeys(College.objects.filter(is_active=True).values_list('id', flat=True), True)
+        
+        grants = {}
+        for college_id, role in UserRole.objects.filter(
+            user=user, is_active=True, college__is_active=True
+        ).order_by().values_list('college_id', 'role'):
+            grants[college_id] = grants.get(college_id, False) or role in ['admin', 'moderator']
+        return grants
+    
+    @staticmethod
+    def get_managed_colleges(user):
+        """Get active colleges the user administers"""
+        if user.is_superuser:
+            return College.objects.filter(is_active=True)
+        
+        college_ids = UserRole.objects.filter(
+            user=user, role='admin', is_active=True
+        ).values_list('college_id', flat=True)
+        
+        return College.objects.filter(id__in=college_ids, is_active=True)
+    
+    @staticmethod
+    def get_moderated_colleges(user):
+        """Get active colleges where the user can moderate PYQs"""
+        if user.is_superuser:
+            return College.objects.filter(is_active=True)
+        
+        college_ids = UserRole.objects.filter(
+            user=user, role__in=['admin', 'moderator'], is_active=True
+        ).values_list('college_id', flat=True)
+        
+        return College.objects.filter(id__in=college_ids, is_active=True)
+    
     @staticmethod
     def get_user_colleges(user):
         """Get colleges that user has access to"""
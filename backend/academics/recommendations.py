@@ -0,0 +1,128 @@
+import heapq
+import math
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.db import router, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import Bookmark, PreviousYearQuestion, RelatedPYQ, UsageEvent
+
+
+# Usage events reach the database a few seconds late, so incremental runs
+# look back a little before the previous run
+EVENT_OVERLAP = timedelta(minutes=5)
+WRITE_BATCH_SIZE = 500
+
+
+def load_interactions(max_user_items):
+    """
+    The user x paper matrix as sparse rows and columns: who bookmarked or
+    downloaded each approved paper. Users with more than max_user_items
+    papers (crawlers, bulk downloaders) are left out; they say little about
+    which papers go together and dominate the cost.
+    """
+    user_items = defaultdict(set)
+    approved = PreviousYearQuestion.objects.filter(status='approved').values('id')
+    bookmarks = Bookmark.objects.filter(pyq_id__in=approved).values_list('user_id', 'pyq_id')
+    downloads = (
+        UsageEvent.objects.filter(kind='download', user_id__isnull=False, pyq_id__in=approved)
+        .values_list('user_id', 'pyq_id').distinct().order_by()
+    )
+    for queryset in (bookmarks, downloads):
+        for user_id, pyq_id in queryset.iterator(chunk_size=5000):
+            user_items[user_id].add(pyq_id)
+
+    item_users = defaultdict(set)
+    for user_id, items in list(user_items.items()):
+        if len(items) > max_user_items:
+            del user_items[user_id]
+            continue
+        for pyq_id in items:
+            item_users[pyq_id].add(user_id)
+    return user_items, item_users
+
+
+def neighbours(pyq_id, user_items, item_users, top_k, min_common):
+    """Top papers by cosine similarity of their user sets, as (id, score)"""
+    users = item_users.get(pyq_id, ())
+    common = Counter()
+    for user_id in users:
+        common.update(user_items[user_id])
+    common.pop(pyq_id, None)
+
+    scored = (
+        (count / math.sqrt(len(users) * len(item_users[other])), other)
+        for other, count in common.items() if count >= min_common
+    )
+    # Ties go to the lower id so rebuilds are stable
+    best = heapq.nsmallest(top_k, scored, key=lambda pair: (-pair[0], pair[1]))
+    return [(other, score) for score, other in best]
+
+
+def changed_items(since, user_items, item_users):
+    """
+    Papers whose neighbour lists may have changed since the given time: any
+    paper bookmarked, unbookmarked or downloaded since, every paper sharing
+    a user with one of those (their similarity to it changed), and every
+    paper of the users involved.
+    """
+    dirty = set()
+    users = set()
+    recent_bookmarks = Bookmark.objects.filter(created_at__gte=since).values_list('user_id', 'pyq_id')
+    recent_events = UsageEvent.objects.filter(
+        day__gte=timezone.localdate(since), occurred_at__gte=since,
+        kind__in=['bookmark', 'unbookmark', 'download'],
+    ).values_list('user_id', 'pyq_id')
+    for queryset in (recent_bookmarks, recent_events):
+        for user_id, pyq_id in queryset.iterator(chunk_size=5000):
+            users.add(user_id)
+            if pyq_id is not None:
+                dirty.add(pyq_id)
+
+    affected = set(dirty)
+    for pyq_id in dirty:
+        for user_id in item_users.get(pyq_id, ()):
+            users.add(user_id)
+    for user_id in users:
+        affected.update(user_items.get(user_id, ()))
+    return affected
+
+
+def build_related(top_k, min_common=2, max_user_items=1000, full=False):
+    """
+    Refresh the RelatedPYQ table. Without full, only papers affected by
+    activity since the previous run are recomputed (the first run is
+    always full). Returns (papers refreshed, rows written).
+    """
+    started = timezone.now()
+    user_items, item_users = load_interactions(max_user_items)
+
+    last_run = None if full else RelatedPYQ.objects.aggregate(last=Max('computed_at'))['last']
+    if last_run is None:
+        items = set(item_users)
+    else:
+        items = changed_items(last_run - EVENT_OVERLAP, user_items, item_users)
+
+    ordered = sorted(items)
+    written = 0
+    for start in range(0, len(ordered), WRITE_BATCH_SIZE):
+        batch = ordered[start:start + WRITE_BATCH_SIZE]
+        rows = [
+            RelatedPYQ(pyq_id=pyq_id, related_id=other, rank=rank, score=score, computed_at=started)
+            for pyq_id in batch
+            for rank, (other, score) in enumerate(
+                neighbours(pyq_id, user_items, item_users, top_k, min_common), start=1
+            )
+        ]
+        # Each paper's list is swapped in one transaction, so readers never see it half-written
+        with transaction.atomic(using=router.db_for_write(RelatedPYQ)):
+            RelatedPYQ.objects.filter(pyq_id__in=batch).delete()
+            RelatedPYQ.objects.bulk_create(rows)
+        written += len(rows)
+
+    if last_run is None:
+        # Lists of papers that lost all their interactions or their approval
+        RelatedPYQ.objects.filter(computed_at__lt=started).delete()
+    return len(ordered), written
@@ -1,7 +1,13 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from .models import College, Branch, Subject, PreviousYearQuestion, UserRole, Bookmark
+from django.urls import reverse
+from .models import (
+    College, Branch, Subject, PreviousYearQuestion, UserRole, Bookmark, DuplicateCandidate, ModerationEvent,
+)
 from .permissions import RoleBasedPermissionMixin
+from .files import sha256_of, is_local
+from .uploads import InvalidUpload, check_paper_file
+from .signing import signed_download_url
 
 
 class UserRoleSerializer(serializers.ModelSerializer):
@@ -30,14 +36,25 @@ class CollegeSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'location', 'is_active', 'created_at', 'admin_count', 'moderator_count', 'user_role']
     
     def get_admin_count(self, obj):
+        # CollegeListView annotates the counts; fall back to a query otherwise
+        if hasattr(obj, 'admin_count'):
+            return obj.admin_count
         return obj.user_roles.filter(role='admin', is_active=True).count()
     
     def get_moderator_count(self, obj):
+        if hasattr(obj, 'moderator_count'):
+            return obj.moderator_count
         return obj.user_roles.filter(role='moderator', is_active=True).count()
     
     def get_user_role(self, obj):
         request = self.context.get('request')
         if request and request.user.is_authenticated:
+            # Role map fetched once for the whole list by the view
+            college_roles = self.context.get('college_roles')
+            if college_roles is not None:
+                if request.user.is_superuser:
+                    return 'superuser'
+                return college_roles.get(obj.id, 'student')
             return RoleBasedPermissionMixin.get_user_role(request.user, obj)
         return None
 
@@ -71,19 +88,48 @@ class PreviousYearQuestionSerializer(serializers.ModelSerializer):
     reviewed_by_username = serializers.CharField(source='reviewed_by.username', read_only=True)
     status_display = serializers.CharField(source='get_status_display', read_only=True)
     pdf_url = serializers.SerializerMethodField()
+    download_url = serializers.SerializerMethodField()
     
     class Meta:
         model = PreviousYearQuestion
         fields = [
-            'id', 'year', 'semester', 'regulation', 'paper_file', 'pdf_url',
+            'id', 'year', 'semester', 'regulation', 'paper_file', 'pdf_url', 'download_url',
             'uploaded_by', 'uploaded_by_username', 'status', 'status_display',
             'reviewed_by', 'reviewed_by_username', 'review_notes',
             'uploaded_at', 'reviewed_at', 'subject', 'subject_name', 
-            'branch_name', 'college_name'
+            'branch_name', 'college_name', 'download_count', 'view_count'
         ]
+        read_only_fields = ['download_count', 'view_count']
+    
+    def get_download_url(self, obj):
+        """
+        Download URL signed for the requesting user, or None if they may not
+        download the paper. Views whose querysets already apply the college
+        and approval rules set downloads_authorized in the context; otherwise
+        the rules are checked here with one query per response.
+        """
+        request = self.context.get('request')
+        if request is None or not request.user.is_authenticated:
+            return None
+        if not self.context.get('downloads_authorized'):
+            grants = self.context.get('download_grants')
+            if grants is None:
+                grants = self.context['download_grants'] = RoleBasedPermissionMixin.get_download_grants(request.user)
+            college_id = obj.subject.branch.college_id
+            if college_id not in grants or (obj.status != 'approved' and not grants[college_id]):
+                return None
+        return signed_download_url(request, obj.id, request.user.id)
     
     def get_pdf_url(self, obj):
         """Generate complete PDF URL"""
+        if obj.paper_file and not is_local(obj.paper_file):
+            # Remote papers go through the download view, authorized by the signature
+            signed = self.get_download_url(obj)
+            if signed:
+                return signed
+            url = reverse('pyq-download', args=[obj.id])
+            request = self.context.get('request')
+            return request.build_absolute_uri(url) if request else url
         if obj.paper_file:
             # Handle the case where database paths contain 'pyq_papers/' prefix
             file_path = str(obj.paper_file)
@@ -101,14 +147,51 @@ class PreviousYearQuestionSerializer(serializers.ModelSerializer):
         return None
 
 
+class DuplicateCandidateSerializer(serializers.ModelSerializer):
+    """An earlier paper a pending PYQ likely duplicates"""
+    duplicate_of_status = serializers.CharField(source='duplicate_of.status', read_only=True)
+    method_display = serializers.CharField(source='get_method_display', read_only=True)
+
+    class Meta:
+        model = DuplicateCandidate
+        fields = ['duplicate_of', 'duplicate_of_status', 'method', 'method_display', 'similarity']
+
+
+class PendingPYQSerializer(PreviousYearQuestionSerializer):
+    """
+    Pending PYQs for moderators, with who holds each one in the moderation
+    queue and the earlier papers it likely duplicates
+    """
+    claimed_by_username = serializers.CharField(source='claimed_by.username', read_only=True, default=None)
+    possible_duplicates = DuplicateCandidateSerializer(source='duplicate_candidates', many=True, read_only=True)
+
+    class Meta(PreviousYearQuestionSerializer.Meta):
+        fields = PreviousYearQuestionSerializer.Meta.fields + [
+            'claimed_by', 'claimed_by_username', 'claim_expires_at', 'possible_duplicates'
+        ]
+        read_only_fields = PreviousYearQuestionSerializer.Meta.read_only_fields + ['claimed_by', 'claim_expires_at']
+
+
 class PYQUploadSerializer(serializers.ModelSerializer):
     """Serializer for uploading new PYQs"""
     class Meta:
         model = PreviousYearQuestion
         fields = ['subject', 'year', 'semester', 'regulation', 'paper_file']
     
+    def validate_paper_file(self, value):
+        # The upload view streams these checks; this also covers bodies parsed before its handler ran
+        limits = self.context.get('upload_limits')
+        if limits:
+            try:
+                check_paper_file(value, *limits)
+            except InvalidUpload as e:
+                raise serializers.ValidationError(e.detail)
+        return value
+    
     def create(self, validated_data):
         validated_data['uploaded_by'] = self.context['request'].user
+        validated_data['file_hash'] = sha256_of(validated_data['paper_file'])
+        validated_data['file_size'] = validated_data['paper_file'].size
         return super().create(validated_data)
 
 
@@ -126,6 +209,19 @@ class PYQModerationSerializer(serializers.ModelSerializer):
         return super().update(instance, validated_data)
 
 
+class ModerationEventSerializer(serializers.ModelSerializer):
+    """Serializer for moderation history entries"""
+    moderator_username = serializers.CharField(source='moderator.username', read_only=True, default=None)
+    
+    class Meta:
+        model = ModerationEvent
+        fields = [
+            'id', 'pyq', 'college', 'moderator', 'moderator_username', 'action',
+            'from_status', 'to_status', 'notes', 'changes', 'uploaded_at', 'created_at'
+        ]
+        read_only_fields = fields
+
+
 class BookmarkSerializer(serializers.ModelSerializer):
     """Serializer for user bookmarks"""
     pyq = PreviousYearQuestionSerializer(read_only=True)
@@ -0,0 +1,594 @@
+"""
+Optional per-college sharding. With more than one alias in DATABASE_SHARDS,
+each college's branches, subjects, papers and everything hanging off them
+live in the database named by College.shard. Users, roles and colleges are
+the global directory: they are written to default and mirrored into every
+other shard, so sharded rows keep their foreign keys and the existing
+queries (joins to uploaded_by, subqueries on user_roles) run unchanged on
+whichever shard they are sent to.
+
+ShardRouter picks the shard per query from the request (ShardMiddleware
+makes it visible): a college named in the query string, else the shards of
+the user's colleges. When those span several, as for superusers, list views
+fan out over all of them and views about one paper go to the shard holding
+it. Code running outside a request uses default unless wrapped in
+use_shard(). With only default listed, nothing here changes a query.
+"""
+import heapq
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from itertools import islice, zip_longest
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connections, models, transaction
+from django.db.models.signals import post_delete, post_save
+from django.http import QueryDict
+
+from .models import (
+    ArchivedPYQ, ArchivePack, Bookmark, Branch, College, DailyUsage, DuplicateCandidate, ModerationEvent,
+    PaperFingerprint, PreviousYearQuestion, RelatedPYQ, SimilarityBucket, Subject, UsageEvent, UserRole,
+)
+
+
+logger = logging.getLogger(__name__)
+
+# Written to default and copied into every other shard
+DIRECTORY_MODELS = (User, College, UserRole)
+
+SHARD_MAP_CACHE_KEY = 'college-shards'
+
+# Set by use_shard(); wins over the request
+_shard = ContextVar('shard', default=None)
+# Set by ShardMiddleware for the duration of a request
+_request = ContextVar('shard_request', default=None)
+
+
+def is_enabled():
+    return len(settings.DATABASE_SHARDS) > 1
+
+
+def is_sharded(model):
+    return model._meta.app_label == 'academics' and model not in DIRECTORY_MODELS
+
+
+def sharded_models():
+    return [model for model in College._meta.app_config.get_models() if is_sharded(model)]
+
+
+def ordered(aliases):
+    """Shard aliases without repeats, in DATABASE_SHARDS order"""
+    position = {alias: index for index, alias in enumerate(settings.DATABASE_SHARDS)}
+    return sorted(set(aliases), key=lambda alias: (position.get(alias, len(position)), alias))
+
+
+def college_shards():
+    """{college id: shard alias}, cached for SHARD_MAP_CACHE_SECONDS"""
+    shards = cache.get(SHARD_MAP_CACHE_KEY)
+    if shards is None:
+        shards = dict(College.objects.using('default').values_list('id', 'shard'))
+        cache.set(SHARD_MAP_CACHE_KEY, shards, settings.SHARD_MAP_CACHE_SECONDS)
+    return shards
+
+
+def forget_college_shards():
+    cache.delete(SHARD_MAP_CACHE_KEY)
+
+
+def shard_of_college(college_id):
+    if not is_enabled():
+        return 'default'
+    return college_shards().get(college_id, 'default')
+
+
+def shards_of_colleges(college_ids):
+    return ordered(shard_of_college(college_id) for college_id in college_ids) or ['default']
+
+
+@contextmanager
+def use_shard(alias):
+    """Send sharded queries in the block to alias, whatever the request says"""
+    token = _shard.set(alias)
+    try:
+        yield
+    finally:
+        _shard.reset(token)
+
+
+def request_shards(request=None):
+    """
+    The shards the current request may touch, the one to use first. Resolved
+    on the first sharded query and kept on the request, so it costs one role
+    lookup per request (and one probe per shard for papers of users whose
+    colleges span several).
+    """
+    alias = _shard.get()
+    if alias is not None:
+        return [alias]
+    request = request or _request.get()
+    if request is None or not is_enabled():
+        return ['default']
+
+    user = getattr(request, 'user', None)
+    user_id = user.pk if user is not None and user.is_authenticated else None
+    # Authentication may happen after the first query, e.g. in DRF views
+    resolved = getattr(request, '_shards', None)
+    if resolved is None or resolved[0] != user_id:
+        resolved = (user_id, _resolve(request, user if user_id is not None else None))
+        request._shards = resolved
+    return resolved[1]
+
+
+def current_shard():
+    return request_shards()[0]
+
+
+def _requested_college(request):
+    params = request.GET
+    if '_changelist_filters' in params:
+        # Admin change pages carry their changelist's filters along
+        params = QueryDict(params['_changelist_filters'])
+    for key, value in params.items():
+        if (key == 'college_id' or key.endswith('college__id__exact')) and value.isdigit():
+            return int(value)
+    return None
+
+
+def _resolve(request, user):
+    shards = college_shards()
+    college_id = _requested_college(request)
+    if college_id in shards:
+        return [shards[college_id]]
+    if user is None:
+        return ['default']
+
+    if user.is_superuser:
+        candidates = list(settings.DATABASE_SHARDS)
+    else:
+        college_ids = UserRole.objects.using('default').filter(
+            user=user, is_active=True,
+        ).values_list('college_id', flat=True)
+        candidates = ordered(shards[college_id] for college_id in college_ids if college_id in shards)
+    if not candidates:
+        return ['default']
+
+    match = getattr(request, 'resolver_match', None)
+    if len(candidates) > 1 and match is not None and match.func.__module__.startswith('academics.'):
+        for kwarg in ('pk', 'pyq_id'):
+            if kwarg in match.kwargs:
+                return [locate(PreviousYearQuestion, match.kwargs[kwarg], candidates)]
+    return candidates
+
+
+def locate(model, pk, shards=None):
+    """The shard among shards (the request's by default) holding row pk of model, else the first"""
+    shards = shards or request_shards()
+    if len(shards) > 1 and str(pk).isdigit():
+        for alias in shards:
+            if model._base_manager.using(alias).filter(pk=pk).exists():
+                return alias
+    return shards[0]
+
+
+class ShardMiddleware:
+    """Makes the request visible to ShardRouter, which resolves its shard lazily"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        token = _request.set(request)
+        try:
+            return self.get_response(request)
+        finally:
+            _request.reset(token)
+
+    async def __acall__(self, request):
+        token = _request.set(request)
+        try:
+            return await self.get_response(request)
+        finally:
+            _request.reset(token)
+
+
+class ShardRouter:
+    """
+    Send sharded models to the shard of the object they come from, or of
+    the current request; the directory, and anything on default, is left
+    to the routers after this one (so default keeps its read replicas).
+    """
+
+    def _route(self, model, hints):
+        if not is_enabled() or not is_sharded(model):
+            return None
+        instance = hints.get('instance')
+        if instance is not None and is_sharded(type(instance)) and instance._state.db in settings.DATABASE_SHARDS:
+            alias = instance._state.db
+        else:
+            alias = current_shard()
+        return None if alias == 'default' else alias
+
+    def db_for_read(self, model, **hints):
+        return self._route(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self._route(model, hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if is_enabled() and is_sharded(type(obj1)) and is_sharded(type(obj2)):
+            # Replicas hold default's rows
+            shard1, shard2 = (
+                obj._state.db if obj._state.db in settings.DATABASE_SHARDS else 'default' for obj in (obj1, obj2)
+            )
+            if shard1 != shard2:
+                return False
+        return None
+
+
+class _Descending:
+    """Inverts the order of a sort key component"""
+
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+
+def _value(obj, path):
+    if isinstance(obj, dict):
+        return obj.get(path)
+    *names, last = path.split('__')
+    for name in names:
+        if obj is None:
+            return None
+        obj = getattr(obj, name)
+    if obj is None:
+        return None
+    # Order by a foreign key's id without fetching the related row
+    obj = getattr(obj, f'{last}_id') if hasattr(obj, f'{last}_id') else getattr(obj, last)
+    return obj.pk if isinstance(obj, models.Model) else obj
+
+
+class FanOutQuerySet:
+    """
+    One queryset run on several shards, for users whose colleges span them.
+    Filtering and ordering apply to every shard, and results are merged in
+    the queryset's order, so a page costs one query per shard for at most
+    offset + limit rows. Text sorts in Python's order, which can differ from
+    the database collation for mixed-case values. Read-only.
+    """
+
+    _CHAINED = {
+        'all', 'filter', 'exclude', 'order_by', 'select_related', 'prefetch_related',
+        'annotate', 'distinct', 'only', 'defer', 'none', 'values',
+    }
+
+    def __init__(self, queryset, shards):
+        self.queryset = queryset
+        self.shards = shards
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        if name in self._CHAINED:
+            method = getattr(self.queryset, name)
+            return lambda *args, **kwargs: FanOutQuerySet(method(*args, **kwargs), self.shards)
+        # model, query, ordered and the like are the same on every shard
+        return getattr(self.queryset, name)
+
+    def __repr__(self):
+        return f'<FanOutQuerySet {self.shards} {self.queryset.query}>'
+
+    def parts(self):
+        return [self.queryset.using(alias) for alias in self.shards]
+
+    def count(self):
+        return sum(part.count() for part in self.parts())
+
+    def exists(self):
+        return any(part.exists() for part in self.parts())
+
+    def __bool__(self):
+        return self.exists()
+
+    def _sort_key(self):
+        query = self.queryset.query
+        ordering = list(query.order_by) or (list(query.get_meta().ordering) if query.default_ordering else [])
+        columns = [
+            (field.lstrip('-'), field.startswith('-'))
+            for field in ordering if isinstance(field, str) and field != '?'
+        ] or [('pk', False)]
+        nulls_largest = connections[self.shards[0]].features.nulls_order_largest
+
+        def key(obj):
+            values = []
+            for path, descending in columns:
+                value = _value(obj, path)
+                value = (value is None, value) if nulls_largest else (value is not None, value)
+                values.append(_Descending(value) if descending else value)
+            return tuple(values)
+        return key
+
+    def _merged(self, limit=None):
+        parts = self.parts() if limit is None else [part[:limit] for part in self.parts()]
+        return heapq.merge(*parts, key=self._sort_key())
+
+    def __iter__(self):
+        return iter(self._merged())
+
+    async def _aiter(self):
+        for obj in await sync_to_async(list)(self):
+            yield obj
+
+    def __aiter__(self):
+        return self._aiter()
+
+    def __getitem__(self, k):
+        if isinstance(k, slice):
+            return list(islice(self._merged(k.stop), k.start or 0, k.stop))
+        return self[k:k + 1][0]
+
+
+def fan_out(queryset, shards=None):
+    """
+    queryset, to run on shards (the request's by default): as it is on the
+    current shard, pinned to another, or as a FanOutQuerySet over several.
+    """
+    shards = request_shards() if shards is None else shards
+    if len(shards) > 1:
+        return FanOutQuerySet(queryset, shards)
+    if shards[0] != current_shard():
+        return queryset.using(shards[0])
+    return queryset
+
+
+class FanOutMixin:
+    """Mixin for list views: run the filtered queryset on every shard of the request"""
+
+    def filter_queryset(self, queryset):
+        return fan_out(super().filter_queryset(queryset))
+
+
+def per_shard(queryset):
+    """The querysets to run for queryset, one per shard, each pinned to its database"""
+    if isinstance(queryset, FanOutQuerySet):
+        return queryset.parts()
+    return [queryset.using(queryset.db)]
+
+
+def copy_rows(model, objs, using, batch_size=500):
+    """
+    INSERT model instances into the using database as they are, primary keys
+    and auto_now timestamps included, like loaddata. No signals are sent.
+    """
+    fields = model._meta.local_concrete_fields
+    batch_size = max(min(batch_size, connections[using].ops.bulk_batch_size(fields, objs)), 1)
+    for start in range(0, len(objs), batch_size):
+        model._base_manager.using(using)._insert(objs[start:start + batch_size], fields=fields, raw=True, using=using)
+
+
+def mirror(model, pks, shards=None):
+    """
+    Make the directory rows pks of model on shards (all but default by
+    default) match default, deleting those default no longer has; deleting a
+    user or college there cascades to its sharded rows, as it did on default.
+    """
+    objs = list(model._base_manager.using('default').filter(pk__in=pks))
+    found = {obj.pk for obj in objs}
+    fields = [field.name for field in model._meta.local_concrete_fields if not field.primary_key]
+    for alias in shards or [alias for alias in settings.DATABASE_SHARDS if alias != 'default']:
+        manager = model._base_manager.using(alias)
+        existing = set(manager.filter(pk__in=found).values_list('pk', flat=True))
+        manager.bulk_update([obj for obj in objs if obj.pk in existing], fields, batch_size=500)
+        copy_rows(model, [obj for obj in objs if obj.pk not in existing], alias)
+        gone = set(pks) - found
+        if gone:
+            manager.filter(pk__in=gone).delete()
+
+
+def mirror_later(model, pks):
+    """Mirror directory rows once default's current transaction commits"""
+    if is_enabled() and model in DIRECTORY_MODELS and pks:
+        pks = list(pks)
+        transaction.on_commit(lambda: mirror(model, pks), using='default', robust=True)
+        if model is College:
+            transaction.on_commit(forget_college_shards, using='default')
+
+
+def sync_directory(shards=None, batch_size=1000):
+    """Mirror the whole directory into shards; returns the number of rows per model"""
+    counts = {}
+    for model in DIRECTORY_MODELS:
+        pks = list(model._base_manager.using('default').order_by('pk').values_list('pk', flat=True))
+        for start in range(0, len(pks), batch_size):
+            mirror(model, pks[start:start + batch_size], shards)
+        counts[model._meta.label] = len(pks)
+    return counts
+
+
+def _directory_changed(sender, instance, using, **kwargs):
+    if using != 'default' or kwargs.get('raw'):
+        return
+    # Logins touch nothing the shards read
+    if kwargs.get('update_fields') == frozenset({'last_login'}):
+        return
+    mirror_later(sender, [instance.pk])
+
+
+for _model in DIRECTORY_MODELS:
+    post_save.connect(_directory_changed, sender=_model, dispatch_uid=f'shard-mirror-save-{_model._meta.label}')
+    post_delete.connect(_directory_changed, sender=_model, dispatch_uid=f'shard-mirror-delete-{_model._meta.label}')
+
+
+def reserve_id_blocks(using):
+    """
+    Start the id sequences of sharded tables on shard number n (its place in
+    DATABASE_SHARDS) at n * SHARD_ID_BLOCK, so ids are unique across shards
+    and a college's rows keep theirs when it moves. Sequences never go back.
+    """
+    index = settings.DATABASE_SHARDS.index(using)
+    if not index:
+        return
+    start = index * settings.SHARD_ID_BLOCK
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        for model in sharded_models():
+            if model._meta.auto_field is None:
+                continue
+            table, column = model._meta.db_table, model._meta.pk.column
+            if connection.vendor == 'postgresql':
+                cursor.execute(
+                    f'SELECT setval(pg_get_serial_sequence(%s, %s), GREATEST(%s, '
+                    f'(SELECT COALESCE(MAX({connection.ops.quote_name(column)}), 0) + 1 '
+                    f'FROM {connection.ops.quote_name(table)})), false)',
+                    [table, column, start],
+                )
+            elif connection.vendor == 'sqlite':
+                cursor.execute('UPDATE sqlite_sequence SET seq = MAX(seq, %s) WHERE name = %s', [start - 1, table])
+                cursor.execute(
+                    'INSERT INTO sqlite_sequence (name, seq) SELECT %s, %s '
+                    'WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = %s)',
+                    [table, start - 1, table],
+                )
+            else:
+                logger.warning('Cannot reserve an id block for %s on %s', table, connection.vendor)
+
+
+def reserve_id_blocks_after_migrate(using, **kwargs):
+    if using in settings.DATABASE_SHARDS:
+        reserve_id_blocks(using)
+
+
+def college_rows(college, using):
+    """Every sharded row of the college on the shard using, parents first"""
+    paper = {'pyq__subject__branch__college': college}
+    return [
+        Branch.objects.using(using).filter(college=college),
+        Subject.objects.using(using).filter(branch__college=college),
+        PreviousYearQuestion.objects.using(using).filter(subject__branch__college=college),
+        Bookmark.objects.using(using).filter(**paper),
+        PaperFingerprint.objects.using(using).filter(**paper),
+        SimilarityBucket.objects.using(using).filter(**paper),
+        # Links to other colleges' papers can't follow the college to another shard
+        DuplicateCandidate.objects.using(using).filter(**paper, duplicate_of__subject__branch__college=college),
+        RelatedPYQ.objects.using(using).filter(**paper, related__subject__branch__college=college),
+        ModerationEvent.objects.using(using).filter(college=college),
+        ArchivePack.objects.using(using).filter(papers__college=college).distinct(),
+        ArchivedPYQ.objects.using(using).filter(college=college),
+        UsageEvent.objects.using(using).filter(college=college),
+        DailyUsage.objects.using(using).filter(college=college),
+    ]
+
+
+def _purge_college(college, using, batch_size):
+    """Delete the college's sharded rows from one shard, children first"""
+    for queryset in reversed(college_rows(college, using)):
+        if queryset.model is ArchivePack:
+            # Packs are shared with other colleges' papers; drop only unused ones
+            queryset = ArchivePack.objects.using(using).filter(
+                id__in=list(queryset.values_list('id', flat=True)), papers__isnull=True,
+            )
+        pks = list(queryset.order_by().values_list('pk', flat=True))
+        for start in range(0, len(pks), batch_size):
+            queryset.model._base_manager.using(using).filter(pk__in=pks[start:start + batch_size]).delete()
+
+
+def _rows_match(source_rows, target_rows, batch_size):
+    """Whether two shards hold the same rows, compared column by column"""
+    columns = [field.attname for field in source_rows.model._meta.local_concrete_fields]
+    rows = [
+        queryset.order_by('pk').values_list(*columns).iterator(chunk_size=batch_size)
+        for queryset in (source_rows, target_rows)
+    ]
+    return all(source_row == target_row for source_row, target_row in zip_longest(*rows))
+
+
+def move_college(college, target, batch_size=1000, log=None):
+    """
+    Move a college's sharded rows to the target shard, keeping their ids.
+    The college is deactivated while it moves, hiding it from its users: its
+    rows are copied in one transaction and counted, College.shard is switched,
+    and once every process has seen the switch (SHARD_MAP_CACHE_SECONDS) the
+    originals are deleted, unless any of them changed after the copy, which
+    raises RuntimeError instead. Re-running after an interruption is safe;
+    the copy starts over. Returns {model label: rows moved}.
+    """
+    log = log or (lambda message: None)
+    source = college.shard
+    if source == target:
+        raise ValueError(f'{college} is already on {target}')
+    was_active = college.is_active
+
+    College.objects.filter(pk=college.pk).update(is_active=False)
+    mirror(College, [college.pk])
+    try:
+        log(f'Syncing the directory to {target}')
+        sync_directory([target], batch_size)
+
+        counts = {}
+        with transaction.atomic(using=target):
+            # Rows left by an interrupted move
+            _purge_college(college, target, batch_size)
+            existing_packs = set(ArchivePack.objects.using(target).values_list('id', flat=True))
+            for queryset in college_rows(college, source):
+                model = queryset.model
+                copied, batch = 0, []
+                for obj in queryset.order_by('pk').iterator(chunk_size=batch_size):
+                    if model is ArchivePack and obj.pk in existing_packs:
+                        continue
+                    batch.append(obj)
+                    if len(batch) >= batch_size:
+                        copy_rows(model, batch, target)
+                        copied, batch = copied + len(batch), []
+                copy_rows(model, batch, target)
+                counts[model._meta.label] = copied + len(batch)
+                log(f'Copied {counts[model._meta.label]} {model._meta.verbose_name_plural}')
+
+            for source_rows, target_rows in zip(college_rows(college, source), college_rows(college, target)):
+                if source_rows.model is not ArchivePack and source_rows.count() != target_rows.count():
+                    raise RuntimeError(f'{source_rows.model._meta.label} rows differ after the copy; nothing was moved')
+
+        College.objects.filter(pk=college.pk).update(shard=target)
+        mirror(College, [college.pk])
+        forget_college_shards()
+        # Processes with a local cache keep routing to the source until their copy expires
+        time.sleep(settings.SHARD_MAP_CACHE_SECONDS)
+
+        # Inactive colleges take no uploads, bookmarks or moderation, but anything
+        # else written to the source since the copy would be lost with it
+        changed = [
+            source_rows.model._meta.label
+            for source_rows, target_rows in zip(college_rows(college, source), college_rows(college, target))
+            if source_rows.model is not ArchivePack and not _rows_match(source_rows, target_rows, batch_size)
+        ]
+        if changed:
+            raise RuntimeError(
+                f'{", ".join(changed)} changed on {source} after the copy, so its rows there were not '
+                f'deleted; {college} is now served from {target}. Copy the changes over before deleting them.'
+            )
+
+        with transaction.atomic(using=source):
+            _purge_college(college, source, batch_size)
+        log(f'Deleted the originals from {source}')
+    finally:
+        College.objects.filter(pk=college.pk).update(is_active=was_active)
+        mirror(College, [college.pk])
+    return counts
@@ -0,0 +1,95 @@
+import csv
+import io
+import os
+import tempfile
+
+from openpyxl import Workbook, load_workbook
+
+
+def _normalize_header(value):
+    return str(value or '').strip().lower().replace(' ', '_')
+
+
+def iter_rows(fileobj, filename):
+    """
+    Yield each data row of a CSV or XLSX sheet as a dict keyed by its
+    normalized header (lower-case, spaces replaced by underscores).
+    """
+    _, ext = os.path.splitext(filename.lower())
+
+    if ext in ('.xlsx', '.xlsm'):
+        # Read-only mode streams rows instead of loading the whole workbook
+        workbook = load_workbook(fileobj, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            header = [_normalize_header(cell) for cell in next(rows, [])]
+            for values in rows:
+                if not any(values):
+                    continue
+                yield {
+                    key: ('' if value is None else str(value).strip())
+                    for key, value in zip(header, values) if key
+                }
+        finally:
+            workbook.close()
+        return
+
+    if ext != '.csv':
+        raise ValueError(f'Unsupported spreadsheet format: {filename}')
+
+    if isinstance(fileobj.read(0), bytes):
+        fileobj = io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
+
+    reader = csv.reader(fileobj)
+    header = [_normalize_header(cell) for cell in next(reader, [])]
+    for values in reader:
+        if not any(values):
+            continue
+        yield {
+            key: value.strip()
+            for key, value in zip(header, values) if key
+        }
+
+
+class _Echo:
+    """Pseudo-buffer for csv.writer: write() hands back the formatted line"""
+
+    def write(self, value):
+        return value
+
+
+def csv_chunks(header, rows, rows_per_chunk=500):
+    """
+    Encode a header and rows as UTF-8 CSV, yielding a few hundred rows at a
+    time. Only the current chunk is ever held in memory.
+    """
+    writer = csv.writer(_Echo())
+    # The BOM makes Excel read the file as UTF-8
+    yield ('\ufeff' + writer.writerow(header)).encode()
+    lines = []
+    for row in rows:
+        lines.append(writer.writerow(row))
+        if len(lines) >= rows_per_chunk:
+            yield ''.join(lines).encode()
+            lines = []
+    if lines:
+        yield ''.join(lines).encode()
+
+
+def xlsx_chunks(header, rows, title='Sheet', chunk_size=64 * 1024):
+    """
+    Write a header and rows with openpyxl's write-only mode, which spools
+    rows to a temporary file instead of keeping cells in memory, then yield
+    the finished workbook in chunks. An XLSX file is a zip whose directory
+    comes last, so nothing can be sent before the last row is written.
+    """
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title)
+    sheet.append(header)
+    for row in rows:
+        sheet.append(row)
+    with tempfile.TemporaryFile() as output:
+        workbook.save(output)
+        output.seek(0)
+        while chunk := output.read(chunk_size):
+            yield chunk
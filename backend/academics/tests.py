@@ -1,3 +1,1870 @@
-from django.test import TestCase
+import hashlib
+import io
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from datetime import timedelta
+from importlib import import_module
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import boto3
+from asgiref.sync import async_to_sync
+from django.apps import apps as django_apps
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.conf import settings
+from django.db import DatabaseError, connection, connections
+from django.http import HttpResponse
+from django.urls import path
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from openpyxl import load_workbook
+from PIL import Image, ImageDraw, ImageEnhance
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+try:
+    from moto import mock_aws
+except ImportError:  # moto provides the local S3 stand-in for these tests
+    mock_aws = None
+
+from pyqachu_backend import urls as project_urls
+from pyqachu_backend.metrics import PendingQueueCollector
+from pyqachu_backend.pagination import EstimatedCountPaginator
+from pyqachu_backend.db_routers import ReplicaRouter, replica_reads, mark_recent_write
+from pyqachu_backend.query_detector import QueryDetectorMiddleware, normalize_sql
+from . import async_views
+from .archive import RestoreError, archive_batch, restore
+from .admin import update_in_chunks
+from .counters import flush_counters, record_access
+from .uploads import PaperInspector, PaperUploadHandler
+from .duplicates import get_scan_queue, scan_queued
+from .serializers import BookmarkSerializer
+from .signing import sign_download
+from .management.commands.generate_dataset import dummy_pdf
+from .events import flush_events
+from .paper_cache import PaperCache, get_paper_cache
+from .sharding import reserve_id_blocks, use_shard
+from .models import (
+    College, Branch, Subject, PreviousYearQuestion, UserRole, Bookmark, UsageEvent, DailyUsage, ModerationEvent,
+    RelatedPYQ, PaperFingerprint, DuplicateCandidate, ArchivePack, ArchivedPYQ,
+)
+
+
+TEST_PDF = dummy_pdf('Test paper', 1000, random.Random(0))
+
+@override_settings(DATABASE_REPLICAS=['replica1'], DATABASE_STICKY_SECONDS=10)
+class ReplicaRouterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.router = ReplicaRouter()
+        self.college = College.objects.create(name='Test College')
+        self.moderator = User.objects.create_user('moderator', password='x')
+        UserRole.objects.create(user=self.moderator, college=self.college, role='moderator')
+        subject = Subject.objects.create(
+            branch=Branch.objects.create(college=self.college, name='CSE'), name='Networks'
+        )
+        self.pyq = PreviousYearQuestion.objects.create(
+            subject=subject, year=2023, semester=5, paper_file='CN1.pdf', uploaded_by=self.moderator
+        )
+
+    def test_reads_default_outside_read_only_views(self):
+        self.assertEqual(self.router.db_for_read(PreviousYearQuestion), 'default')
+
+    def test_reads_use_replica_inside_read_only_views(self):
+        with replica_reads(self.moderator):
+            self.assertEqual(self.router.db_for_read(PreviousYearQuestion), 'replica1')
+            self.assertEqual(self.router.db_for_write(PreviousYearQuestion), 'default')
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_reads_default_without_replicas(self):
+        with replica_reads(self.moderator):
+            self.assertEqual(self.router.db_for_read(PreviousYearQuestion), 'default')
+
+    def test_recent_writer_reads_from_primary(self):
+        mark_recent_write(self.moderator)
+        with replica_reads(self.moderator):
+            self.assertEqual(self.router.db_for_read(PreviousYearQuestion), 'default')
+
+        other = User.objects.create_user('student', password='x')
+        with replica_reads(other):
+            self.assertEqual(self.router.db_for_read(PreviousYearQuestion), 'replica1')
+
+    def test_moderation_pins_moderator_to_primary(self):
+        client = APIClient()
+        client.force_authenticate(self.moderator)
+        response = client.post(
+            f'/api/pyqs/{self.pyq.id}/moderate-action/', {'action': 'approve'}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+
+        with replica_reads(self.moderator):
+            self.assertEqual(self.router.db_for_read(PreviousYearQuestion), 'default')
+
+
+S3_STORAGES = {
+    'default': {
+        'BACKEND': 'storages.backends.s3.S3Storage',
+        'OPTIONS': {
+            'bucket_name': 'pyq-papers',
+            'region_name': 'us-east-1',
+            'file_overwrite': False,
+            'querystring_auth': True,
+            'querystring_expire': 300,
+            'signature_version': 's3v4',
+        },
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+
+
+@unittest.skipIf(mock_aws is None, 'moto is not installed')
+@override_settings(STORAGES=S3_STORAGES, PAPER_URL_EXPIRE_SECONDS=300)
+class ObjectStorageTests(TestCase):
+    def setUp(self):
+        env = mock.patch.dict(os.environ, {
+            'AWS_ACCESS_KEY_ID': 'testing',
+            'AWS_SECRET_ACCESS_KEY': 'testing',
+            'AWS_DEFAULT_REGION': 'us-east-1',
+        })
+        env.start()
+        self.addCleanup(env.stop)
+        aws = mock_aws()
+        aws.start()
+        self.addCleanup(aws.stop)
+
+        self.s3 = boto3.client('s3', region_name='us-east-1')
+        self.s3.create_bucket(Bucket='pyq-papers')
+
+        self.college = College.objects.create(name='Test College')
+        self.student = User.objects.create_user('student', password='x')
+        UserRole.objects.create(user=self.student, college=self.college, role='student')
+        self.subject = Subject.objects.create(
+            branch=Branch.objects.create(college=self.college, name='CSE'), name='Networks'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.student)
+
+    def upload(self):
+        response = self.client.post('/api/pyqs/upload/', {
+            'subject': self.subject.id,
+            'year': 2023,
+            'semester': 5,
+            'paper_file': SimpleUploadedFile('cn.pdf', TEST_PDF, content_type='application/pdf'),
+        }, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        return PreviousYearQuestion.objects.get(subject=self.subject)
+
+    def test_upload_stores_paper_in_bucket(self):
+        pyq = self.upload()
+        body = self.s3.get_object(Bucket='pyq-papers', Key=pyq.paper_file.name)['Body'].read()
+        self.assertEqual(body, TEST_PDF)
+
+    def test_download_redirects_to_presigned_url(self):
+        pyq = self.upload()
+        PreviousYearQuestion.objects.filter(id=pyq.id).update(status='approved')
+
+        response = self.client.get(f'/api/pyqs/{pyq.id}/download/?download=true')
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('pyq-papers', response['Location'])
+        self.assertIn('X-Amz-Expires=300', response['Location'])
+        self.assertIn('attachment', response['Location'])
+
+    def test_redirects_spend_the_download_byte_budget(self):
+        pyq = self.upload()
+        self.assertEqual(pyq.file_size, len(TEST_PDF))
+        PreviousYearQuestion.objects.filter(id=pyq.id).update(status='approved', file_size=None)
+        cache.clear()
+
+        rates = {'download': {'bytes': f'{len(TEST_PDF) + 1}/hour'}}
+        with override_settings(THROTTLE_ENABLED=True, THROTTLE_RATES=rates):
+            # Papers from before file_size was recorded ask the bucket once
+            self.assertEqual(self.client.get(f'/api/pyqs/{pyq.id}/download/').status_code, 302)
+            self.assertEqual(PreviousYearQuestion.objects.get(id=pyq.id).file_size, len(TEST_PDF))
+            self.assertEqual(self.client.get(f'/api/pyqs/{pyq.id}/download/').status_code, 302)
+            response = self.client.get(f'/api/pyqs/{pyq.id}/download/')
+            self.assertEqual(response.status_code, 429)
+
+            # The async view charges redirects the same way
+            cache.clear()
+            token = Token.objects.create(user=self.student)
+            download = async_to_sync(async_views.pyq_download)
+            statuses = [
+                download(
+                    RequestFactory().get(f'/api/pyqs/{pyq.id}/download/', HTTP_AUTHORIZATION=f'Token {token.key}'),
+                    pk=pyq.id,
+                ).status_code
+                for _ in range(3)
+            ]
+        self.assertEqual(statuses, [302, 302, 429])
+
+    def test_download_checks_permissions_before_redirecting(self):
+        pyq = self.upload()
+
+        # Still pending, so a student can't get a URL for it
+        response = self.client.get(f'/api/pyqs/{pyq.id}/download/')
+        self.assertEqual(response.status_code, 403)
+
+        outsider = APIClient()
+        outsider.force_authenticate(User.objects.create_user('outsider', password='x'))
+        PreviousYearQuestion.objects.filter(id=pyq.id).update(status='approved')
+        response = outsider.get(f'/api/pyqs/{pyq.id}/download/')
+        self.assertEqual(response.status_code, 403)
+
+
+class PaperCacheTests(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.storage = FileSystemStorage(location=os.path.join(self.root, 'bucket'))
+        self.cache = PaperCache(os.path.join(self.root, 'cache'), max_bytes=2500)
+
+    def paper(self, name, size=1000):
+        if not self.storage.exists(name):
+            self.storage.save(name, ContentFile(name.encode().ljust(size, b'.')))
+        return SimpleNamespace(name=name, storage=self.storage)
+
+    def read(self, paper):
+        with self.cache.open(paper) as f:
+            return f.read()
+
+    def test_hit_and_miss(self):
+        paper = self.paper('cn1.pdf')
+        self.assertTrue(self.read(paper).startswith(b'cn1.pdf'))
+        self.assertTrue(self.read(paper).startswith(b'cn1.pdf'))
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['files'], stats['bytes']), (1, 1, 1, 1000))
+
+        # A removed file is fetched again rather than failing
+        os.remove(self.cache._path(self.cache._key(paper.name)))
+        self.assertTrue(self.read(paper).startswith(b'cn1.pdf'))
+        self.assertEqual(self.cache.stats()['misses'], 2)
+
+    def test_evicts_least_recently_used_past_the_byte_budget(self):
+        first, second, third = self.paper('cn1.pdf'), self.paper('cn2.pdf'), self.paper('cn3.pdf')
+        self.read(first)
+        self.read(second)
+        self.read(first)  # second is now the least recently used
+        self.read(third)
+
+        stats = self.cache.stats()
+        self.assertEqual((stats['evictions'], stats['files'], stats['bytes']), (1, 2, 2000))
+        self.assertFalse(os.path.exists(self.cache._path(self.cache._key(second.name))))
+        self.read(first)
+        self.assertEqual(self.cache.stats()['hits'], 2)
+
+        # A restarted cache indexes what is on disk and keeps to its budget
+        reloaded = PaperCache(self.cache.directory, max_bytes=1000)
+        self.assertEqual(reloaded.stats()['files'], 1)
+
+    def test_failed_fill_leaves_nothing_behind(self):
+        paper = self.paper('cn1.pdf')
+        broken = SimpleNamespace(name=paper.name, storage=mock.Mock())
+        broken.storage.open.return_value = mock.MagicMock(
+            __enter__=mock.Mock(return_value=mock.Mock(read=mock.Mock(side_effect=[b'half', OSError('reset')]))),
+        )
+        with self.assertRaises(OSError):
+            self.cache.open(broken)
+        path = self.cache._path(self.cache._key(paper.name))
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(os.listdir(os.path.dirname(path)), [])
+        self.assertEqual(self.cache.stats()['files'], 0)
+
+        self.assertTrue(self.read(paper).startswith(b'cn1.pdf'))
+
+    def test_concurrent_misses_share_one_fetch(self):
+        paper = self.paper('cn1.pdf')
+        release = threading.Event()
+        opened = []
+
+        def slow_open(name, mode):
+            opened.append(name)
+            release.wait(5)
+            return self.storage.open(name, mode)
+
+        slow = SimpleNamespace(name=paper.name, storage=mock.Mock(open=slow_open))
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.read(slow))) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for _ in range(500):
+            if self.cache.stats()['coalesced'] == 3:
+                break
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(opened, [paper.name])
+        self.assertEqual(len(results), 4)
+        self.assertEqual(len(set(results)), 1)
+        stats = self.cache.stats()
+        self.assertEqual((stats['misses'], stats['coalesced']), (1, 3))
+
+    def test_each_worker_gets_its_own_directory(self):
+        root = os.path.join(self.root, 'shared')
+        os.makedirs(os.path.join(root, 'worker-1', 'ab'))
+        with open(os.path.join(root, 'worker-1', 'ab', 'abcd'), 'wb') as f:
+            f.write(b'x' * 100)
+        os.makedirs(os.path.join(root, 'worker-2'))
+        os.makedirs(os.path.join(root, 'worker-3'))
+
+        def is_running(pid):
+            return pid in (os.getpid(), 3)
+
+        with override_settings(PAPER_CACHE_DIR=root), \
+                mock.patch('academics.paper_cache._is_running', is_running), \
+                mock.patch('academics.paper_cache._paper_cache', None):
+            cache = get_paper_cache()
+            self.assertIs(get_paper_cache(), cache)
+
+        # A dead worker's papers are taken over, other dead workers' removed,
+        # and a live worker's directory left alone
+        self.assertEqual(cache.directory, os.path.join(root, f'worker-{os.getpid()}'))
+        self.assertEqual(cache.stats()['bytes'], 100)
+        self.assertEqual(sorted(os.listdir(root)), sorted([f'worker-{os.getpid()}', 'worker-3']))
+
+
+class QueryBudgetTests(TestCase):
+    """
+    Every route runs a fixed number of queries, however many colleges,
+    papers or bookmarks it returns. Each list is measured, the data is
+    grown, and it must come in at the same count and within its budget.
+    """
+
+    def setUp(self):
+        self.student = User.objects.create_user('student', password='x')
+        self.moderator = User.objects.create_user('moderator', password='x')
+        self.admin = User.objects.create_user('admin', password='x')
+        self.superuser = User.objects.create_superuser('root', password='x')
+        self.colleges = 0
+        self.grow()
+
+    def grow(self, colleges=2, subjects=2, papers=3):
+        """Add colleges, each with subjects, papers in every status and bookmarks"""
+        for _ in range(colleges):
+            self.colleges += 1
+            college = College.objects.create(name=f'College {self.colleges}')
+            UserRole.objects.create(user=self.student, college=college, role='student')
+            UserRole.objects.create(user=self.moderator, college=college, role='moderator')
+            UserRole.objects.create(user=self.moderator, college=college, role='student')
+            UserRole.objects.create(user=self.admin, college=college, role='admin')
+            branch = Branch.objects.create(college=college, name='CSE', created_by=self.admin)
+            for s in range(subjects):
+                subject = Subject.objects.create(branch=branch, name=f'Subject {s}', created_by=self.admin)
+                for p in range(papers):
+                    for status in ('approved', 'pending'):
+                        pyq = PreviousYearQuestion.objects.create(
+                            subject=subject, year=2020 + p, semester=s + 1, paper_file='CN1.pdf',
+                            uploaded_by=self.student, status=status,
+                            reviewed_by=self.moderator if status == 'approved' else None,
+                        )
+                        if status == 'approved':
+                            Bookmark.objects.create(user=self.student, pyq=pyq)
+        self.college = college
+        self.subject = subject
+        self.approved = PreviousYearQuestion.objects.filter(status='approved').last()
+        self.pending = PreviousYearQuestion.objects.filter(status='pending').last()
+
+    def request(self, user, method, url, data=None, format='json'):
+        client = APIClient()
+        client.force_authenticate(user)
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(client, method)(url, data, format=format)
+        return response, queries
+
+    def assertWithinBudget(self, budget, user, method, url, data=None, status=200, format='json'):
+        response, queries = self.request(user, method, url, data, format)
+        self.assertEqual(response.status_code, status, getattr(response, 'data', None))
+        self.assertLessEqual(
+            len(queries), budget,
+            f'{method.upper()} {url} ran {len(queries)} queries:\n'
+            + '\n'.join(q['sql'] for q in queries.captured_queries)
+        )
+        return len(queries)
+
+    def assertConstantQueries(self, budget, user, url):
+        """The query count of a GET doesn't change as the data behind it grows"""
+        before = self.assertWithinBudget(budget, user, 'get', url)
+        self.grow(colleges=3, subjects=3, papers=4)
+        after = self.assertWithinBudget(budget, user, 'get', url)
+        self.assertEqual(before, after, f'GET {url} grows with the number of rows')
+
+    def test_college_list(self):
+        self.assertConstantQueries(2, self.student, '/api/colleges/')
+        self.assertConstantQueries(2, self.admin, '/api/colleges/')
+        self.assertConstantQueries(1, self.superuser, '/api/colleges/')
+
+    def test_branch_list(self):
+        self.assertConstantQueries(1, self.student, '/api/branches/')
+
+    def test_subject_list(self):
+        self.assertConstantQueries(1, self.student, '/api/subjects/')
+
+    def test_pyq_list(self):
+        self.assertConstantQueries(2, self.student, '/api/pyqs/')
+        self.assertConstantQueries(2, self.moderator, '/api/pyqs/')
+        self.assertConstantQueries(2, self.student, f'/api/pyqs/?subject_id={self.subject.id}&search=Subject')
+
+    def test_pending_list(self):
+        # The papers, then their duplicate flags in one prefetch
+        self.assertConstantQueries(2, self.moderator, '/api/pyqs/pending/')
+        self.assertConstantQueries(2, self.superuser, '/api/pyqs/pending/')
+
+    def test_bookmark_list(self):
+        # The bookmarks, then the user's download grants for signing URLs
+        self.assertConstantQueries(2, self.student, '/api/bookmarks/')
+
+    def test_user_role_info(self):
+        self.assertConstantQueries(2, self.moderator, '/api/user-role-info/')
+        self.assertConstantQueries(1, self.superuser, '/api/user-role-info/')
+
+    def test_user_role_list(self):
+        self.assertConstantQueries(3, self.admin, f'/api/user-roles/?college_id={self.college.id}')
+
+    def test_upload(self):
+        self.assertWithinBudget(6, self.student, 'post', '/api/pyqs/upload/', {
+            'subject': self.subject.id,
+            'year': 2024,
+            'semester': 1,
+            'paper_file': SimpleUploadedFile('paper.pdf', TEST_PDF, content_type='application/pdf'),
+        }, status=201, format='multipart')
+        for pyq in PreviousYearQuestion.objects.filter(year=2024):
+            pyq.paper_file.delete(save=False)
+
+    def test_download(self):
+        with mock.patch('academics.views.FileResponse', return_value=HttpResponse()):
+            self.assertWithinBudget(2, self.student, 'get', f'/api/pyqs/{self.approved.id}/download/')
+
+    def test_moderation(self):
+        # The paper, the role check, the update and the history entry, plus the
+        # savepoint pair that wraps the last two inside the test's transaction
+        self.assertWithinBudget(
+            6, self.moderator, 'patch', f'/api/pyqs/{self.pending.id}/moderate/', {'status': 'approved'}
+        )
+        self.assertWithinBudget(
+            6, self.moderator, 'post', f'/api/pyqs/{self.approved.id}/moderate-action/', {'action': 'reject'}
+        )
+        self.assertWithinBudget(
+            6, self.moderator, 'patch', f'/api/pyqs/{self.approved.id}/update-details/', {'year': 2019}
+        )
+
+    def test_bookmark_toggle_and_status(self):
+        pyq = PreviousYearQuestion.objects.filter(status='approved').first()
+        self.assertWithinBudget(2, self.student, 'get', f'/api/pyqs/{pyq.id}/bookmark-status/')
+        self.assertWithinBudget(4, self.student, 'delete', f'/api/pyqs/{pyq.id}/bookmark/')
+        self.assertWithinBudget(6, self.student, 'post', f'/api/pyqs/{pyq.id}/bookmark/', status=201)
+
+
+class ProfilingTests(TestCase):
+    def setUp(self):
+        self.college = College.objects.create(name='Test College')
+        subject = Subject.objects.create(
+            branch=Branch.objects.create(college=self.college, name='CSE'), name='Networks'
+        )
+        self.student = User.objects.create_user('student', password='x')
+        UserRole.objects.create(user=self.student, college=self.college, role='student')
+        PreviousYearQuestion.objects.create(
+            subject=subject, year=2023, semester=5, paper_file='CN1.pdf',
+            uploaded_by=self.student, status='approved'
+        )
+        self.superuser = User.objects.create_superuser('root', password='x')
+
+    def client_for(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=user).key}')
+        return client
+
+    def test_superuser_gets_profile_report(self):
+        response = self.client_for(self.superuser).get('/api/pyqs/?_profile=1')
+        self.assertEqual(response.status_code, 200)
+        report = response.json()
+        self.assertEqual(report['status'], 200)
+        self.assertGreater(report['sql']['count'], 0)
+        self.assertTrue(all(query['origin'] for query in report['sql']['queries']))
+        self.assertGreater(report['serializer_ms'], 0)
+        self.assertTrue(report['call_tree'])
+
+    def test_queries_point_at_the_code_that_ran_them(self):
+        report = self.client_for(self.superuser).get('/api/user-role-info/?_profile=1').json()
+        self.assertTrue(any(
+            frame.startswith('academics/views.py')
+            for query in report['sql']['queries'] for frame in query['stack']
+        ))
+
+    def test_header_also_enables_profiling(self):
+        response = self.client_for(self.superuser).get('/api/colleges/', HTTP_X_PROFILE='1')
+        self.assertIn('call_tree', response.json())
+
+    def test_flag_is_ignored_for_other_users(self):
+        response = self.client_for(self.student).get('/api/pyqs/?_profile=1')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsInstance(response.json(), list)
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        college = College.objects.create(name='Test College')
+        subject = Subject.objects.create(branch=Branch.objects.create(college=college, name='CSE'), name='Networks')
+        self.student = User.objects.create_user('student', password='x')
+        UserRole.objects.create(user=self.student, college=college, role='student')
+        for status in ('approved', 'pending', 'pending'):
+            PreviousYearQuestion.objects.create(
+                subject=subject, year=2023, semester=5, paper_file='CN1.pdf', uploaded_by=self.student, status=status,
+            )
+        self.client = APIClient()
+        self.client.force_authenticate(self.student)
+
+    def sample(self, name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_registering_the_collector_does_not_query(self):
+        # It is registered at import, which migrate does before the table exists
+        with self.assertNumQueries(0):
+            CollectorRegistry().register(PendingQueueCollector())
+
+        [gauge] = PendingQueueCollector().collect()
+        self.assertEqual(gauge.samples[0].value, 2)
+
+    def test_middleware_records_each_request(self):
+        labels = {'route': 'api/pyqs/', 'method': 'GET'}
+        responses = self.sample('http_responses_total', status='200', **labels)
+        requests = self.sample('http_request_duration_seconds_count', **labels)
+        queries = self.sample('http_request_db_queries_sum', route='api/pyqs/')
+
+        self.assertEqual(self.client.get('/api/pyqs/').status_code, 200)
+        self.assertEqual(self.sample('http_responses_total', status='200', **labels), responses + 1)
+        self.assertEqual(self.sample('http_request_duration_seconds_count', **labels), requests + 1)
+        self.assertGreater(self.sample('http_request_db_queries_sum', route='api/pyqs/'), queries)
+
+        # Requests that match no URL are grouped rather than labelled by path
+        unmatched = self.sample('http_responses_total', route='unmatched', method='GET', status='404')
+        self.client.get('/no-such-page/')
+        self.assertEqual(
+            self.sample('http_responses_total', route='unmatched', method='GET', status='404'), unmatched + 1,
+        )
+
+    def test_middleware_under_asgi(self):
+        labels = {'route': 'api/colleges/', 'method': 'GET', 'status': '403'}
+        before = self.sample('http_responses_total', **labels)
+        response = async_to_sync(self.async_client.get)('/api/colleges/')
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.sample('http_responses_total', **labels), before + 1)
+
+    def test_metrics_view(self):
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], CONTENT_TYPE_LATEST)
+        self.assertIn(b'pyq_pending_queue_depth 2.0', response.content)
+        self.assertIn(b'# TYPE http_request_duration_seconds histogram', response.content)
+
+        with self.settings(METRICS_TOKEN='secret'):
+            self.assertEqual(self.client.get('/metrics').status_code, 403)
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+
+
+class QueryDetectorTests(TestCase):
+    def setUp(self):
+        self.colleges = [College.objects.create(name=f'College {i}') for i in range(6)]
+
+    def test_normalize_sql_ignores_literals_and_in_list_length(self):
+        self.assertEqual(
+            normalize_sql('SELECT * FROM t WHERE id IN (%s, %s, %s) AND name = \'x\' LIMIT 21'),
+            normalize_sql('SELECT * FROM t WHERE id IN (%s) AND name = \'y\' LIMIT 1'),
+        )
+
+    def test_repeated_queries_are_logged_with_their_origin(self):
+        def view(request):
+            for college in self.colleges:
+                College.objects.filter(id=college.id).exists()  # one query per college
+            return HttpResponse()
+
+        request = RequestFactory().get('/api/colleges/')
+        with self.assertLogs('pyqachu_backend.query_detector', 'WARNING') as logs:
+            QueryDetectorMiddleware(view)(request)
+
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn('Possible N+1', logs.output[0])
+        self.assertIn('6 queries', logs.output[0])
+        self.assertIn('academics/tests.py', logs.output[0])
+
+    @override_settings(QUERY_DETECTOR_SLOW_MS=0)
+    def test_slow_queries_are_logged(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user('student', password='x'))
+        with self.assertLogs('pyqachu_backend.query_detector', 'WARNING') as logs:
+            client.get('/api/colleges/')
+        self.assertTrue(all('Slow query in college-list' in line for line in logs.output))
+
+    @override_settings(QUERY_DETECTOR_SAMPLE_RATE=0)
+    def test_unsampled_requests_are_not_inspected(self):
+        view = mock.Mock(return_value=HttpResponse())
+        with mock.patch('pyqachu_backend.query_detector.report') as report:
+            QueryDetectorMiddleware(view)(RequestFactory().get('/'))
+        report.assert_not_called()
+
+
+class DownloadCounterTests(TestCase):
+    def setUp(self):
+        college = College.objects.create(name='Test College')
+        subject = Subject.objects.create(branch=Branch.objects.create(college=college, name='CSE'), name='Networks')
+        self.student = User.objects.create_user('student', password='x')
+        UserRole.objects.create(user=self.student, college=college, role='student')
+        self.popular, self.other = [
+            PreviousYearQuestion.objects.create(
+                subject=subject, year=year, semester=5, paper_file='CN1.pdf',
+                uploaded_by=self.student, status='approved'
+            )
+            for year in (2020, 2023)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.student)
+        flush_counters()
+
+    def download(self, pyq, download=True):
+        with mock.patch('academics.views.FileResponse', return_value=HttpResponse()):
+            response = self.client.get(f'/api/pyqs/{pyq.id}/download/?download={str(download).lower()}')
+        self.assertEqual(response.status_code, 200)
+
+    def test_counts_are_buffered_until_flushed(self):
+        for _ in range(3):
+            self.download(self.popular)
+        self.download(self.popular, download=False)
+        self.download(self.other)
+
+        self.popular.refresh_from_db()
+        self.assertEqual(self.popular.download_count, 0)
+
+        self.assertEqual(flush_counters(), 5)
+        self.popular.refresh_from_db()
+        self.other.refresh_from_db()
+        self.assertEqual((self.popular.download_count, self.popular.view_count), (3, 1))
+        self.assertEqual((self.other.download_count, self.other.view_count), (1, 0))
+
+    def test_failed_flush_keeps_the_counts(self):
+        self.download(self.popular)
+        with mock.patch.object(PreviousYearQuestion.objects, 'filter', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                flush_counters()
+        self.assertEqual(flush_counters(), 1)
+
+    def test_most_downloaded_ordering(self):
+        for _ in range(2):
+            self.download(self.popular)
+        flush_counters()
+
+        response = self.client.get('/api/pyqs/?ordering=-download_count')
+        self.assertEqual([pyq['id'] for pyq in response.json()], [self.popular.id, self.other.id])
+        self.assertEqual(response.json()[0]['download_count'], 2)
+
+
+class UsageEventTests(TestCase):
+    def setUp(self):
+        self.college = College.objects.create(name='Test College')
+        self.subject = Subject.objects.create(
+            branch=Branch.objects.create(college=self.college, name='CSE'), name='Networks'
+        )
+        self.student = User.objects.create_user('student', password='x')
+        UserRole.objects.create(user=self.student, college=self.college, role='student')
+        self.pyq = PreviousYearQuestion.objects.create(
+            subject=self.subject, year=2023, semester=5, paper_file='CN1.pdf',
+            uploaded_by=self.student, status='approved'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.student)
+        # Drop events other tests left in the process buffer
+        flush_events()
+        UsageEvent.objects.all().delete()
+
+    def test_events_are_buffered_and_bulk_inserted(self):
+        with mock.patch('academics.views.FileResponse', return_value=HttpResponse()):
+            self.client.get(f'/api/pyqs/{self.pyq.id}/download/?download=true')
+        self.client.get(f'/api/pyqs/?search=Networks&subject_id={self.subject.id}')
+        self.client.post(f'/api/pyqs/{self.pyq.id}/bookmark/')
+        self.client.delete(f'/api/pyqs/{self.pyq.id}/bookmark/')
+        self.assertFalse(UsageEvent.objects.exists())
+
+        with self.assertNumQueries(1):
+            self.assertEqual(flush_events(), 4)
+
+        events = {event.kind: event for event in UsageEvent.objects.all()}
+        self.assertEqual(set(events), {'download', 'search', 'bookmark', 'unbookmark'})
+        self.assertEqual(events['download'].college_id, self.college.id)
+        self.assertEqual(events['search'].query, 'Networks')
+        self.assertEqual(events['search'].subject_id, self.subject.id)
+
+    def test_rollup_and_retention(self):
+        today = timezone.localdate()
+        old = today - timedelta(days=400)
+        other = User.objects.create_user('other', password='x')
+        for day, user in ((today, self.student), (today, self.student), (today, other), (old, other)):
+            UsageEvent.objects.create(
+                kind='download', day=day, occurred_at=timezone.now(), user=user,
+                college=self.college, subject=self.subject, pyq=self.pyq,
+            )
+
+        call_command('rollup_usage', '--days', '1', stdout=StringIO())
+
+        usage = DailyUsage.objects.get(day=today)
+        self.assertEqual((usage.college_id, usage.subject_id, usage.events, usage.users),
+                         (self.college.id, self.subject.id, 3, 2))
+        self.assertFalse(UsageEvent.objects.filter(day=old).exists())
+
+        # Re-running replaces the day's aggregates rather than adding to them
+        call_command('rollup_usage', '--days', '1', stdout=StringIO())
+        self.assertEqual(DailyUsage.objects.get(day=today).events, 3)
+
+
+class RelatedPYQTests(TestCase):
+    def setUp(self):
+        college = College.objects.create(name='Test College')
+        self.subject = Subject.objects.create(
+            branch=Branch.objects.create(college=college, name='CSE'), name='Networks'
+        )
+        self.users = []
+        for i in range(5):
+            user = User.objects.create_user(f'student{i}', password='x')
+            UserRole.objects.create(user=user, college=college, role='student')
+            self.users.append(user)
+        self.pyqs = [
+            PreviousYearQuestion.objects.create(
+                subject=self.subject, year=2018 + i, semester=5, paper_file=f'CN{i}.pdf',
+                uploaded_by=self.users[0], status='approved'
+            )
+            for i in range(5)
+        ]
+        a, b, c, d, e = self.pyqs
+        for user, pyqs in ((0, [a, b]), (1, [a, b, c]), (2, [a, c]), (3, [e])):
+            for pyq in pyqs:
+                Bookmark.objects.create(user=self.users[user], pyq=pyq)
+        # Downloads count as interactions too
+        for user in (3, 4):
+            UsageEvent.objects.create(
+                kind='download', day=timezone.localdate(), occurred_at=timezone.now(),
+                user=self.users[user], pyq=d,
+            )
+        UsageEvent.objects.create(
+            kind='download', day=timezone.localdate(), occurred_at=timezone.now(), user=self.users[4], pyq=e,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.users[0])
+
+    def build(self, *args):
+        call_command('build_related_pyqs', '--min-common', '2', *args, stdout=StringIO())
+
+    def related_ids(self, pyq):
+        response = self.client.get(f'/api/pyqs/{pyq.id}/related/')
+        self.assertEqual(response.status_code, 200)
+        return [item['id'] for item in response.data]
+
+    def test_related_from_co_bookmarks_and_downloads(self):
+        a, b, c, d, e = self.pyqs
+        self.build()
+
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/pyqs/{a.id}/related/')
+        # a shares two users with both b and c; the tie goes to the lower id
+        self.assertEqual([item['id'] for item in response.data], [b.id, c.id])
+        self.assertAlmostEqual(response.data[0]['similarity'], 2 / 6 ** 0.5, places=4)
+        self.assertEqual(self.related_ids(b), [a.id])
+        self.assertEqual(self.related_ids(d), [e.id])
+
+        # Unapproved papers and papers from other colleges are not listed
+        PreviousYearQuestion.objects.filter(pk=b.id).update(status='rejected')
+        self.assertEqual(self.related_ids(a), [c.id])
+        self.client.force_authenticate(User.objects.create_user('outsider', password='x'))
+        self.assertEqual(self.related_ids(a), [])
+
+    def test_incremental_refresh_only_touches_affected_papers(self):
+        a, b, c, d, e = self.pyqs
+        self.build()
+        an_hour_ago = timezone.now() - timedelta(hours=1)
+        Bookmark.objects.update(created_at=an_hour_ago - timedelta(days=1))
+        UsageEvent.objects.update(day=an_hour_ago.date() - timedelta(days=1), occurred_at=an_hour_ago - timedelta(days=1))
+        RelatedPYQ.objects.update(computed_at=an_hour_ago)
+        self.assertEqual(self.related_ids(b), [a.id])
+
+        Bookmark.objects.create(user=self.users[0], pyq=c)
+        out = StringIO()
+        call_command('build_related_pyqs', '--min-common', '2', stdout=out)
+
+        # Only the papers of users sharing c were recomputed; b and c now share two users
+        self.assertIn('Refreshed 3 papers', out.getvalue())
+        self.assertEqual(self.related_ids(b), [a.id, c.id])
+        self.assertEqual(
+            set(RelatedPYQ.objects.filter(pyq__in=[d, e]).values_list('computed_at', flat=True)), {an_hour_ago}
+        )
+
+
+@override_settings(THROTTLE_ENABLED=True, THROTTLE_RATES={
+    'download': {'user': '100/min', 'ip': '100/min', 'bytes': '1000/hour'},
+    'search': {'user': '2/min', 'ip': '100/min'},
+    'upload': {'user': '2/hour', 'ip': '100/hour'},
+})
+class ThrottlingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        college = College.objects.create(name='Test College')
+        subject = Subject.objects.create(branch=Branch.objects.create(college=college, name='CSE'), name='Networks')
+        self.student = User.objects.create_user('student', password='x')
+        self.other = User.objects.create_user('other', password='x')
+        for user in (self.student, self.other):
+            UserRole.objects.create(user=user, college=college, role='student')
+        self.pyq = PreviousYearQuestion.objects.create(
+            subject=subject, year=2023, semester=5, paper_file='CN1.pdf',
+            uploaded_by=self.student, status='approved'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.student)
+
+    def test_per_user_limit_with_retry_after(self):
+        for _ in range(2):
+            self.assertEqual(self.client.get('/api/pyqs/').status_code, 200)
+
+        # Rejected from the cache alone, before the view runs
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/pyqs/')
+        self.assertEqual(response.status_code, 429)
+        # Until enough of this minute's requests slide out of the window
+        self.assertTrue(1 <= int(response['Retry-After']) <= 120)
+
+        # Other users have their own budget
+        self.client.force_authenticate(self.other)
+        self.assertEqual(self.client.get('/api/pyqs/').status_code, 200)
+
+    def test_download_byte_budget(self):
+        size = os.path.getsize(self.pyq.paper_file.path)
+        with override_settings(THROTTLE_RATES={'download': {'bytes': f'{size + 1}/hour'}}):
+            response = self.client.get(f'/api/pyqs/{self.pyq.id}/download/')
+            self.assertEqual(response.status_code, 200)
+            response.close()
+            # Within the request limits, but the budget is spent
+            response = self.client.get(f'/api/pyqs/{self.pyq.id}/download/')
+            response.close()
+            self.assertEqual(response.status_code, 200)
+            response = self.client.get(f'/api/pyqs/{self.pyq.id}/download/')
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+
+    def test_async_views_are_throttled(self):
+        token = Token.objects.create(user=self.student)
+        request_factory = RequestFactory()
+        responses = [
+            async_to_sync(async_views.pyq_list)(
+                request_factory.get('/api/pyqs/', HTTP_AUTHORIZATION=f'Token {token.key}')
+            )
+            for _ in range(3)
+        ]
+        self.assertEqual([response.status_code for response in responses], [200, 200, 429])
+        self.assertIn('Retry-After', responses[2])
+
+
+class ModerationQueueTests(TestCase):
+    def setUp(self):
+        college = College.objects.create(name='Test College')
+        subject = Subject.objects.create(branch=Branch.objects.create(college=college, name='CSE'), name='Networks')
+        uploader = User.objects.create_user('student', password='x')
+        self.first = User.objects.create_user('mod1', password='x')
+        self.second = User.objects.create_user('mod2', password='x')
+        for moderator in (self.first, self.second):
+            UserRole.objects.create(user=moderator, college=college, role='moderator')
+        self.pyqs = [
+            PreviousYearQuestion.objects.create(
+                subject=subject, year=2015 + i, semester=5, paper_file=f'CN{i}.pdf', uploaded_by=uploader
+            )
+            for i in range(5)
+        ]
+        self.client = APIClient()
+
+    def claim(self, moderator, size):
+        self.client.force_authenticate(moderator)
+        response = self.client.post('/api/pyqs/pending/claim/', {'size': size}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return [pyq['id'] for pyq in response.data['pyqs']]
+
+    def moderate(self, moderator, pyq):
+        self.client.force_authenticate(moderator)
+        return self.client.post(f'/api/pyqs/{pyq.id}/moderate-action/', {'action': 'approve'}, format='json')
+
+    def test_moderators_get_disjoint_batches(self):
+        ids = [pyq.id for pyq in self.pyqs]
+        self.assertEqual(self.claim(self.first, 2), ids[:2])
+        self.assertEqual(self.claim(self.second, 2), ids[2:4])
+        # Claiming again renews the batch instead of growing it
+        self.assertEqual(self.claim(self.first, 2), ids[:2])
+
+        self.assertEqual(self.moderate(self.second, self.pyqs[0]).status_code, 409)
+        self.assertEqual(self.moderate(self.first, self.pyqs[0]).status_code, 200)
+        self.pyqs[0].refresh_from_db()
+        self.assertEqual((self.pyqs[0].status, self.pyqs[0].claimed_by), ('approved', None))
+
+        # The first moderator's lease on the other paper runs out
+        PreviousYearQuestion.objects.filter(pk=ids[1]).update(claim_expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self.claim(self.second, 4), ids[1:5])
+
+        response = self.client.get('/api/pyqs/pending/')
+        self.assertEqual({pyq['claimed_by_username'] for pyq in response.data}, {'mod2'})
+        response = self.client.post('/api/pyqs/pending/release/', {}, format='json')
+        self.assertEqual(response.data['released'], 4)
+        self.assertEqual(self.claim(self.first, 1), [ids[1]])
+
+    def test_skip_locked_path(self):
+        # SQLite ignores FOR UPDATE, so this runs the PostgreSQL query shape
+        with mock.patch.object(connection.features, 'has_select_for_update_skip_locked', True):
+            self.assertEqual(self.claim(self.first, 3), [pyq.id for pyq in self.pyqs[:3]])
+            self.assertEqual(self.claim(self.second, 3), [pyq.id for pyq in self.pyqs[3:]])
+
+    def test_students_cannot_claim(self):
+        self.client.force_authenticate(self.pyqs[0].uploaded_by)
+        self.assertEqual(self.client.post('/api/pyqs/pending/claim/').status_code, 403)
+
+
+class DuplicateDetectionTests(TestCase):
+    TEXT = (
+        'Part A answer all questions each carries three marks explain the layers of the OSI reference model '
+        'compare circuit switching with packet switching what is the purpose of the sliding window protocol '
+        'describe distance vector routing with an example explain congestion control in TCP write short notes '
+        'on the domain name system and on electronic mail protocols derive the efficiency of pure ALOHA'
+    )
+
+    def setUp(self):
+        # Uploads in other tests leave ids in the process queue
+        scan_queued()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_root = override_settings(MEDIA_ROOT=media.name)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+
+        college = College.objects.create(name='Test College')
+        branch = Branch.objects.create(college=college, name='CSE')
+        self.subject = Subject.objects.create(branch=branch, name='Networks')
+        self.other_subject = Subject.objects.create(branch=branch, name='Compilers')
+        student = User.objects.create_user('student', password='x')
+        self.moderator = User.objects.create_user('moderator', password='x')
+        UserRole.objects.create(user=student, college=college, role='student')
+        UserRole.objects.create(user=self.moderator, college=college, role='moderator')
+        self.client = APIClient()
+        self.client.force_authenticate(student)
+
+    def upload(self, name, data, subject=None, year=2023):
+        response = self.client.post('/api/pyqs/upload/', {
+            'subject': (subject or self.subject).id, 'year': year, 'semester': 5,
+            'paper_file': SimpleUploadedFile(name, data),
+        }, format='multipart')
+        self.assertEqual(response.status_code, 201, response.data)
+        return PreviousYearQuestion.objects.latest('pk')
+
+    def flags(self):
+        self.client.force_authenticate(self.moderator)
+        response = self.client.get('/api/pyqs/pending/')
+        return {
+            pyq['id']: [(flag['duplicate_of'], flag['method']) for flag in pyq['possible_duplicates']]
+            for pyq in response.data
+        }
+
+    def page_image(self, size, brightness=1.0, fmt='PNG'):
+        image = Image.new('L', (400, 560), 255)
+        draw = ImageDraw.Draw(image)
+        for i in range(12):
+            draw.rectangle((30 + i * 25, 40 + i * 35, 200 + i * 10, 60 + i * 35), fill=i * 18)
+        image = ImageEnhance.Brightness(image.resize(size)).enhance(brightness)
+        out = io.BytesIO()
+        image.save(out, fmt)
+        return out.getvalue()
+
+    def test_text_near_duplicates_of_the_same_exam(self):
+        original = self.upload('cn.pdf', dummy_pdf(self.TEXT, 3000, random.Random(1)))
+        retyped = self.upload('cn-v2.pdf', dummy_pdf(self.TEXT.replace('three', '3'), 5000, random.Random(2)))
+        other_year = self.upload('cn-2022.pdf', dummy_pdf(self.TEXT, 4000, random.Random(3)), year=2022)
+        unrelated = self.upload('cd.pdf', dummy_pdf('Explain lexical analysis ' * 20, 3000, random.Random(4)))
+        self.assertFalse(DuplicateCandidate.objects.exists())
+
+        self.assertEqual(scan_queued(), 4)
+        flags = self.flags()
+        self.assertEqual(flags[retyped.id], [(original.id, 'text')])
+        self.assertEqual(flags[original.id], [])
+        self.assertEqual(flags[other_year.id], [])
+        self.assertEqual(flags[unrelated.id], [])
+        self.assertGreaterEqual(DuplicateCandidate.objects.get(pyq=retyped).similarity, 0.7)
+
+    def test_rescans_and_identical_files(self):
+        scan = self.upload('scan.png', self.page_image((400, 560)))
+        photo = self.upload('photo.jpg', self.page_image((300, 420), brightness=1.1, fmt='JPEG'))
+        other_college = College.objects.create(name='Other College')
+        other_subject = Subject.objects.create(branch=Branch.objects.create(college=other_college, name='CSE'), name='CN')
+        other = PreviousYearQuestion.objects.create(
+            subject=other_subject, year=2023, semester=5, paper_file='other.png', file_hash=scan.file_hash,
+            uploaded_by=self.moderator,
+        )
+        copy = self.upload('copy.png', self.page_image((400, 560)))
+        elsewhere = self.upload('copy.png', self.page_image((400, 560)), subject=self.other_subject)
+        scan_queued()
+
+        flags = self.flags()
+        self.assertEqual(flags[photo.id], [(scan.id, 'image')])
+        self.assertEqual(sorted(flags[copy.id]), [(scan.id, 'exact'), (photo.id, 'image')])
+        # Like near duplicates, identical files only count within the subject and year
+        self.assertEqual(flags[elsewhere.id], [])
+        self.assertFalse(DuplicateCandidate.objects.filter(duplicate_of=other).exists())
+
+    def test_backfill_command(self):
+        first = self.upload('cn.pdf', dummy_pdf(self.TEXT, 3000, random.Random(1)))
+        second = self.upload('cn-v2.pdf', dummy_pdf(self.TEXT, 5000, random.Random(2)))
+        get_scan_queue()._take()  # as if the worker died before scanning
+
+        call_command('scan_duplicates', stdout=StringIO())
+        self.assertEqual(PaperFingerprint.objects.count(), 2)
+        self.assertEqual(list(DuplicateCandidate.objects.values_list('pyq', 'duplicate_of')), [(second.id, first.id)])
+
+
+class UploadValidationTests(TestCase):
+    def setUp(self):
+        college = College.objects.create(name='Test College')
+        self.subject = Subject.objects.create(branch=Branch.objects.create(college=college, name='CSE'), name='Networks')
+        self.student = User.objects.create_user('student', password='x')
+        UserRole.objects.create(user=self.student, college=college, role='student')
+        self.client = APIClient()
+        self.client.force_authenticate(self.student)
+
+    def upload(self, data, name='paper.pdf'):
+        return self.client.post('/api/pyqs/upload/', {
+            'subject': self.subject.id, 'year': 2024, 'semester': 1,
+            'paper_file': SimpleUploadedFile(name, data),
+        }, format='multipart')
+
+    def test_rejects_files_that_are_not_papers(self):
+        response = self.upload(b'MZ\x90\x00' + b'\x00' * 5000, name='paper.pdf')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('PDF, JPEG or PNG', response.data['detail'])
+        # Cut off before the end of the document
+        response = self.upload(TEST_PDF[:-100])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(PreviousYearQuestion.objects.exists())
+
+    def test_stops_reading_as_soon_as_a_file_is_known_bad(self):
+        received = []
+        original = PaperUploadHandler.receive_data_chunk
+
+        def counting(handler, raw_data, start):
+            received.append(len(raw_data))
+            return original(handler, raw_data, start)
+
+        # A 2 MB upload whose first chunk already has too many pages
+        pages = b''.join(b'%d 0 obj << /Type /Page >> endobj\n' % i for i in range(50))
+        pdf = b'%PDF-1.4\n' + pages + b'%' + b'x' * (2 * 1024 * 1024) + b'\n%%EOF\n'
+        with mock.patch.object(PaperUploadHandler, 'receive_data_chunk', counting):
+            response = self.upload(pdf)
+        self.assertEqual(response.status_code, 400)
+        self.assertLessEqual(sum(received), 64 * 1024)
+
+        # Over the size limit: refused from Content-Length without reading the body
+        received.clear()
+        with override_settings(UPLOAD_LIMITS={'student': {'max_mb': 1, 'max_pages': 40}}):
+            with mock.patch.object(PaperUploadHandler, 'receive_data_chunk', counting):
+                response = self.upload(TEST_PDF + b'%' + b'x' * (2 * 1024 * 1024))
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(received, [])
+
+    def test_page_cap_per_role(self):
+        pages = b''.join(b'%d 0 obj << /Type /Page >> endobj\n' % i for i in range(5))
+        pdf = b'%PDF-1.4\n1 0 obj << /Type /Pages >> endobj\n' + pages + b'%%EOF\n'
+        inspector = PaperInspector(10 ** 6, 40)
+        for start in range(0, len(pdf), 7):  # markers split across chunks
+            inspector.feed(pdf[start:start + 7])
+        inspector.finish()
+        self.assertEqual(inspector.pages, 5)
+
+        with override_settings(UPLOAD_LIMITS={'student': {'max_mb': 1, 'max_pages': 4}}):
+            response = self.upload(pdf)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('at most 4 pages', response.data['detail'])
+
+
+class SignedDownloadTests(TestCase):
+    def setUp(self):
+        college = College.objects.create(name='Test College')
+        subject = Subject.objects.create(branch=Branch.objects.create(college=college, name='CSE'), name='Networks')
+        self.student = User.objects.create_user('student', password='x')
+        UserRole.objects.create(user=self.student, college=college, role='student')
+        self.approved, self.pending = (
+            PreviousYearQuestion.objects.create(
+                subject=subject, year=2023, semester=5, paper_file='CN1.pdf',
+                uploaded_by=self.student, status=status,
+            )
+            for status in ('approved', 'pending')
+        )
+        for pyq in (self.approved, self.pending):
+            Bookmark.objects.create(user=self.student, pyq=pyq)
+        self.client = APIClient()
+        self.client.force_authenticate(self.student)
+
+    def signed_path(self, pyq, **params):
+        query = '&'.join(f'{key}={value}' for key, value in params.items())
+        return f'/api/pyqs/{pyq.id}/download/?{query}'
+
+    def test_list_emits_signed_url_usable_without_credentials(self):
+        url = self.client.get('/api/pyqs/').data[0]['download_url']
+        self.assertIn('signature=', url)
+
+        anonymous = APIClient()
+        # The paper itself is the only query; no user, role or college lookups
+        with self.assertNumQueries(1):
+            response = anonymous.get(url)
+        self.assertEqual(response.status_code, 200)
+        response.close()
+
+    def test_tampered_or_expired_links_are_refused(self):
+        # Links are checked without the database, so they can't be single-use;
+        # what the signature guarantees is that nothing in them can be changed
+        anonymous = APIClient()
+        other = User.objects.create_user('other', password='x')
+        params = sign_download(self.approved.id, self.student.id)
+        response = anonymous.get(self.signed_path(self.approved, **params))
+        self.assertEqual(response.status_code, 200)
+        response.close()
+        # Signed for the student, presented as another user
+        forged = dict(params, user=other.id)
+        self.assertEqual(anonymous.get(self.signed_path(self.approved, **forged)).status_code, 403)
+        # A longer expiry than was signed
+        extended = dict(params, expires=int(params['expires']) + 3600)
+        self.assertEqual(anonymous.get(self.signed_path(self.approved, **extended)).status_code, 403)
+        # Signed for another paper
+        self.assertEqual(anonymous.get(self.signed_path(self.pending, **params)).status_code, 403)
+
+        expired = sign_download(self.approved.id, self.student.id, now=timezone.now().timestamp() - 3600)
+        self.assertEqual(anonymous.get(self.signed_path(self.approved, **expired)).status_code, 403)
+
+    def test_moderating_one_college_signs_no_unapproved_papers_of_another(self):
+        # Moderating any college lists unapproved papers from all of the user's
+        # colleges, but the download rules still apply per college
+        moderator = User.objects.create_user('moderator', password='x')
+        UserRole.objects.create(user=moderator, college=self.approved.subject.branch.college, role='moderator')
+        other_college = College.objects.create(name='Other College')
+        UserRole.objects.create(user=moderator, college=other_college, role='student')
+        subject = Subject.objects.create(branch=Branch.objects.create(college=other_college, name='CSE'), name='OS')
+        other_approved, other_pending = (
+            PreviousYearQuestion.objects.create(
+                subject=subject, year=2022, semester=5, paper_file='CN2.pdf', uploaded_by=self.student, status=status,
+            )
+            for status in ('approved', 'pending')
+        )
+        signed = {self.approved.id: True, self.pending.id: True, other_approved.id: True, other_pending.id: False}
+
+        token = Token.objects.create(user=moderator)
+        client = APIClient(headers={'Authorization': f'Token {token.key}'})
+        request = RequestFactory().get('/api/pyqs/', HTTP_AUTHORIZATION=f'Token {token.key}')
+        for data in (client.get('/api/pyqs/').json(), json.loads(async_to_sync(async_views.pyq_list)(request).content)):
+            self.assertEqual({item['id']: item['download_url'] is not None for item in data}, signed)
+
+    def test_no_url_for_papers_the_user_may_not_download(self):
+        # Bookmarks only list approved papers; check the rules on the nested serializer
+        request = RequestFactory().get('/api/bookmarks/')
+        request.user = self.student
+        serializer = BookmarkSerializer(
+            Bookmark.objects.filter(user=self.student).order_by('pyq_id'), many=True,
+            context={'request': request},
+        )
+        urls = [item['pyq']['download_url'] for item in serializer.data]
+        self.assertIsNotNone(urls[0])
+        self.assertIsNone(urls[1])
+
+    def test_async_download_accepts_signed_url(self):
+        params = sign_download(self.approved.id, self.student.id)
+        request = RequestFactory().get(self.signed_path(self.approved, **params))
+        request.auser = mock.AsyncMock(side_effect=AssertionError('session lookup'))
+        response = async_to_sync(async_views.pyq_download)(request, pk=self.approved.id)
+        self.assertEqual(response.status_code, 200)
+
+        request = RequestFactory().get(self.signed_path(self.pending, **params))
+        response = async_to_sync(async_views.pyq_download)(request, pk=self.pending.id)
+        self.assertEqual(response.status_code, 403)
+
+    def test_async_bookmark_toggle(self):
+        Bookmark.objects.filter(user=self.student, pyq=self.approved).delete()
+        token = Token.objects.create(user=self.student)
+        path = f'/api/pyqs/{self.approved.id}/bookmark/'
+        toggle = async_to_sync(async_views.bookmark_toggle)
+        auth = {'HTTP_AUTHORIZATION': f'Token {token.key}'}
+
+        response = toggle(RequestFactory().post(path, **auth), pyq_id=self.approved.id)
+        self.assertEqual(response.status_code, 201)
+        self.assertIn('signature=', json.loads(response.content)['bookmark']['pyq']['download_url'])
+
+        response = toggle(RequestFactory().delete(path, **auth), pyq_id=self.approved.id)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Bookmark.objects.filter(user=self.student, pyq=self.approved).exists())
+
+
+class AsyncURLconf:
+    """The project's URLs with the async views in front, as with ASYNC_VIEWS under ASGI"""
+    urlpatterns = [
+        path('api/pyqs/', async_views.pyq_list),
+        path('api/pyqs/<int:pyq_id>/bookmark/', async_views.bookmark_toggle),
+        path('api/pyqs/<int:pyq_id>/bookmark-status/', async_views.check_bookmark_status),
+    ] + project_urls.urlpatterns
+
+
+class AsyncViewTests(TestCase):
+    """The async views must answer exactly as the sync views they replace"""
+
+    def setUp(self):
+        college, other_college = College.objects.create(name='Test College'), College.objects.create(name='Other')
+        subject = Subject.objects.create(branch=Branch.objects.create(college=college, name='CSE'), name='Networks')
+        other_subject = Subject.objects.create(
+            branch=Branch.objects.create(college=other_college, name='CSE'), name='Networks',
+        )
+        self.student = User.objects.create_user('student', password='x')
+        UserRole.objects.create(user=self.student, college=college, role='student')
+        self.approved, self.older, self.pending = (
+            PreviousYearQuestion.objects.create(
+                subject=subject, year=year, semester=5, paper_file='CN1.pdf', uploaded_by=self.student, status=status,
+            )
+            for year, status in ((2023, 'approved'), (2022, 'approved'), (2023, 'pending'))
+        )
+        self.elsewhere = PreviousYearQuestion.objects.create(
+            subject=other_subject, year=2023, semester=5, paper_file='CN2.pdf',
+            uploaded_by=self.student, status='approved',
+        )
+        self.auth = {'Authorization': f'Token {Token.objects.create(user=self.student).key}'}
+        self.client = APIClient(headers=self.auth)
+
+    def exchange(self, *calls):
+        """Make the calls against the sync views, then against the async ones from the same state"""
+        sync = [getattr(self.client, method)(path) for method, path in calls]
+        Bookmark.objects.all().delete()
+        with self.settings(ROOT_URLCONF=AsyncURLconf):
+            asynchronous = [
+                async_to_sync(getattr(self.async_client, method))(path, headers=self.auth) for method, path in calls
+            ]
+        return sync, asynchronous
+
+    def test_pyq_list(self):
+        sync, asynchronous = self.exchange(
+            ('get', '/api/pyqs/'), ('get', '/api/pyqs/?year=2022'), ('get', '/api/pyqs/?ordering=year'),
+        )
+        for sync_response, async_response in zip(sync, asynchronous):
+            self.assertEqual(async_response.status_code, 200)
+            sync_data, async_data = sync_response.json(), async_response.json()
+            # Links carry their own expiry, so only check that each one is signed
+            for item in sync_data + async_data:
+                self.assertIn('signature=', item.pop('download_url'))
+            self.assertEqual(async_data, sync_data)
+
+        ids = [item['id'] for item in asynchronous[0].json()]
+        self.assertEqual(ids, [self.approved.id, self.older.id])
+        self.assertEqual([item['id'] for item in asynchronous[1].json()], [self.older.id])
+
+    def test_bookmark_status(self):
+        missing = PreviousYearQuestion.objects.order_by('-id').values_list('id', flat=True)[0] + 1
+        Bookmark.objects.create(user=self.student, pyq=self.approved)
+        with self.settings(ROOT_URLCONF=AsyncURLconf):
+            response = async_to_sync(self.async_client.get)(
+                f'/api/pyqs/{self.approved.id}/bookmark-status/', headers=self.auth,
+            )
+        self.assertEqual(response.json(), {'is_bookmarked': True})
+
+        sync, asynchronous = self.exchange(
+            ('get', f'/api/pyqs/{self.older.id}/bookmark-status/'),
+            ('get', f'/api/pyqs/{missing}/bookmark-status/'),
+        )
+        self.assertEqual([r.status_code for r in asynchronous], [200, 404])
+        self.assertEqual([r.status_code for r in asynchronous], [r.status_code for r in sync])
+        self.assertEqual(asynchronous[0].json(), sync[0].json())
+        self.assertEqual(asynchronous[0].json(), {'is_bookmarked': False})
+
+    def test_bookmark_toggle(self):
+        missing = PreviousYearQuestion.objects.order_by('-id').values_list('id', flat=True)[0] + 1
+        path = f'/api/pyqs/{self.approved.id}/bookmark/'
+        sync, asynchronous = self.exchange(
+            ('post', path), ('post', path), ('delete', path), ('delete', path),
+            ('post', f'/api/pyqs/{self.pending.id}/bookmark/'),
+            ('post', f'/api/pyqs/{self.elsewhere.id}/bookmark/'),
+            ('post', f'/api/pyqs/{missing}/bookmark/'),
+        )
+        self.assertEqual([r.status_code for r in asynchronous], [201, 200, 200, 404, 403, 403, 404])
+        self.assertEqual([r.status_code for r in asynchronous], [r.status_code for r in sync])
+        for sync_response, async_response in zip(sync[:4], asynchronous[:4]):
+            self.assertEqual(async_response.json().get('message'), sync_response.json().get('message'))
+
+        sync_bookmark, async_bookmark = sync[0].json()['bookmark'], asynchronous[0].json()['bookmark']
+        self.assertEqual(async_bookmark.keys(), sync_bookmark.keys())
+        self.assertEqual(async_bookmark['pyq'].keys(), sync_bookmark['pyq'].keys())
+        self.assertEqual(async_bookmark['pyq']['id'], self.approved.id)
+        self.assertFalse(Bookmark.objects.exists())
+
+
+class AdminScalabilityTests(TestCase):
+    def setUp(self):
+        self.superuser = User.objects.create_superuser('root', password='x')
+        self.college = College.objects.create(name='Test College')
+        self.branch = Branch.objects.create(college=self.college, name='CSE', created_by=self.superuser)
+        self.client.force_login(self.superuser)
+        self.add_rows(2)
+
+    def add_rows(self, count):
+        start = Subject.objects.count()
+        for i in range(start, start + count):
+            user = User.objects.create_user(f'user{i}', password='x')
+            UserRole.objects.create(user=user, college=self.college, role='student', assigned_by=self.superuser)
+            subject = Subject.objects.create(branch=self.branch, name=f'Subject {i}', created_by=user)
+            PreviousYearQuestion.objects.create(
+                subject=subject, year=2023, semester=5, paper_file='CN1.pdf',
+                uploaded_by=user, reviewed_by=self.superuser, status='approved'
+            )
+
+    def changelist_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return len(queries)
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        urls = [
+            '/admin/academics/previousyearquestion/', '/admin/academics/subject/',
+            '/admin/academics/userrole/', '/admin/academics/college/', '/admin/academics/branch/',
+            '/admin/auth/user/',
+        ]
+        before = [self.changelist_queries(url) for url in urls]
+        self.add_rows(5)
+        self.assertEqual([self.changelist_queries(url) for url in urls], before)
+
+    def test_estimated_count_replaces_count_on_large_tables(self):
+        paginator = EstimatedCountPaginator(PreviousYearQuestion.objects.order_by('pk'), 100)
+        with mock.patch('pyqachu_backend.pagination.estimated_count', return_value=5_000_000):
+            with self.assertNumQueries(0):
+                self.assertEqual(paginator.count, 5_000_000)
+        # Small or unsupported estimates fall back to an exact count
+        paginator = EstimatedCountPaginator(PreviousYearQuestion.objects.order_by('pk'), 100)
+        with mock.patch('pyqachu_backend.pagination.estimated_count', return_value=3):
+            self.assertEqual(paginator.count, 2)
+
+    @override_settings(ADMIN_ACTION_CHUNK_SIZE=2)
+    def test_bulk_actions_update_in_chunks(self):
+        self.add_rows(3)
+        with CaptureQueriesContext(connection) as queries:
+            updated = update_in_chunks(PreviousYearQuestion.objects.all(), status='pending')
+        self.assertEqual(updated, 5)
+        self.assertEqual(sum(query['sql'].startswith('UPDATE') for query in queries), 3)
+        self.assertFalse(PreviousYearQuestion.objects.exclude(status='pending').exists())
+
+        response = self.client.post('/admin/academics/previousyearquestion/', {
+            'action': 'approve_pyqs',
+            '_selected_action': list(PreviousYearQuestion.objects.values_list('pk', flat=True)),
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(PreviousYearQuestion.objects.filter(status='approved').count(), 5)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user('admin', password='x')
+        self.student = User.objects.create_user('student', password='x')
+        self.colleges = []
+        for name in ('Mine', 'Other'):
+            college = College.objects.create(name=name)
+            subject = Subject.objects.create(branch=Branch.objects.create(college=college, name='CSE'), name=f'{name} Networks')
+            PreviousYearQuestion.objects.create(
+                subject=subject, year=2023, semester=5, paper_file='CN1.pdf', uploaded_by=self.student,
+                status='rejected', reviewed_by=self.admin, reviewed_at=timezone.now(),
+                review_notes='=HYPERLINK("http://example.com")',
+            )
+            PreviousYearQuestion.objects.create(
+                subject=subject, year=2022, semester=5, paper_file='CN2.pdf', uploaded_by=self.student,
+            )
+            self.colleges.append(college)
+        UserRole.objects.create(user=self.admin, college=self.colleges[0], role='admin')
+        UserRole.objects.create(user=self.student, college=self.colleges[0], role='student')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_csv_export_streams_the_admins_colleges(self):
+        response = self.client.get('/api/exports/pyqs.csv')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertIn('attachment; filename="pyqs-', response['Content-Disposition'])
+        lines = b''.join(response.streaming_content).decode('utf-8-sig').splitlines()
+        self.assertEqual(lines[0].split(',')[:4], ['id', 'college', 'branch', 'subject'])
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(all(',Mine,' in line for line in lines[1:]))
+
+    def test_xlsx_moderation_export_lists_decisions(self):
+        response = self.client.get('/api/exports/moderation.xlsx')
+        self.assertEqual(response.status_code, 200)
+        sheet = load_workbook(io.BytesIO(b''.join(response.streaming_content)), read_only=True).active
+        header, *rows = list(sheet.iter_rows(values_only=True))
+        row = dict(zip(header, rows[0]))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual((row['decision'], row['reviewed_by']), ('rejected', 'admin'))
+        # Never evaluated as a formula
+        self.assertEqual(row['review_notes'], '\'=HYPERLINK("http://example.com")')
+
+    def test_only_college_admins_may_export(self):
+        self.assertEqual(self.client.get(f'/api/exports/pyqs.csv?college_id={self.colleges[1].id}').status_code, 403)
+        self.assertEqual(self.client.get('/api/exports/pyqs.pdf').status_code, 404)
+        self.client.force_authenticate(self.student)
+        self.assertEqual(self.client.get('/api/exports/pyqs.csv').status_code, 403)
+
+    def test_admin_action_exports_selection(self):
+        self.client.force_login(User.objects.create_superuser('root', password='x'))
+        selected = PreviousYearQuestion.objects.filter(year=2022).values_list('pk', flat=True)
+        response = self.client.post('/admin/academics/previousyearquestion/', {
+            'action': 'export_csv', '_selected_action': list(selected),
+        })
+        self.assertTrue(response.streaming)
+        self.assertEqual(len(b''.join(response.streaming_content).splitlines()), 3)
+
+
+class ModerationHistoryTests(TestCase):
+    def setUp(self):
+        self.college = College.objects.create(name='Test College')
+        self.other_college = College.objects.create(name='Other College')
+        self.admin = User.objects.create_user('admin', password='x')
+        self.moderator = User.objects.create_user('moderator', password='x')
+        self.student = User.objects.create_user('student', password='x')
+        UserRole.objects.create(user=self.admin, college=self.college, role='admin')
+        UserRole.objects.create(user=self.moderator, college=self.college, role='moderator')
+        UserRole.objects.create(user=self.student, college=self.college, role='student')
+        subject = Subject.objects.create(branch=Branch.objects.create(college=self.college, name='CSE'), name='Networks')
+        self.pyqs = [
+            PreviousYearQuestion.objects.create(
+                subject=subject, year=2020 + i, semester=5, paper_file='CN1.pdf', uploaded_by=self.student
+            )
+            for i in range(5)
+        ]
+        self.client = APIClient()
+
+    def moderate(self, user, pyq, action, notes=''):
+        self.client.force_authenticate(user)
+        response = self.client.post(
+            f'/api/pyqs/{pyq.id}/moderate-action/', {'action': action, 'notes': notes}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_every_change_is_kept(self):
+        pyq = self.pyqs[0]
+        self.moderate(self.moderator, pyq, 'reject', 'Blurry')
+        self.moderate(self.admin, pyq, 'approve', 'Rescanned')
+        self.client.patch(f'/api/pyqs/{pyq.id}/update-details/', {'year': 2019}, format='json')
+        self.client.patch(f'/api/pyqs/{pyq.id}/moderate/', {'status': 'pending'}, format='json')
+
+        history = ModerationEvent.objects.filter(pyq_id=pyq.id).order_by('id')
+        self.assertEqual(
+            [(e.action, e.from_status, e.to_status, e.moderator_id) for e in history],
+            [
+                ('reject', 'pending', 'rejected', self.moderator.id),
+                ('approve', 'rejected', 'approved', self.admin.id),
+                ('edit', 'approved', 'approved', self.admin.id),
+                ('reset', 'approved', 'pending', self.admin.id),
+            ]
+        )
+        self.assertEqual(history[0].notes, 'Blurry')
+        self.assertEqual(history[2].changes, {'year': [2020, 2019]})
+
+    def test_failed_change_leaves_no_history(self):
+        with mock.patch('academics.moderation_log.ModerationEvent.objects.create', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                self.moderate(self.moderator, self.pyqs[0], 'approve')
+        # The status change rolled back with the history entry
+        self.pyqs[0].refresh_from_db()
+        self.assertEqual(self.pyqs[0].status, 'pending')
+
+    @override_settings(ADMIN_ACTION_CHUNK_SIZE=2)
+    def test_bulk_admin_action_is_logged_per_chunk(self):
+        self.client.force_login(User.objects.create_superuser('root', password='x'))
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post('/admin/academics/previousyearquestion/', {
+                'action': 'approve_pyqs', '_selected_action': [pyq.id for pyq in self.pyqs],
+            })
+        inserts = [q for q in queries if q['sql'].startswith('INSERT INTO "academics_moderationevent"')]
+        self.assertEqual(len(inserts), 3)
+        self.assertEqual(ModerationEvent.objects.filter(action='approve', from_status='pending').count(), 5)
+
+    def test_timeline_pages_by_keyset(self):
+        for pyq in self.pyqs:
+            self.moderate(self.moderator, pyq, 'approve')
+        self.client.force_authenticate(self.moderator)
+
+        seen, before = [], None
+        while True:
+            url = f'/api/moderation/history/?moderator_id={self.moderator.id}&limit=2'
+            response = self.client.get(url + (f'&before={before}' if before else ''))
+            self.assertEqual(response.status_code, 200)
+            seen += [event['pyq'] for event in response.data['results']]
+            before = response.data['next_before']
+            if before is None:
+                break
+        self.assertEqual(seen, [pyq.id for pyq in reversed(self.pyqs)])
+
+        # Only for colleges the user moderates
+        response = self.client.get(f'/api/moderation/history/?college_id={self.other_college.id}')
+        self.assertEqual(response.status_code, 403)
+        self.client.force_authenticate(self.student)
+        self.assertEqual(self.client.get('/api/moderation/history/').status_code, 403)
+
+    def test_throughput(self):
+        PreviousYearQuestion.objects.filter(id__in=[p.id for p in self.pyqs]).update(
+            uploaded_at=timezone.now() - timedelta(hours=10)
+        )
+        for pyq in self.pyqs[:3]:
+            pyq.refresh_from_db()
+            self.moderate(self.moderator, pyq, 'approve')
+        self.moderate(self.admin, self.pyqs[3], 'reject')
+
+        # Admins only
+        self.client.force_authenticate(self.moderator)
+        self.assertEqual(self.client.get('/api/moderation/stats/').status_code, 403)
+        self.client.force_authenticate(self.admin)
+        response = self.client.get('/api/moderation/stats/')
+        self.assertEqual(response.status_code, 200)
+        top = response.data['moderators'][0]
+        self.assertEqual((top['moderator_username'], top['reviews'], top['approved']), ('moderator', 3, 3))
+        self.assertEqual(top['reviews_per_active_hour'], 3)
+        self.assertAlmostEqual(top['avg_hours_to_review'], 10, delta=0.1)
+        self.assertEqual(len(response.data['moderators']), 2)
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        for setting in ('MEDIA_ROOT', 'ARCHIVE_ROOT'):
+            directory = tempfile.TemporaryDirectory()
+            self.addCleanup(directory.cleanup)
+            setattr(self, setting.lower(), directory.name)
+        storage = override_settings(MEDIA_ROOT=self.media_root, STORAGES={
+            'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+            'archive': {
+                'BACKEND': 'django.core.files.storage.FileSystemStorage',
+                'OPTIONS': {'location': self.archive_root},
+            },
+        })
+        storage.enable()
+        self.addCleanup(storage.disable)
+
+        college = College.objects.create(name='Test College')
+        self.subject = Subject.objects.create(branch=Branch.objects.create(college=college, name='CSE'), name='Networks')
+        self.student = User.objects.create_user('student', password='x')
+        UserRole.objects.create(user=self.student, college=college, role='student')
+        long_ago = timezone.now() - timedelta(days=1000)
+        self.rejected = self.paper('rejected.pdf', status='rejected', reviewed_at=timezone.now() - timedelta(days=60))
+        self.recently_rejected = self.paper('recent.pdf', status='rejected', reviewed_at=timezone.now())
+        self.stale = self.paper('stale.pdf', status='approved', last_accessed_at=long_ago)
+        self.popular = self.paper('popular.pdf', status='approved', last_accessed_at=timezone.now())
+        self.pending = self.paper('pending.pdf')
+        PreviousYearQuestion.objects.update(uploaded_at=long_ago)
+        Bookmark.objects.create(user=self.student, pyq=self.stale)
+
+    def paper(self, name, **fields):
+        with open(os.path.join(self.media_root, name), 'wb') as paper:
+            paper.write(TEST_PDF)
+        return PreviousYearQuestion.objects.create(
+            subject=self.subject, year=2023, semester=5, paper_file=name, uploaded_by=self.student, **fields
+        )
+
+    def archive(self, *args):
+        out = StringIO()
+        # Hot files are only deleted once the pack's transaction commits
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('archive_pyqs', *args, stdout=out)
+        return out.getvalue()
+
+    def test_moves_due_papers_into_packs(self):
+        self.assertIn('1 rejected and 1 stale papers are due', self.archive('--dry-run'))
+        self.archive('--pack-size', '1')
+
+        self.assertEqual(
+            set(ArchivedPYQ.objects.values_list('pyq_id', 'reason')),
+            {(self.rejected.id, 'rejected'), (self.stale.id, 'stale')},
+        )
+        self.assertEqual(ArchivePack.objects.count(), 2)
+        self.assertEqual(
+            set(PreviousYearQuestion.objects.values_list('id', flat=True)),
+            {self.recently_rejected.id, self.popular.id, self.pending.id},
+        )
+        # The hot files are gone and the packs compress them
+        self.assertEqual(sorted(os.listdir(self.media_root)), ['pending.pdf', 'popular.pdf', 'recent.pdf'])
+        pack = ArchivePack.objects.first()
+        self.assertLess(pack.packed_bytes, pack.original_bytes)
+        self.assertEqual(pack.original_bytes, len(TEST_PDF))
+
+        # Nothing left to do on the next run
+        self.assertIn('Archived 0 papers', self.archive())
+
+    def test_restore_puts_paper_back(self):
+        uploaded_at = PreviousYearQuestion.objects.get(pk=self.stale.id).uploaded_at
+        self.archive()
+        self.assertEqual(ArchivePack.objects.count(), 1)
+        stub = ArchivedPYQ.objects.get(pyq_id=self.stale.id)
+
+        pyq = restore(stub)
+        self.assertEqual(pyq.id, self.stale.id)
+        pyq.refresh_from_db()
+        self.assertEqual((pyq.status, pyq.uploaded_at), ('approved', uploaded_at))
+        with pyq.paper_file.open('rb') as paper:
+            self.assertEqual(paper.read(), TEST_PDF)
+        self.assertTrue(Bookmark.objects.filter(user=self.student, pyq=pyq).exists())
+
+        # The pack stays until its last paper is restored
+        self.assertTrue(ArchivePack.objects.exists())
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('restore_pyqs', str(self.rejected.id), stdout=StringIO())
+        self.assertFalse(ArchivePack.objects.exists())
+        self.assertEqual(os.listdir(os.path.join(self.archive_root, timezone.now().strftime('%Y/%m'))), [])
+
+    def test_restore_refuses_missing_subject(self):
+        self.archive()
+        self.subject.delete()
+        with self.assertRaises(RestoreError):
+            restore(ArchivedPYQ.objects.get(pyq_id=self.rejected.id))
+        self.assertTrue(ArchivedPYQ.objects.filter(pyq_id=self.rejected.id).exists())
+
+    def test_papers_from_before_access_tracking_stay_hot(self):
+        # Added before last_accessed_at existed, so it has never recorded an access
+        old = self.paper('old.pdf', status='approved', reviewed_at=timezone.now() - timedelta(days=1000))
+        PreviousYearQuestion.objects.filter(id=old.id).update(uploaded_at=timezone.now() - timedelta(days=1000))
+        migration = import_module('academics.migrations.0017_backfill_last_accessed_at')
+        migration.backfill_last_accessed_at(django_apps, mock.Mock(connection=connection))
+
+        self.archive()
+        self.assertTrue(PreviousYearQuestion.objects.filter(id=old.id).exists())
+        self.assertFalse(ArchivedPYQ.objects.filter(pyq_id=old.id).exists())
+        # Papers that were already due are still archived
+        self.assertTrue(ArchivedPYQ.objects.filter(pyq_id=self.stale.id).exists())
+
+    def test_papers_touched_since_selection_stay_hot(self):
+        # Picked for the batch, then opened before the batch was written
+        PreviousYearQuestion.objects.filter(id=self.stale.id).update(last_accessed_at=timezone.now())
+        self.assertIsNone(archive_batch([self.stale.id], timezone.now(), 30, 730))
+        self.assertFalse(ArchivedPYQ.objects.exists())
+
+    def test_flushed_counters_mark_papers_accessed(self):
+        flush_counters()
+        record_access(self.stale.id, download=True)
+        flush_counters()
+        self.stale.refresh_from_db()
+        self.assertGreater(self.stale.last_accessed_at, timezone.now() - timedelta(minutes=1))
+
+
+class ImportPYQsTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_root = override_settings(MEDIA_ROOT=media.name)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+        source = tempfile.TemporaryDirectory()
+        self.addCleanup(source.cleanup)
+        self.source = source.name
+
+        self.college = College.objects.create(name='Test College')
+        branch = Branch.objects.create(college=self.college, name='CSE', code='CSE')
+        self.subject = Subject.objects.create(branch=branch, name='Networks', code='CN')
+        self.librarian = User.objects.create_user('librarian', password='x')
+        self.student = User.objects.create_user('student', password='x')
+        for name, data in (('cn1.pdf', b'%PDF first'), ('cn2.pdf', b'%PDF second'), ('copy.pdf', b'%PDF first')):
+            with open(os.path.join(self.source, name), 'wb') as paper:
+                paper.write(data)
+
+    def run_import(self, *rows):
+        metadata = os.path.join(self.source, 'papers.csv')
+        with open(metadata, 'w') as sheet:
+            sheet.write('file,branch,subject,year,semester,regulation\n' + ''.join(f'{row}\n' for row in rows))
+        out, err = StringIO(), StringIO()
+        call_command(
+            'import_pyqs', self.source, metadata, '--college', str(self.college.id),
+            '--uploaded-by', 'librarian', '--workers', '2', stdout=out, stderr=err,
+        )
+        return out.getvalue(), err.getvalue()
+
+    def test_manifest_rows_are_validated(self):
+        out, err = self.run_import(
+            'cn1.pdf,CSE,CN,2023,5,R20',
+            'cn2.pdf,ECE,CN,2023,5,',
+            'missing.pdf,CSE,CN,2023,5,',
+            'cn2.pdf,CSE,CN,last year,5,',
+        )
+        self.assertIn('Imported 1 PYQs, skipped 0 already imported, 3 invalid rows', out)
+        self.assertEqual(err.splitlines(), [
+            'Line 3: unknown subject ECE/CN',
+            'Line 4: file "missing.pdf" not found',
+            'Line 5: year and semester must be numbers',
+        ])
+        pyq = PreviousYearQuestion.objects.get()
+        self.assertEqual((pyq.subject, pyq.year, pyq.regulation, pyq.status), (self.subject, 2023, 'R20', 'pending'))
+        self.assertEqual(pyq.file_hash, hashlib.sha256(b'%PDF first').hexdigest())
+        with pyq.paper_file.open('rb') as paper:
+            self.assertEqual(paper.read(), b'%PDF first')
+
+    def test_identical_files_are_imported_once(self):
+        out, _ = self.run_import('cn1.pdf,CSE,CN,2023,5,', 'copy.pdf,CSE,CN,2023,5,')
+        self.assertIn('Imported 1 PYQs, skipped 1 already imported', out)
+
+    def test_rerun_resumes(self):
+        self.run_import('cn1.pdf,CSE,CN,2023,5,')
+        out, _ = self.run_import('cn1.pdf,CSE,CN,2023,5,', 'cn2.pdf,CSE,CN,2022,5,')
+        self.assertIn('Imported 1 PYQs, skipped 1 already imported', out)
+        self.assertEqual(sorted(PreviousYearQuestion.objects.values_list('year', flat=True)), [2022, 2023])
+
+    def test_same_file_elsewhere_is_still_imported(self):
+        file_hash = hashlib.sha256(b'%PDF first').hexdigest()
+        other = College.objects.create(name='Other College')
+        other_subject = Subject.objects.create(branch=Branch.objects.create(college=other, name='CSE'), name='Networks')
+        # The same paper in another college, and a student's rejected upload of it here
+        PreviousYearQuestion.objects.create(
+            subject=other_subject, year=2023, semester=5, paper_file='x.pdf', file_hash=file_hash,
+            uploaded_by=self.librarian,
+        )
+        PreviousYearQuestion.objects.create(
+            subject=self.subject, year=2023, semester=5, paper_file='y.pdf', file_hash=file_hash,
+            uploaded_by=self.student, status='rejected',
+        )
+
+        out, _ = self.run_import('cn1.pdf,CSE,CN,2023,5,')
+        self.assertIn('Imported 1 PYQs, skipped 0 already imported', out)
+        self.assertTrue(PreviousYearQuestion.objects.filter(subject=self.subject, uploaded_by=self.librarian).exists())
+
+
+@override_settings(DATABASE_SHARDS=['default', 'shard_test'], SHARD_MAP_CACHE_SECONDS=0)
+class ShardingTests(TestCase):
+    databases = {'default', 'shard_test'}
+
+    def setUp(self):
+        cache.clear()
+        reserve_id_blocks('shard_test')
+        # The directory is mirrored to the shards once its transaction commits
+        with self.captureOnCommitCallbacks(execute=True):
+            self.home = College.objects.create(name='Home College')
+            self.remote = College.objects.create(name='Remote College', shard='shard_test')
+            self.student = User.objects.create_user('student', password='x')
+            UserRole.objects.create(user=self.student, college=self.remote, role='student')
+            self.superuser = User.objects.create_superuser('root', password='x')
+        self.home_pyq = self.paper(self.home)
+        with use_shard('shard_test'):
+            self.remote_pyq = self.paper(self.remote)
+
+    def paper(self, college):
+        branch = Branch.objects.create(college=college, name='CSE')
+        subject = Subject.objects.create(branch=branch, name='Networks', code='CN')
+        return PreviousYearQuestion.objects.create(
+            subject=subject, year=2023, semester=5, paper_file='cn.pdf', uploaded_by=self.student, status='approved',
+        )
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def test_directory_is_mirrored(self):
+        self.assertTrue(User.objects.using('shard_test').filter(username='student').exists())
+        self.assertEqual(College.objects.using('shard_test').get(pk=self.remote.pk).shard, 'shard_test')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.remote.name = 'Renamed College'
+            self.remote.save()
+            UserRole.objects.filter(user=self.student).delete()
+        self.assertEqual(College.objects.using('shard_test').get(pk=self.remote.pk).name, 'Renamed College')
+        self.assertFalse(UserRole.objects.using('shard_test').exists())
+
+    def test_requests_use_the_colleges_shard(self):
+        # Rows live on one shard only, with ids from the shard's own block
+        self.assertFalse(PreviousYearQuestion.objects.filter(pk=self.remote_pyq.pk).exists())
+        self.assertGreaterEqual(self.remote_pyq.pk, settings.SHARD_ID_BLOCK)
+
+        client = self.client_for(self.student)
+        self.assertEqual([pyq['id'] for pyq in client.get('/api/pyqs/').json()], [self.remote_pyq.id])
+        self.assertEqual(client.post(f'/api/pyqs/{self.remote_pyq.id}/bookmark/').status_code, 201)
+        self.assertTrue(Bookmark.objects.using('shard_test').filter(user=self.student).exists())
+        flush_events()
+        events = UsageEvent.objects.using('shard_test').filter(pyq_id=self.remote_pyq.id)
+        self.assertEqual(list(events.values_list('kind', flat=True)), ['bookmark'])
+
+    def test_superuser_sees_every_shard(self):
+        client = self.client_for(self.superuser)
+        response = client.get('/api/pyqs/?ordering=-uploaded_at')
+        self.assertEqual([pyq['id'] for pyq in response.json()], [self.remote_pyq.id, self.home_pyq.id])
+
+        # Views about one paper find the shard holding it
+        response = client.post(f'/api/pyqs/{self.remote_pyq.id}/moderate-action/', {'action': 'reject'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(PreviousYearQuestion.objects.using('shard_test').get().status, 'rejected')
+        history = client.get('/api/moderation/history/').json()['results']
+        self.assertEqual([event['pyq'] for event in history], [self.remote_pyq.id])
+
+    def test_move_college(self):
+        Bookmark.objects.create(user=self.student, pyq=self.home_pyq)
+        uploaded_at = self.home_pyq.uploaded_at
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('move_college', str(self.home.id), 'shard_test', stdout=StringIO())
+
+        self.home.refresh_from_db()
+        self.assertEqual((self.home.shard, self.home.is_active), ('shard_test', True))
+        self.assertFalse(Branch.objects.filter(college=self.home).exists())
+        self.assertFalse(PreviousYearQuestion.objects.exists())
+        moved = PreviousYearQuestion.objects.using('shard_test').get(pk=self.home_pyq.pk)
+        self.assertEqual(moved.uploaded_at, uploaded_at)
+        self.assertTrue(Bookmark.objects.using('shard_test').filter(pyq=moved).exists())
+        self.assertEqual(PreviousYearQuestion.objects.using('shard_test').count(), 2)
+        connections['shard_test'].check_constraints()
+
+        response = self.client_for(self.superuser).get('/api/pyqs/?ordering=uploaded_at')
+        self.assertEqual([pyq['id'] for pyq in response.json()], [self.home_pyq.id, self.remote_pyq.id])
+
+    def test_moving_college_takes_no_writes(self):
+        College.objects.filter(pk=self.home.pk).update(is_active=False)
+        client = self.client_for(self.superuser)
+        response = client.post(f'/api/pyqs/{self.home_pyq.id}/moderate-action/', {'action': 'reject'}, format='json')
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(client.post(f'/api/pyqs/{self.home_pyq.id}/bookmark/').status_code, 403)
+        self.assertEqual(PreviousYearQuestion.objects.get(pk=self.home_pyq.pk).status, 'approved')
+
+    def test_move_college_keeps_rows_changed_after_the_copy(self):
+        def flush_counters_late(seconds):
+            # e.g. a download counted by a worker still routing to the source
+            PreviousYearQuestion.objects.filter(pk=self.home_pyq.pk).update(download_count=5)
+
+        with mock.patch('academics.sharding.time.sleep', flush_counters_late), \
+                self.captureOnCommitCallbacks(execute=True), self.assertRaises(RuntimeError):
+            call_command('move_college', str(self.home.id), 'shard_test', stdout=StringIO())
+
+        self.assertEqual(PreviousYearQuestion.objects.get(pk=self.home_pyq.pk).download_count, 5)
+        self.home.refresh_from_db()
+        self.assertEqual((self.home.shard, self.home.is_active), ('shard_test', True))
+
+    def test_archiving_keeps_files_used_on_other_shards(self):
+        media_root, archive_root = tempfile.mkdtemp(), tempfile.mkdtemp()
+        for directory in (media_root, archive_root):
+            self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        for name in ('cn.pdf', 'only.pdf'):
+            with open(os.path.join(media_root, name), 'wb') as paper:
+                paper.write(TEST_PDF)
+        only = PreviousYearQuestion.objects.create(
+            subject=self.home_pyq.subject, year=2022, semester=5, paper_file='only.pdf', uploaded_by=self.student,
+        )
+        long_ago = timezone.now() - timedelta(days=1000)
+        PreviousYearQuestion.objects.update(status='rejected', reviewed_at=long_ago, uploaded_at=long_ago)
+
+        with override_settings(MEDIA_ROOT=media_root, STORAGES={
+            'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+            'archive': {'BACKEND': 'django.core.files.storage.FileSystemStorage', 'OPTIONS': {'location': archive_root}},
+        }):
+            with self.captureOnCommitCallbacks(execute=True):
+                pack = archive_batch([self.home_pyq.id, only.id], timezone.now(), 30, 730)
+
+        self.assertEqual(pack.paper_count, 2)
+        # The remote college's paper still points at cn.pdf
+        self.assertEqual(os.listdir(media_root), ['cn.pdf'])
@@ -0,0 +1,182 @@
+import re
+
+from django.conf import settings
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+from django.http import QueryDict
+from django.utils.datastructures import MultiValueDict
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+try:
+    import pypdf
+except ImportError:  # the streaming checks still run; only the final page count is skipped
+    pypdf = None
+
+from .permissions import RoleBasedPermissionMixin
+
+
+MAGIC_NUMBERS = {
+    'pdf': b'%PDF-',
+    'jpeg': b'\xff\xd8\xff',
+    'png': b'\x89PNG\r\n\x1a\n',
+}
+SNIFF_BYTES = max(len(magic) for magic in MAGIC_NUMBERS.values())
+# Page objects; /Type /Pages (the page tree) doesn't count
+_PAGE_OBJECT = re.compile(rb'/Type\s*/Page(?![A-Za-z])')
+# Longer than any page marker, and room for the trailer after %%EOF
+TAIL_BYTES = 1024
+# Multipart boundaries and the other form fields around the file
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class InvalidUpload(APIException):
+    status_code = status.HTTP_400_BAD_REQUEST
+    default_detail = 'Invalid paper file.'
+    default_code = 'invalid_upload'
+
+
+class UploadTooLarge(InvalidUpload):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_code = 'upload_too_large'
+
+
+def upload_limits(user):
+    """(max bytes, max pages) for the user's highest role in any college"""
+    if user.is_superuser:
+        role = 'admin'
+    else:
+        roles = set(RoleBasedPermissionMixin.get_college_roles(user).values())
+        role = next((role for role in ('admin', 'moderator') if role in roles), 'student')
+    limits = settings.UPLOAD_LIMITS[role]
+    return limits['max_mb'] * 1024 * 1024, limits['max_pages']
+
+
+class PaperInspector:
+    """
+    Checks a paper's bytes as they arrive, raising InvalidUpload as soon as
+    the file is known to be bad: an unrecognised file type, more bytes than
+    allowed, more page objects than allowed, or a PDF cut off before %%EOF.
+    """
+
+    def __init__(self, max_bytes, max_pages):
+        self.max_bytes = max_bytes
+        self.max_pages = max_pages
+        self.size = 0
+        self.kind = None
+        self.pages = 0
+        self._head = b''
+        self._tail = b''
+        self._scanned = 0
+
+    def _sniff(self):
+        for kind, magic in MAGIC_NUMBERS.items():
+            if self._head.startswith(magic):
+                return kind
+        raise InvalidUpload('Papers must be PDF, JPEG or PNG files.')
+
+    def _count_pages(self, window, final=False):
+        base = self.size - len(window)
+        for match in _PAGE_OBJECT.finditer(window):
+            start = base + match.start()
+            # A marker at the very end may continue in the next chunk ("/Pages")
+            if start >= self._scanned and (final or match.end() < len(window)):
+                self.pages += 1
+                self._scanned = base + match.end()
+        if self.pages > self.max_pages:
+            raise InvalidUpload(f'Papers can have at most {self.max_pages} pages.')
+
+    def feed(self, chunk):
+        self.size += len(chunk)
+        if self.size > self.max_bytes:
+            raise UploadTooLarge(f'Papers can be at most {self.max_bytes // (1024 * 1024)} MB.')
+        if self.kind is None:
+            self._head += chunk[:SNIFF_BYTES - len(self._head)]
+            if len(self._head) < SNIFF_BYTES:
+                return
+            self.kind = self._sniff()
+        if self.kind == 'pdf':
+            window = self._tail + chunk
+            self._count_pages(window)
+            self._tail = window[-TAIL_BYTES:]
+
+    def finish(self):
+        if self.kind is None:
+            self.kind = self._sniff()
+        if self.kind == 'pdf':
+            self._count_pages(self._tail, final=True)
+            if b'%%EOF' not in self._tail:
+                raise InvalidUpload('The PDF is incomplete or damaged.')
+
+
+def check_paper_file(file, max_bytes, max_pages):
+    """
+    Full check of an already received file. Repeats the streaming checks
+    (the body may have been parsed before the upload handler was installed,
+    e.g. for CSRF checks on session requests) and counts pages with pypdf,
+    which also sees pages inside compressed object streams.
+    """
+    inspector = PaperInspector(max_bytes, max_pages)
+    for chunk in file.chunks():
+        inspector.feed(chunk)
+    inspector.finish()
+    file.seek(0)
+    if inspector.kind != 'pdf' or pypdf is None:
+        return
+    try:
+        pages = len(pypdf.PdfReader(file).pages)
+    except Exception:
+        raise InvalidUpload('The PDF is incomplete or damaged.')
+    finally:
+        file.seek(0)
+    if pages > max_pages:
+        raise InvalidUpload(f'Papers can have at most {max_pages} pages.')
+
+
+class PaperUploadHandler(FileUploadHandler):
+    """
+    Runs PaperInspector over the paper_file field while it streams in,
+    ahead of the handlers that store it. A rejected upload stops the parser
+    without reading the rest of the body, so it never reaches memory or a
+    temporary file; the view raises the stored error afterwards.
+    """
+
+    def __init__(self, request, max_bytes, max_pages, field_name='paper_file'):
+        super().__init__(request)
+        self.max_bytes = max_bytes
+        self.max_pages = max_pages
+        self.file_field = field_name
+        self.inspector = None
+        self.error = None
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        if content_length > self.max_bytes + MULTIPART_OVERHEAD:
+            # Refused from the headers alone; the body is never read
+            self.error = UploadTooLarge(f'Papers can be at most {self.max_bytes // (1024 * 1024)} MB.')
+            return QueryDict(encoding=encoding), MultiValueDict()
+        return None
+
+    def new_file(self, field_name, *args, **kwargs):
+        super().new_file(field_name, *args, **kwargs)
+        self.inspector = PaperInspector(self.max_bytes, self.max_pages) if field_name == self.file_field else None
+
+    def _check(self, method, *args):
+        try:
+            method(*args)
+        except InvalidUpload as e:
+            self.error = e
+            raise StopUpload(connection_reset=True)
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.inspector is not None:
+            self._check(self.inspector.feed, raw_data)
+        return raw_data
+
+    def file_complete(self, file_size):
+        if self.inspector is not None:
+            self._check(self.inspector.finish)
+        # Let the storing handlers build the file
+        return None
+
+    def raise_if_rejected(self):
+        if self.error is not None:
+            raise self.error
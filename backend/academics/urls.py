@@ -1,33 +1,58 @@
+from django.conf import settings
 from django.urls import path
+from . import async_views
 from .views import (
     CollegeListView, BranchListView, SubjectListView, 
     PreviousYearQuestionListView, PYQUploadView, PYQModerationView,
-    PendingPYQListView, update_pyq_details, moderate_pyq,
-    user_role_info, UserRoleListView, pyq_download,
+    PendingPYQListView, claim_pending_pyqs, release_pending_pyqs, update_pyq_details, moderate_pyq,
+    user_role_info, UserRoleListView, pyq_download, related_pyqs, export_spreadsheet,
+    moderation_history, moderation_stats,
     BookmarkListView, bookmark_toggle, check_bookmark_status
 )
 
+# Under ASGI the hot endpoints are served by native async views
+if settings.ASYNC_VIEWS:
+    pyq_list_view = async_views.pyq_list
+    pyq_download_view = async_views.pyq_download
+    bookmark_toggle_view = async_views.bookmark_toggle
+    check_bookmark_status_view = async_views.check_bookmark_status
+else:
+    pyq_list_view = PreviousYearQuestionListView.as_view()
+    pyq_download_view = pyq_download
+    bookmark_toggle_view = bookmark_toggle
+    check_bookmark_status_view = check_bookmark_status
+
 urlpatterns = [
     # Original endpoints
     path('colleges/', CollegeListView.as_view(), name='college-list'),
     path('branches/', BranchListView.as_view(), name='branch-list'),
     path('subjects/', SubjectListView.as_view(), name='subject-list'),
-    path('pyqs/', PreviousYearQuestionListView.as_view(), name='pyq-list'),
+    path('pyqs/', pyq_list_view, name='pyq-list'),
     
     # PYQ management endpoints
     path('pyqs/upload/', PYQUploadView.as_view(), name='pyq-upload'),
     path('pyqs/pending/', PendingPYQListView.as_view(), name='pending-pyq-list'),
-    path('pyqs/<int:pk>/download/', pyq_download, name='pyq-download'),
+    path('pyqs/pending/claim/', claim_pending_pyqs, name='pending-pyq-claim'),
+    path('pyqs/pending/release/', release_pending_pyqs, name='pending-pyq-release'),
+    path('pyqs/<int:pk>/download/', pyq_download_view, name='pyq-download'),
+    path('pyqs/<int:pk>/related/', related_pyqs, name='pyq-related'),
     path('pyqs/<int:pk>/moderate/', PYQModerationView.as_view(), name='pyq-moderate'),
     path('pyqs/<int:pk>/update-details/', update_pyq_details, name='update-pyq-details'),
     path('pyqs/<int:pk>/moderate-action/', moderate_pyq, name='moderate-pyq'),
     
     # Bookmark endpoints
     path('bookmarks/', BookmarkListView.as_view(), name='bookmark-list'),
-    path('pyqs/<int:pyq_id>/bookmark/', bookmark_toggle, name='bookmark-toggle'),
-    path('pyqs/<int:pyq_id>/bookmark-status/', check_bookmark_status, name='check-bookmark-status'),
+    path('pyqs/<int:pyq_id>/bookmark/', bookmark_toggle_view, name='bookmark-toggle'),
+    path('pyqs/<int:pyq_id>/bookmark-status/', check_bookmark_status_view, name='check-bookmark-status'),
     
     # User role endpoints
     path('user-role-info/', user_role_info, name='user-role-info'),
     path('user-roles/', UserRoleListView.as_view(), name='user-role-list'),
+    
+    # Moderation history
+    path('moderation/history/', moderation_history, name='moderation-history'),
+    path('moderation/stats/', moderation_stats, name='moderation-stats'),
+    
+    # Spreadsheet exports for college admins
+    path('exports/<slug:dataset>.<slug:file_type>', export_spreadsheet, name='export-spreadsheet'),
 ]
\ No newline at end of file
@@ -1,26 +1,66 @@
 from rest_framework import generics, filters, status
 from rest_framework.permissions import IsAuthenticated
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.authentication import SessionAuthentication, TokenAuthentication
+from rest_framework.decorators import api_view, authentication_classes, permission_classes, throttle_classes
 from rest_framework.response import Response
 from rest_framework.exceptions import PermissionDenied
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Q
+from django.conf import settings
+from django.db.models import Count, Prefetch, Q
+from django.db import transaction
 from django.utils import timezone
-from django.http import HttpResponse, Http404, FileResponse
+from django.utils.dateparse import parse_datetime
+from django.http import HttpResponse, HttpResponseRedirect, Http404, FileResponse
 from django.shortcuts import get_object_or_404
 from django.views.decorators.http import require_http_methods
+import logging
 import os
 import mimetypes
-from .models import College, Branch, Subject, PreviousYearQuestion, UserRole, Bookmark
+from datetime import timedelta
+from .models import (
+    College, Branch, Subject, PreviousYearQuestion, UserRole, Bookmark, RelatedPYQ, DuplicateCandidate,
+    ModerationEvent,
+)
 from .serializers import (
     CollegeSerializer, BranchSerializer, SubjectSerializer, 
-    PreviousYearQuestionSerializer, UserRoleSerializer,
-    PYQUploadSerializer, PYQModerationSerializer, BookmarkSerializer
+    PreviousYearQuestionSerializer, UserRoleSerializer, PendingPYQSerializer,
+    PYQUploadSerializer, PYQModerationSerializer, BookmarkSerializer, ModerationEventSerializer
 )
 from .permissions import RoleBasedPermissionMixin
+from .files import is_local, presigned_url
+from . import moderation_log, moderation_queue
+from .counters import record_access
+from .events import record_event
+from .duplicates import queue_duplicate_scan
+from .uploads import PaperUploadHandler, upload_limits
+from .signing import SIGNED_URL, SignedDownloadAuthentication
+from .paper_cache import get_paper_cache
+from .exports import CONTENT_TYPES, EXPORTS, export_queryset, export_response
+from .sharding import FanOutMixin, fan_out, locate, request_shards, shards_of_colleges, use_shard
+from pyqachu_backend.db_routers import ReplicaReadMixin, reads_from_replica, mark_recent_write
+from pyqachu_backend.throttling import DownloadThrottle, SearchThrottle, UploadThrottle, charge_bytes
+
+
+logger = logging.getLogger(__name__)
+
+
+def pyq_queryset():
+    """PYQs joined with everything the permission checks and serializers read"""
+    return PreviousYearQuestion.objects.select_related(
+        'subject', 'subject__branch', 'subject__branch__college', 'uploaded_by', 'reviewed_by'
+    )
+
+
+def with_moderation_details(queryset):
+    """Pending PYQs with the joins and prefetches PendingPYQSerializer reads"""
+    return queryset.select_related(
+        'subject', 'subject__branch', 'subject__branch__college', 'uploaded_by', 'reviewed_by', 'claimed_by'
+    ).prefetch_related(
+        Prefetch('duplicate_candidates', queryset=DuplicateCandidate.objects.select_related('duplicate_of'))
+    )
 
 
-class CollegeListView(generics.ListAPIView):
+class CollegeListView(ReplicaReadMixin, generics.ListAPIView):
     """
     GET /api/colleges/ - List colleges accessible to the user
     """
@@ -34,14 +74,24 @@ class CollegeListView(generics.ListAPIView):
     def get_queryset(self):
         user = self.request.user
         if user.is_superuser:
-            return College.objects.filter(is_active=True)
+            queryset = College.objects.filter(is_active=True)
+        else:
+            # Return colleges where user has any role
+            queryset = RoleBasedPermissionMixin.get_user_colleges(user)
         
-        # Return colleges where user has any role
-        user_colleges = RoleBasedPermissionMixin.get_user_colleges(user)
-        return user_colleges
+        # Counted in the same query instead of two extra queries per college
+        return queryset.annotate(
+            admin_count=Count('user_roles', filter=Q(user_roles__role='admin', user_roles__is_active=True)),
+            moderator_count=Count('user_roles', filter=Q(user_roles__role='moderator', user_roles__is_active=True)),
+        )
 
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['college_roles'] = RoleBasedPermissionMixin.get_college_roles(self.request.user)
+        return context
 
-class BranchListView(generics.ListAPIView):
+
+class BranchListView(FanOutMixin, ReplicaReadMixin, generics.ListAPIView):
     """
     GET /api/branches/?college_id= - Get branches for a specific college
     """
@@ -70,7 +120,7 @@ class BranchListView(generics.ListAPIView):
         return queryset
 
 
-class SubjectListView(generics.ListAPIView):
+class SubjectListView(FanOutMixin, ReplicaReadMixin, generics.ListAPIView):
     """
     GET /api/subjects/?branch_id= - Get subjects for a specific branch
     """
@@ -103,43 +153,64 @@ class SubjectListView(generics.ListAPIView):
         return queryset
 
 
-class PreviousYearQuestionListView(generics.ListAPIView):
+class PreviousYearQuestionListView(FanOutMixin, ReplicaReadMixin, generics.ListAPIView):
     """
     GET /api/pyqs/?subject_id=&year=&semester=&regulation= - Get filtered PYQs
+    GET /api/pyqs/?ordering=-download_count - Most downloaded first
     """
     serializer_class = PreviousYearQuestionSerializer
     permission_classes = [IsAuthenticated]
+    throttle_classes = [SearchThrottle]
     filter_backends = [filters.SearchFilter, filters.OrderingFilter, DjangoFilterBackend]
     search_fields = ['subject__name', 'regulation']
-    ordering_fields = ['year', 'semester', 'uploaded_at']
+    ordering_fields = ['year', 'semester', 'uploaded_at', 'download_count', 'view_count']
     ordering = ['-year', 'semester']
 
     def get_queryset(self):
+        user_colleges = RoleBasedPermissionMixin.get_user_colleges(self.request.user)
+        # One query answers both whether unapproved papers are listed at all
+        # and, per college, which of them the serializer may sign URLs for
+        self.download_grants = RoleBasedPermissionMixin.get_download_grants(self.request.user)
+        return self.build_queryset(user_colleges, any(self.download_grants.values()), self.request.query_params)
+
+    def list(self, request, *args, **kwargs):
+        self.record_search(request.user, request.query_params)
+        return super().list(request, *args, **kwargs)
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        # Moderating any college lists unapproved papers from all of the user's
+        # colleges, so only sign URLs for those the download rules allow
+        context['download_grants'] = getattr(self, 'download_grants', None)
+        return context
+
+    @staticmethod
+    def record_search(user, params):
+        """Log text searches for usage analytics; shared with the async list view"""
+        query = params.get('search', '').strip()
+        if query:
+            subject_id = params.get('subject_id', '')
+            record_event('search', user, subject_id=int(subject_id) if subject_id.isdigit() else None, query=query)
+
+    @staticmethod
+    def build_queryset(user_colleges, can_moderate_any, params):
+        """Shared with the async list view, so it must not evaluate anything"""
         queryset = PreviousYearQuestion.objects.select_related(
             'subject', 'subject__branch', 'subject__branch__college', 'uploaded_by', 'reviewed_by'
         )
         
         # Filter by user's accessible colleges
-        user_colleges = RoleBasedPermissionMixin.get_user_colleges(self.request.user)
         queryset = queryset.filter(subject__branch__college__in=user_colleges)
         
         # Only show approved PYQs unless user can moderate
-        if not self.request.user.is_superuser:
-            # Check if user can moderate for any college
-            can_moderate_any = False
-            for college in user_colleges:
-                if RoleBasedPermissionMixin.can_moderate_pyqs(self.request.user, college):
-                    can_moderate_any = True
-                    break
-            
-            if not can_moderate_any:
-                queryset = queryset.filter(status='approved')
+        if not can_moderate_any:
+            queryset = queryset.filter(status='approved')
         
         # Filter by query parameters
-        subject_id = self.request.query_params.get('subject_id')
-        year = self.request.query_params.get('year')
-        semester = self.request.query_params.get('semester')
-        regulation = self.request.query_params.get('regulation')
+        subject_id = params.get('subject_id')
+        year = params.get('year')
+        semester = params.get('semester')
+        regulation = params.get('regulation')
         
         if subject_id:
             queryset = queryset.filter(subject_id=subject_id)
@@ -162,6 +233,26 @@ class PYQUploadView(generics.CreateAPIView):
     """
     serializer_class = PYQUploadSerializer
     permission_classes = [IsAuthenticated]
+    throttle_classes = [UploadThrottle]
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        # Must be in place before request.data is first read
+        self.upload_limits = upload_limits(request.user)
+        self.upload_handler = PaperUploadHandler(request._request, *self.upload_limits)
+        request._request.upload_handlers.insert(0, self.upload_handler)
+
+    def create(self, request, *args, **kwargs):
+        request.data  # parse the body, stopping at the first sign of a bad file
+        self.upload_handler.raise_if_rejected()
+        # The paper goes on its subject's shard
+        with use_shard(locate(Subject, request.data.get('subject'))):
+            return super().create(request, *args, **kwargs)
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['upload_limits'] = getattr(self, 'upload_limits', None)
+        return context
 
     def perform_create(self, serializer):
         # Verify user has access to the subject's college
@@ -171,7 +262,10 @@ class PYQUploadView(generics.CreateAPIView):
         if not user_colleges.filter(id=subject.branch.college.id).exists():
             raise PermissionDenied("You don't have access to upload PYQs for this college")
         
-        serializer.save(uploaded_by=self.request.user)
+        pyq = serializer.save(uploaded_by=self.request.user)
+        mark_recent_write(self.request.user)
+        record_event('upload', self.request.user, pyq=pyq)
+        queue_duplicate_scan(pyq)
 
 
 class PYQModerationView(generics.UpdateAPIView):
@@ -182,24 +276,35 @@ class PYQModerationView(generics.UpdateAPIView):
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return PreviousYearQuestion.objects.all()
+        return pyq_queryset()
 
     def perform_update(self, serializer):
-        pyq = self.get_object()
+        pyq = serializer.instance
         college = pyq.subject.branch.college
         
         # Check if user can moderate for this college
         if not RoleBasedPermissionMixin.can_moderate_pyqs(self.request.user, college):
             raise PermissionDenied("You don't have permission to moderate PYQs for this college")
+        moderation_queue.ensure_not_claimed_by_other(pyq, self.request.user)
         
-        serializer.save()
+        from_status, old_notes = pyq.status, pyq.review_notes
+        with transaction.atomic(using=pyq._state.db):
+            if 'status' in serializer.validated_data:
+                # Reviewed papers leave the moderation queue
+                serializer.save(claimed_by=None, claim_expires_at=None)
+            else:
+                serializer.save()
+            if pyq.status != from_status or pyq.review_notes != old_notes:
+                changes = {} if pyq.status != from_status else {'review_notes': [old_notes, pyq.review_notes]}
+                moderation_log.record(pyq, self.request.user, from_status, pyq.review_notes, changes)
+        mark_recent_write(self.request.user)
 
 
-class PendingPYQListView(generics.ListAPIView):
+class PendingPYQListView(FanOutMixin, ReplicaReadMixin, generics.ListAPIView):
     """
     GET /api/pyqs/pending/ - Get pending PYQs for moderation
     """
-    serializer_class = PreviousYearQuestionSerializer
+    serializer_class = PendingPYQSerializer
     permission_classes = [IsAuthenticated]
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
     search_fields = ['subject__name', 'uploaded_by__username', 'regulation']
@@ -212,28 +317,77 @@ class PendingPYQListView(generics.ListAPIView):
         
         if user.is_superuser:
             # Superusers can see all pending PYQs
-            return PreviousYearQuestion.objects.filter(status='pending').select_related(
-                'subject', 'subject__branch', 'subject__branch__college', 'uploaded_by', 'reviewed_by'
-            )
+            return with_moderation_details(PreviousYearQuestion.objects.filter(status='pending'))
         
         # Get colleges where user has moderation permissions
-        user_colleges = RoleBasedPermissionMixin.get_user_colleges(user)
-        accessible_colleges = []
-        
-        for college in user_colleges:
-            if RoleBasedPermissionMixin.can_moderate_pyqs(user, college):
-                accessible_colleges.append(college)
-        
-        if not accessible_colleges:
-            return PreviousYearQuestion.objects.none()
+        accessible_colleges = RoleBasedPermissionMixin.get_moderated_colleges(user)
         
         # Return pending PYQs from accessible colleges
-        return PreviousYearQuestion.objects.filter(
+        return with_moderation_details(PreviousYearQuestion.objects.filter(
             status='pending',
             subject__branch__college__in=accessible_colleges
-        ).select_related(
-            'subject', 'subject__branch', 'subject__branch__college', 'uploaded_by', 'reviewed_by'
-        )
+        ))
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['downloads_authorized'] = True
+        return context
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def claim_pending_pyqs(request):
+    """
+    POST /api/pyqs/pending/claim/ {"size": 10} - Lease the next batch of unclaimed
+    pending PYQs to this moderator, oldest first. Papers the moderator already
+    holds count toward the batch and are renewed; unreviewed papers go back to
+    the queue when the lease expires.
+    """
+    if not RoleBasedPermissionMixin.get_moderated_colleges(request.user).exists():
+        raise PermissionDenied("You don't have permission to moderate PYQs")
+    
+    try:
+        size = int(request.data.get('size', settings.MODERATION_CLAIM_BATCH_SIZE))
+    except (TypeError, ValueError):
+        return Response({'error': 'size must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+    size = max(1, min(size, 50))
+    
+    # Fill the batch from each of the moderator's shards in turn
+    claimed, expires_at = [], None
+    for alias in request_shards():
+        with use_shard(alias):
+            batch, batch_expires_at = moderation_queue.claim_batch(request.user, size - len(claimed))
+            claimed += with_moderation_details(batch)
+        expires_at = expires_at or batch_expires_at
+        if len(claimed) >= size:
+            break
+    mark_recent_write(request.user)
+    serializer = PendingPYQSerializer(
+        claimed, many=True, context={'request': request, 'downloads_authorized': True}
+    )
+    return Response({
+        'lease_expires_at': expires_at,
+        'pyqs': serializer.data,
+    })
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def release_pending_pyqs(request):
+    """
+    POST /api/pyqs/pending/release/ {"ids": [1, 2]} - Return claimed PYQs to the
+    queue; without ids, all of this moderator's claims are released
+    """
+    ids = request.data.get('ids')
+    if ids is not None and not (isinstance(ids, list) and all(isinstance(pk, int) for pk in ids)):
+        return Response({'error': 'ids must be a list of PYQ ids'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    released = 0
+    for alias in request_shards():
+        with use_shard(alias):
+            released += moderation_queue.release(request.user, ids)
+    mark_recent_write(request.user)
+    return Response({'released': released})
 
 
 @api_view(['PATCH'])
@@ -243,7 +397,7 @@ def update_pyq_details(request, pk):
     PATCH /api/pyqs/<id>/update-details/ - Update PYQ details (year, semester, regulation) during moderation
     """
     try:
-        pyq = get_object_or_404(PreviousYearQuestion, pk=pk)
+        pyq = get_object_or_404(pyq_queryset(), pk=pk)
         college = pyq.subject.branch.college
         
         # Check if user can moderate for this college
@@ -255,15 +409,18 @@ def update_pyq_details(request, pk):
         semester = request.data.get('semester') 
         regulation = request.data.get('regulation')
         
-        # Update the fields if provided
-        if year is not None:
-            pyq.year = year
-        if semester is not None:
-            pyq.semester = semester
-        if regulation is not None:
-            pyq.regulation = regulation
-            
-        pyq.save()
+        # Update the fields if provided, noting what changed for the history
+        changes = {}
+        for field, value in (('year', year), ('semester', semester), ('regulation', regulation)):
+            if value is not None and value != getattr(pyq, field):
+                changes[field] = [getattr(pyq, field), value]
+                setattr(pyq, field, value)
+        
+        with transaction.atomic(using=pyq._state.db):
+            pyq.save()
+            if changes:
+                moderation_log.record(pyq, request.user, pyq.status, changes=changes)
+        mark_recent_write(request.user)
         
         serializer = PreviousYearQuestionSerializer(pyq)
         return Response(serializer.data)
@@ -279,7 +436,7 @@ def moderate_pyq(request, pk):
     POST /api/pyqs/<id>/moderate/ - Approve or reject a PYQ
     """
     try:
-        pyq = get_object_or_404(PreviousYearQuestion, pk=pk)
+        pyq = get_object_or_404(pyq_queryset(), pk=pk)
         college = pyq.subject.branch.college
         
         # Check if user can moderate for this college
@@ -293,12 +450,21 @@ def moderate_pyq(request, pk):
             return Response({'error': 'Action must be either "approve" or "reject"'}, 
                           status=status.HTTP_400_BAD_REQUEST)
         
-        # Update PYQ status
+        # Another moderator may be reviewing it from their claimed batch
+        moderation_queue.ensure_not_claimed_by_other(pyq, request.user)
+        
+        # Update PYQ status; reviewed papers leave the moderation queue
+        from_status = pyq.status
         pyq.status = 'approved' if action == 'approve' else 'rejected'
         pyq.reviewed_by = request.user
         pyq.reviewed_at = timezone.now()
         pyq.review_notes = notes
-        pyq.save()
+        pyq.claimed_by = None
+        pyq.claim_expires_at = None
+        with transaction.atomic(using=pyq._state.db):
+            pyq.save()
+            moderation_log.record(pyq, request.user, from_status, notes)
+        mark_recent_write(request.user)
         
         serializer = PreviousYearQuestionSerializer(pyq)
         return Response({
@@ -312,22 +478,24 @@ def moderate_pyq(request, pk):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@reads_from_replica
 def user_role_info(request):
     """
     GET /api/user-role-info/ - Get current user's role information
     """
     user = request.user
     colleges = RoleBasedPermissionMixin.get_user_colleges(user)
+    college_roles = RoleBasedPermissionMixin.get_college_roles(user)
     
     roles = []
     for college in colleges:
-        user_role = RoleBasedPermissionMixin.get_user_role(user, college)
+        user_role = 'superuser' if user.is_superuser else college_roles.get(college.id, 'student')
         roles.append({
             'college_id': college.id,
             'college_name': college.name,
             'role': user_role,
-            'can_manage': RoleBasedPermissionMixin.can_manage_college(user, college),
-            'can_moderate': RoleBasedPermissionMixin.can_moderate_pyqs(user, college)
+            'can_manage': user.is_superuser or user_role == 'admin',
+            'can_moderate': user.is_superuser or user_role in ['admin', 'moderator']
         })
     
     return Response({
@@ -339,7 +507,7 @@ def user_role_info(request):
     })
 
 
-class UserRoleListView(generics.ListAPIView):
+class UserRoleListView(ReplicaReadMixin, generics.ListAPIView):
     """
     GET /api/user-roles/?college_id= - List user roles for a college (admin/superadmin only)
     """
@@ -369,54 +537,132 @@ class UserRoleListView(generics.ListAPIView):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@reads_from_replica
+def related_pyqs(request, pk):
+    """
+    GET /api/pyqs/<id>/related/ - Papers often bookmarked or downloaded
+    together with this one, best first, from the table build_related_pyqs
+    maintains. Only approved papers from the user's colleges are listed.
+    """
+    # One query on the (pyq, rank) index; the college check is a subquery
+    related = list(
+        RelatedPYQ.objects.filter(
+            pyq_id=pk,
+            related__status='approved',
+            related__subject__branch__college__in=RoleBasedPermissionMixin.get_user_colleges(request.user),
+        )
+        .select_related(
+            'related__subject__branch__college', 'related__uploaded_by', 'related__reviewed_by'
+        )
+        .order_by('rank')
+    )
+    data = PreviousYearQuestionSerializer(
+        [entry.related for entry in related], many=True,
+        context={'request': request, 'downloads_authorized': True},
+    ).data
+    for item, entry in zip(data, related):
+        item['similarity'] = round(entry.score, 4)
+    return Response(data)
+
+
+def record_paper_access(user, pyq, download):
+    """Count a download or inline view and log it as a usage event"""
+    record_access(pyq.id, download)
+    record_event('download' if download else 'view', user, pyq=pyq)
+
+
+def paper_size(pyq):
+    """
+    The paper's size in bytes. Papers uploaded before file_size was recorded
+    ask the storage once and keep the answer; None if the storage can't say.
+    """
+    if pyq.file_size is None:
+        try:
+            pyq.file_size = pyq.paper_file.size
+        except Exception:
+            logger.warning('Could not get the size of %s', pyq.paper_file.name, exc_info=True)
+            return None
+        PreviousYearQuestion.objects.filter(pk=pyq.pk).update(file_size=pyq.file_size)
+    return pyq.file_size
+
+
+def get_download_filename(pyq):
+    """Descriptive filename for a PYQ download, e.g. Networks_2023_Sem5_2019.pdf"""
+    descriptive_name = f"{pyq.subject.name}_{pyq.year}_Sem{pyq.semester}"
+    if pyq.regulation:
+        descriptive_name += f"_{pyq.regulation}"
+    
+    _, ext = os.path.splitext(os.path.basename(pyq.paper_file.name))
+    return f"{descriptive_name}{ext}"
+
+
+def get_content_type(file_name):
+    content_type, _ = mimetypes.guess_type(file_name)
+    return content_type or 'application/octet-stream'
+
+
+@api_view(['GET'])
+@authentication_classes([SignedDownloadAuthentication, SessionAuthentication, TokenAuthentication])
+@permission_classes([IsAuthenticated])
+@throttle_classes([DownloadThrottle])
+@reads_from_replica
 def pyq_download(request, pk):
     """
     GET /api/pyqs/<id>/download/ - Download or view PYQ PDF file
+    GET /api/pyqs/<id>/download/?user=&expires=&signature= - Same, authorized by a signed URL
     """
     try:
-        pyq = get_object_or_404(PreviousYearQuestion, pk=pk)
-        
-        # Check if user has access to this PYQ's college
-        user_colleges = RoleBasedPermissionMixin.get_user_colleges(request.user)
-        college = pyq.subject.branch.college
+        pyq = get_object_or_404(pyq_queryset(), pk=pk)
         
-        if not user_colleges.filter(id=college.id).exists():
-            raise PermissionDenied("You don't have access to this PYQ")
-        
-        # Only allow access to approved PYQs unless user can moderate
-        if pyq.status != 'approved' and not request.user.is_superuser:
-            if not RoleBasedPermissionMixin.can_moderate_pyqs(request.user, college):
-                raise PermissionDenied("This PYQ is not approved for viewing")
+        # Signed URLs were only issued to users passing the checks below
+        if request.auth != SIGNED_URL:
+            # Check if user has access to this PYQ's college
+            user_colleges = RoleBasedPermissionMixin.get_user_colleges(request.user)
+            college = pyq.subject.branch.college
+            
+            if not user_colleges.filter(id=college.id).exists():
+                raise PermissionDenied("You don't have access to this PYQ")
+            
+            # Only allow access to approved PYQs unless user can moderate
+            if pyq.status != 'approved' and not request.user.is_superuser:
+                if not RoleBasedPermissionMixin.can_moderate_pyqs(request.user, college):
+                    raise PermissionDenied("This PYQ is not approved for viewing")
         
-        # Check if file exists
-        if not pyq.paper_file or not os.path.exists(pyq.paper_file.path):
+        if not pyq.paper_file:
             raise Http404("File not found")
         
         # Determine if user wants to download or view inline
         download = request.GET.get('download', 'false').lower() == 'true'
         
-        # Get file information
-        file_path = pyq.paper_file.path
-        file_name = os.path.basename(file_path)
+        descriptive_filename = get_download_filename(pyq)
+        content_type = get_content_type(pyq.paper_file.name)
+        paper_cache = get_paper_cache()
         
-        # Generate a descriptive filename for download
-        descriptive_name = f"{pyq.subject.name}_{pyq.year}_Sem{pyq.semester}"
-        if pyq.regulation:
-            descriptive_name += f"_{pyq.regulation}"
+        if is_local(pyq.paper_file):
+            # Check if file exists
+            if not os.path.exists(pyq.paper_file.path):
+                raise Http404("File not found")
         
-        # Get file extension
-        _, ext = os.path.splitext(file_name)
-        descriptive_filename = f"{descriptive_name}{ext}"
+        # Buffered in memory and written to the database in batches
+        record_paper_access(request.user, pyq, download)
         
-        # Determine content type
-        content_type, _ = mimetypes.guess_type(file_path)
-        if not content_type:
-            content_type = 'application/octet-stream'
+        if not is_local(pyq.paper_file) and paper_cache is None:
+            # Papers in object storage are served by the bucket itself
+            response = HttpResponseRedirect(presigned_url(
+                pyq.paper_file, descriptive_filename, content_type, download=download,
+            ))
+            charge_bytes('download', request, response, size=paper_size(pyq))
+            return response
         
         # Create response
         try:
+            if is_local(pyq.paper_file):
+                paper = open(pyq.paper_file.path, 'rb')
+            else:
+                paper = paper_cache.open(pyq.paper_file)
+            
             response = FileResponse(
-                open(file_path, 'rb'),
+                paper,
                 content_type=content_type,
                 filename=descriptive_filename
             )
@@ -428,6 +674,8 @@ def pyq_download(request, pk):
                 # View inline (for PDFs in browser)
                 response['Content-Disposition'] = f'inline; filename="{descriptive_filename}"'
             
+            # Counts against the user's hourly download byte budget
+            charge_bytes('download', request, response)
             return response
             
         except Exception as e:
@@ -437,7 +685,112 @@ def pyq_download(request, pk):
         raise Http404("PYQ not found")
 
 
-class BookmarkListView(generics.ListAPIView):
+def _moderation_colleges(request, colleges):
+    """Narrow colleges to ?college_id=, or raise PermissionDenied if none are left"""
+    college_id = request.query_params.get('college_id')
+    if college_id:
+        colleges = colleges.filter(id=college_id if college_id.isdigit() else None)
+    college_ids = list(colleges.values_list('id', flat=True))
+    if not college_ids:
+        raise PermissionDenied("You don't have permission to view this college's moderation history")
+    return college_ids
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@reads_from_replica
+def moderation_history(request):
+    """
+    GET /api/moderation/history/?college_id=&moderator_id=&pyq_id=&before= - Moderation
+    decisions and edits in the colleges the user moderates, newest first. Pass the
+    returned next_before as before to get the next page.
+    """
+    college_ids = _moderation_colleges(request, RoleBasedPermissionMixin.get_moderated_colleges(request.user))
+    events = fan_out(
+        ModerationEvent.objects.filter(college_id__in=college_ids).select_related('moderator'),
+        shards_of_colleges(college_ids),
+    )
+    for param, field in (('moderator_id', 'moderator_id'), ('pyq_id', 'pyq_id')):
+        value = request.query_params.get(param)
+        if value:
+            if not value.isdigit():
+                return Response({'error': f'{param} must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+            events = events.filter(**{field: value})
+    
+    before = request.query_params.get('before')
+    try:
+        limit = min(int(request.query_params.get('limit', moderation_log.TIMELINE_LIMIT)), 200)
+        page, next_before = moderation_log.timeline(events, int(before) if before else None, max(limit, 1))
+    except ValueError:
+        return Response({'error': 'before and limit must be numbers'}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({
+        'results': ModerationEventSerializer(page, many=True).data,
+        'next_before': next_before,
+    })
+
+
+def _query_datetime(request, param):
+    value = request.query_params.get(param)
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValueError(value)
+    return timezone.make_aware(parsed) if timezone.is_naive(parsed) else parsed
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@reads_from_replica
+def moderation_stats(request):
+    """
+    GET /api/moderation/stats/?college_id=&since=&until= - Per-moderator review
+    throughput in the colleges the user administers (default: the last 7 days)
+    """
+    college_ids = _moderation_colleges(request, RoleBasedPermissionMixin.get_managed_colleges(request.user))
+    try:
+        until = _query_datetime(request, 'until') or timezone.now()
+        since = _query_datetime(request, 'since') or until - timedelta(days=7)
+    except ValueError:
+        return Response({'error': 'since and until must be ISO 8601 datetimes'}, status=status.HTTP_400_BAD_REQUEST)
+    if since >= until:
+        return Response({'error': 'since must be before until'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    events = fan_out(ModerationEvent.objects.filter(college_id__in=college_ids), shards_of_colleges(college_ids))
+    return Response({
+        'since': since,
+        'until': until,
+        'moderators': moderation_log.throughput(events, since, until),
+    })
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@reads_from_replica
+def export_spreadsheet(request, dataset, file_type):
+    """
+    GET /api/exports/pyqs.csv, /api/exports/moderation.xlsx, ...?college_id= -
+    Stream the papers, or the moderation decisions, of the colleges the user
+    administers as a CSV or XLSX attachment
+    """
+    if dataset not in EXPORTS or file_type not in CONTENT_TYPES:
+        raise Http404("Unknown export")
+    
+    colleges = RoleBasedPermissionMixin.get_managed_colleges(request.user)
+    college_id = request.query_params.get('college_id')
+    if college_id:
+        if not college_id.isdigit():
+            return Response({'error': 'college_id must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+        colleges = colleges.filter(id=college_id)
+    college_ids = list(colleges.values_list('id', flat=True))
+    if not college_ids:
+        raise PermissionDenied("You don't have permission to export this college's data")
+    
+    queryset = fan_out(export_queryset(dataset, colleges), shards_of_colleges(college_ids))
+    return export_response(dataset, queryset, file_type)
+
+
+class BookmarkListView(FanOutMixin, ReplicaReadMixin, generics.ListAPIView):
     """
     GET /api/bookmarks/ - List user's bookmarks
     """
@@ -450,7 +803,10 @@ class BookmarkListView(generics.ListAPIView):
         return Bookmark.objects.filter(
             user=self.request.user,
             pyq__status='approved'  # Only show bookmarks for approved PYQs
-        ).select_related('pyq', 'pyq__subject', 'pyq__subject__branch', 'pyq__subject__branch__college')
+        ).select_related(
+            'pyq', 'pyq__subject', 'pyq__subject__branch', 'pyq__subject__branch__college',
+            'pyq__uploaded_by', 'pyq__reviewed_by'
+        )
 
 
 class BookmarkCreateView(generics.CreateAPIView):
@@ -461,6 +817,11 @@ class BookmarkCreateView(generics.CreateAPIView):
     serializer_class = BookmarkSerializer
     permission_classes = [IsAuthenticated]
 
+    def create(self, request, *args, **kwargs):
+        # The bookmark goes on its paper's shard
+        with use_shard(locate(PreviousYearQuestion, request.data.get('pyq'))):
+            return super().create(request, *args, **kwargs)
+
     def perform_create(self, serializer):
         pyq = serializer.validated_data['pyq']
         
@@ -478,6 +839,7 @@ class BookmarkCreateView(generics.CreateAPIView):
         
         try:
             serializer.save(user=self.request.user)
+            mark_recent_write(self.request.user)
         except Exception as e:
             # Handle unique constraint violation (bookmark already exists)
             if 'UNIQUE constraint failed' in str(e):
@@ -496,7 +858,7 @@ def bookmark_toggle(request, pyq_id):
     DELETE /api/pyqs/<pyq_id>/bookmark/ - Remove a PYQ from bookmarks
     """
     try:
-        pyq = get_object_or_404(PreviousYearQuestion, pk=pyq_id)
+        pyq = get_object_or_404(pyq_queryset(), pk=pyq_id)
         
         # Check if user has access to this PYQ's college
         user_colleges = RoleBasedPermissionMixin.get_user_colleges(request.user)
@@ -518,6 +880,8 @@ def bookmark_toggle(request, pyq_id):
             )
             
             if created:
+                mark_recent_write(request.user)
+                record_event('bookmark', request.user, pyq=pyq)
                 serializer = BookmarkSerializer(bookmark)
                 return Response({
                     'message': 'PYQ bookmarked successfully',
@@ -534,6 +898,8 @@ def bookmark_toggle(request, pyq_id):
             
             if bookmark:
                 bookmark.delete()
+                mark_recent_write(request.user)
+                record_event('unbookmark', request.user, pyq=pyq)
                 return Response({
                     'message': 'Bookmark removed successfully'
                 }, status=status.HTTP_200_OK)
@@ -548,6 +914,7 @@ def bookmark_toggle(request, pyq_id):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@reads_from_replica
 def check_bookmark_status(request, pyq_id):
     """
     GET /api/pyqs/<pyq_id>/bookmark-status/ - Check if a PYQ is bookmarked by the user
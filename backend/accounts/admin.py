@@ -1,7 +1,14 @@
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
 from django.contrib.auth.models import User
 from django.contrib.auth.admin import UserAdmin
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
+from academics.models import College
+from pyqachu_backend.pagination import EstimatedCountPaginator
 from .models import UserProfile
+from .roster import import_roster
 
 
 class UserProfileInline(admin.StackedInline):
@@ -10,8 +17,64 @@ class UserProfileInline(admin.StackedInline):
     verbose_name_plural = 'Profile'
 
 
+class RosterUploadForm(forms.Form):
+    roster = forms.FileField(help_text='CSV or XLSX with username, email, first_name, last_name, password, role, college')
+    college = forms.ModelChoiceField(
+        queryset=College.objects.filter(is_active=True), required=False,
+        help_text='Used for rows without a college column'
+    )
+    batch_size = forms.IntegerField(initial=500, min_value=1)
+
+
 class CustomUserAdmin(UserAdmin):
     inlines = (UserProfileInline,)
+    change_list_template = 'admin/auth/user/change_list.html'
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_urls(self):
+        urls = [
+            path('import-roster/', self.admin_site.admin_view(self.import_roster_view),
+                 name='auth_user_import_roster'),
+        ]
+        return urls + super().get_urls()
+
+    def import_roster_view(self, request):
+        if not self.has_add_permission(request):
+            return redirect('admin:auth_user_changelist')
+
+        if request.method == 'POST':
+            form = RosterUploadForm(request.POST, request.FILES)
+            if form.is_valid():
+                roster = form.cleaned_data['roster']
+                try:
+                    report = import_roster(
+                        roster, roster.name,
+                        college=form.cleaned_data['college'],
+                        assigned_by=request.user,
+                        batch_size=form.cleaned_data['batch_size'],
+                    )
+                except ValueError as e:
+                    form.add_error('roster', str(e))
+                else:
+                    for line, error in report['errors'][:20]:
+                        self.message_user(request, f'Line {line}: {error}', messages.WARNING)
+                    self.message_user(
+                        request,
+                        f"Created {report['created']} users, skipped {report['skipped']} rows "
+                        f"in {report['total_seconds']:.2f}s ({report['overall_rate']:.0f} users/s).",
+                    )
+                    return redirect('admin:auth_user_changelist')
+        else:
+            form = RosterUploadForm()
+
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Import student roster',
+            'form': form,
+        }
+        return TemplateResponse(request, 'admin/auth/user/import_roster.html', context)
 
 
 # Unregister the default User admin and register the custom one
@@ -1,3 +1,184 @@
-from django.test import TestCase
+import io
+import os
+import tempfile
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from academics.models import College, UserRole
+from .roster import import_roster
+
+
+class QueryBudgetTests(TestCase):
+    """Fixed query counts for the account endpoints"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('student', email='student@example.com', password='pass-1234-word')
+        self.client = APIClient()
+
+    def assertWithinBudget(self, budget, method, url, data=None, status=200):
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url, data, format='json')
+        self.assertEqual(response.status_code, status, response.data)
+        self.assertLessEqual(
+            len(queries), budget,
+            f'{method.upper()} {url} ran {len(queries)} queries:\n'
+            + '\n'.join(q['sql'] for q in queries.captured_queries)
+        )
+
+    def test_register(self):
+        self.assertWithinBudget(6, 'post', '/api/accounts/register/', {
+            'username': 'new-student',
+            'email': 'new@example.com',
+            'password': 'pass-1234-word',
+            'password_confirm': 'pass-1234-word',
+            'first_name': 'New',
+            'last_name': 'Student',
+        }, status=201)
+
+    def test_login(self):
+        self.assertWithinBudget(6, 'post', '/api/accounts/login/', {
+            'username': 'student', 'password': 'pass-1234-word',
+        })
+
+    def test_profile(self):
+        # A fresh instance, so the profile isn't already cached on it
+        self.client.force_authenticate(User.objects.get(pk=self.user.pk))
+        self.assertWithinBudget(1, 'get', '/api/accounts/profile/')
+
+    def test_logout(self):
+        Token.objects.create(user=self.user)
+        self.client.force_authenticate(self.user)
+        self.assertWithinBudget(1, 'post', '/api/accounts/logout/')
+
+
+@override_settings(THROTTLE_ENABLED=True, THROTTLE_RATES={'login': {'user': '2/hour', 'ip': '100/min'}})
+class LoginThrottleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        User.objects.create_user('student', password='pass-1234-word')
+        User.objects.create_user('other', password='pass-1234-word')
+        self.client = APIClient()
+
+    def login(self, username, password='pass-1234-word', ip='127.0.0.1'):
+        return self.client.post(
+            '/api/accounts/login/', {'username': username, 'password': password}, format='json', REMOTE_ADDR=ip,
+        )
+
+    def test_attempts_are_limited_per_username(self):
+        for _ in range(2):
+            self.assertEqual(self.login('student', 'wrong').status_code, 400)
+
+        # Even the right password is refused until the window passes, without hashing it
+        with self.assertNumQueries(0):
+            response = self.login('Student')
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+
+        self.assertEqual(self.login('other').status_code, 200)
+
+    def test_successful_logins_do_not_use_up_the_budget(self):
+        for _ in range(4):
+            self.assertEqual(self.login('student').status_code, 200)
+        for _ in range(2):
+            self.assertEqual(self.login('student', 'wrong').status_code, 400)
+        self.assertEqual(self.login('student').status_code, 429)
+
+    def test_failures_from_another_ip_do_not_lock_the_owner_out(self):
+        for _ in range(3):
+            self.login('student', 'wrong', ip='10.0.0.1')
+        self.assertEqual(self.login('student', ip='10.0.0.1').status_code, 429)
+        self.assertEqual(self.login('student', ip='10.0.0.2').status_code, 200)
+
+
+class RosterImportTests(TestCase):
+    HEADER = 'username,email,first_name,last_name,password,role,college\n'
+
+    def setUp(self):
+        self.college = College.objects.create(name='Test College')
+        self.admin = User.objects.create_superuser('admin', email='admin@example.com', password='x')
+        User.objects.create_user('Existing', email='Taken@Example.com', password='x')
+
+    def roster(self, *rows):
+        return io.BytesIO((self.HEADER + ''.join(f'{row}\n' for row in rows)).encode())
+
+    def test_valid_roster(self):
+        report = import_roster(self.roster(
+            'alice,Alice@Example.com,Alice,A,pass-1234-word,student,Test College',
+            f'bob,bob@example.com,Bob,B,,moderator,{self.college.id}',
+        ), 'roster.csv', assigned_by=self.admin, workers=1)
+        self.assertEqual((report['created'], report['errors']), (2, []))
+
+        alice = User.objects.get(username='alice')
+        self.assertEqual((alice.email, alice.first_name, alice.profile.role), ('alice@example.com', 'Alice', 'student'))
+        self.assertTrue(alice.check_password('pass-1234-word'))
+        # Without a password the account can't log in until one is set
+        self.assertFalse(User.objects.get(username='bob').has_usable_password())
+        roles = UserRole.objects.filter(college=self.college, assigned_by=self.admin)
+        self.assertEqual(set(roles.values_list('user__username', 'role')), {('alice', 'student'), ('bob', 'moderator')})
+
+    def test_duplicate_and_existing_accounts_are_skipped(self):
+        report = import_roster(self.roster(
+            'alice,alice@example.com,,,,student,',
+            'ALICE,other@example.com,,,,student,',
+            'carol,ALICE@example.com,,,,student,',
+            'existing,new@example.com,,,,student,',
+            'dave,taken@example.com,,,,student,',
+        ), 'roster.csv', college=self.college, workers=1)
+
+        self.assertEqual(report['created'], 1)
+        self.assertEqual([line for line, _ in report['errors']], [3, 4, 5, 6])
+        self.assertIn('already exists', dict(report['errors'])[5])
+        self.assertIn('already registered', dict(report['errors'])[6])
+        self.assertEqual(
+            set(User.objects.values_list('username', flat=True)), {'admin', 'Existing', 'alice'},
+        )
+
+    def test_roles_and_colleges_are_validated(self):
+        report = import_roster(self.roster(
+            'alice,,,,,dean,Test College',
+            'bob,,,,,student,Nowhere',
+            ',,,,,student,Test College',
+        ), 'roster.csv', workers=1)
+        self.assertEqual(report['created'], 0)
+        self.assertEqual(
+            [error for _, error in report['errors']],
+            ['Unknown role "dean"', 'Unknown college for bob', 'Missing username'],
+        )
+
+    def test_admin_upload(self):
+        self.client.force_login(self.admin)
+        upload = SimpleUploadedFile('roster.csv', self.roster('alice,alice@example.com,,,,student,').getvalue())
+        response = self.client.post(reverse('admin:auth_user_import_roster'), {
+            'roster': upload, 'college': self.college.id, 'batch_size': 500,
+        })
+        self.assertRedirects(response, reverse('admin:auth_user_changelist'), fetch_redirect_response=False)
+        self.assertTrue(UserRole.objects.filter(
+            user__username='alice', college=self.college, assigned_by=self.admin,
+        ).exists())
+
+        response = self.client.post(reverse('admin:auth_user_import_roster'), {
+            'roster': SimpleUploadedFile('roster.txt', b'username\n'), 'batch_size': 500,
+        })
+        self.assertContains(response, 'Unsupported spreadsheet format')
+
+    def test_import_students_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'roster.csv')
+            with open(path, 'wb') as roster:
+                roster.write(self.roster('alice,,,,,student,', 'alice,,,,,student,').getvalue())
+            out, err = StringIO(), StringIO()
+            call_command('import_students', path, '--college', str(self.college.id), '--workers', '1',
+                         stdout=out, stderr=err)
+        self.assertIn('Created 1 users, skipped 1 rows', out.getvalue())
+        self.assertIn('Line 3: Duplicate row for alice', err.getvalue())
 
-# Create your tests here.
@@ -1,11 +1,12 @@
 from django.shortcuts import render
 from rest_framework import status
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from rest_framework.authtoken.models import Token
 from django.contrib.auth.models import User
 from django.contrib.auth import login
+from pyqachu_backend.throttling import LoginThrottle
 from .serializers import UserRegistrationSerializer, UserLoginSerializer
 
 
@@ -39,6 +40,7 @@ def register_user(request):
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes([LoginThrottle])
 def login_user(request):
     """
     Login user and return authentication token
@@ -48,6 +50,7 @@ def login_user(request):
     if serializer.is_valid():
         user = serializer.validated_data['user']
         token, created = Token.objects.get_or_create(user=user)
+        LoginThrottle.succeeded(request)
         
         return Response({
             'message': 'Login successful',
@@ -0,0 +1,93 @@
+import random
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+# Set while a read-only view runs; the router only uses replicas inside it
+_replica_reads = ContextVar('replica_reads', default=False)
+
+
+def _sticky_key(user_id):
+    return f'db-sticky:{user_id}'
+
+
+def mark_recent_write(user):
+    """Pin the user's reads to the primary for DATABASE_STICKY_SECONDS"""
+    if settings.DATABASE_REPLICAS and user.is_authenticated:
+        cache.set(_sticky_key(user.pk), True, settings.DATABASE_STICKY_SECONDS)
+
+
+async def amark_recent_write(user):
+    if settings.DATABASE_REPLICAS and user.is_authenticated:
+        await cache.aset(_sticky_key(user.pk), True, settings.DATABASE_STICKY_SECONDS)
+
+
+def is_sticky(user):
+    return user.is_authenticated and bool(cache.get(_sticky_key(user.pk)))
+
+
+async def ais_sticky(user):
+    return user.is_authenticated and bool(await cache.aget(_sticky_key(user.pk)))
+
+
+@contextmanager
+def replica_reads(user):
+    """Route reads to a replica unless the user wrote something recently"""
+    enabled = bool(settings.DATABASE_REPLICAS) and not is_sticky(user)
+    token = _replica_reads.set(enabled)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+@asynccontextmanager
+async def areplica_reads(user):
+    """Async version of replica_reads; the context variable follows the ORM into its worker thread"""
+    enabled = bool(settings.DATABASE_REPLICAS) and not await ais_sticky(user)
+    token = _replica_reads.set(enabled)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def reads_from_replica(view):
+    """Decorator for function views that only read"""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        with replica_reads(request.user):
+            return view(request, *args, **kwargs)
+    return wrapper
+
+
+class ReplicaReadMixin:
+    """Mixin for read-only generic views"""
+
+    def get(self, request, *args, **kwargs):
+        with replica_reads(request.user):
+            return super().get(request, *args, **kwargs)
+
+
+class ReplicaRouter:
+    """Send reads inside replica_reads() to a replica and everything else to default"""
+
+    def db_for_read(self, model, **hints):
+        if _replica_reads.get() and settings.DATABASE_REPLICAS:
+            return random.choice(settings.DATABASE_REPLICAS)
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive schema changes through replication
+        return db not in settings.DATABASE_REPLICAS
@@ -0,0 +1,147 @@
+import os
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse, HttpResponseForbidden
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest,
+)
+from prometheus_client.core import GaugeMetricFamily
+from prometheus_client.multiprocess import MultiProcessCollector
+
+from . import query_log
+
+
+# With several gunicorn workers set PROMETHEUS_MULTIPROC_DIR to an empty
+# directory shared by them; metrics are then aggregated across workers at
+# scrape time (see gunicorn.conf.py).
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Request latency by route',
+    ['route', 'method'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+RESPONSES = Counter(
+    'http_responses_total', 'Responses by route and status code',
+    ['route', 'method', 'status'],
+)
+DB_QUERIES = Histogram(
+    'http_request_db_queries', 'Database queries per request',
+    ['route'],
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 250),
+)
+DB_TIME = Histogram(
+    'http_request_db_seconds', 'Database time per request',
+    ['route'],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5),
+)
+DOWNLOAD_BYTES = Counter(
+    'pyq_download_bytes_total', 'Bytes of PYQ files served by pyq_download',
+)
+PAPER_CACHE_EVENTS = Counter(
+    'pyq_paper_cache_events_total', 'Local paper cache lookups by result',
+    ['result'],
+)
+
+
+class PendingQueueCollector:
+    """Reports the moderation queue depth at scrape time"""
+
+    def describe(self):
+        # Without this, registering the collector calls collect() and so
+        # queries the database at import, before migrate has created the table
+        yield self._gauge()
+
+    def collect(self):
+        from academics.models import PreviousYearQuestion
+
+        gauge = self._gauge()
+        gauge.add_metric([], PreviousYearQuestion.objects.filter(status='pending').count())
+        yield gauge
+
+    def _gauge(self):
+        return GaugeMetricFamily('pyq_pending_queue_depth', 'PYQs waiting for moderation')
+
+
+def _multiprocess():
+    return bool(os.environ.get('PROMETHEUS_MULTIPROC_DIR'))
+
+
+if not _multiprocess():
+    REGISTRY.register(PendingQueueCollector())
+
+
+def _route(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.route or match.view_name
+
+
+def _observe(request, response, started, log):
+    route = _route(request)
+    method = request.method
+    REQUEST_LATENCY.labels(route, method).observe(time.perf_counter() - started)
+    RESPONSES.labels(route, method, str(response.status_code)).inc()
+    DB_QUERIES.labels(route).observe(log.count)
+    DB_TIME.labels(route).observe(log.duration)
+
+    match = getattr(request, 'resolver_match', None)
+    if match is not None and match.url_name == 'pyq-download' and response.status_code == 200:
+        length = response.get('Content-Length')
+        if length:
+            DOWNLOAD_BYTES.inc(int(length))
+
+
+class MetricsMiddleware:
+    """Records latency, status codes and DB usage for every request"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+
+        query_log.install(connection)
+        started = time.perf_counter()
+        with query_log.capture_queries() as log:
+            response = self.get_response(request)
+        _observe(request, response, started, log)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        with query_log.capture_queries() as log:
+            response = await self.get_response(request)
+        _observe(request, response, started, log)
+        return response
+
+
+def _render_metrics():
+    if _multiprocess():
+        registry = CollectorRegistry()
+        MultiProcessCollector(registry)
+        registry.register(PendingQueueCollector())
+    else:
+        registry = REGISTRY
+    return generate_latest(registry)
+
+
+def metrics_view(request):
+    """
+    GET /metrics - Prometheus text exposition. Requires
+    "Authorization: Bearer <METRICS_TOKEN>" when METRICS_TOKEN is set.
+    """
+    if settings.METRICS_TOKEN and request.headers.get('Authorization') != f'Bearer {settings.METRICS_TOKEN}':
+        return HttpResponseForbidden()
+    return HttpResponse(_render_metrics(), content_type=CONTENT_TYPE_LATEST)
+
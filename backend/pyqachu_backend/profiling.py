@@ -0,0 +1,198 @@
+import cProfile
+import os
+import pstats
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.http import JsonResponse
+from django.utils import timezone
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+from . import query_log
+
+
+# Call tree nodes below this share of the request's time are left out
+MIN_SHARE = 0.01
+MAX_DEPTH = 30
+
+
+def wants_profile(request):
+    # Checked on every request, so stick to plain META lookups
+    if request.META.get('HTTP_X_PROFILE') == '1':
+        return True
+    return '_profile=1' in request.META.get('QUERY_STRING', '') and request.GET.get('_profile') == '1'
+
+
+def profiling_user(request):
+    """The session or token user, or None; only called for flagged requests"""
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return user
+    try:
+        result = TokenAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        return None
+    return result[0] if result else None
+
+
+def _function_name(func):
+    filename, line, name = func
+    if filename == '~':
+        return name  # built-ins
+    return f'{query_log.short_path(filename)}:{line}({name})'
+
+
+def _profiled(get_response, request):
+    return get_response(request)
+
+
+async def _aprofiled(get_response, request):
+    return await get_response(request)
+
+
+def call_tree(stats, root, total):
+    """
+    Nest cProfile's caller/callee data under root. cProfile aggregates per
+    function, so each function is expanded once, where it is first reached
+    along the heaviest path; later appearances (recursion, or the
+    middleware chain calling the same wrapper again) are leaves.
+    """
+    callees = {}
+    for func, (_, _, _, _, callers) in stats.items():
+        for caller, (_, calls, _, cumulative) in callers.items():
+            callees.setdefault(caller, []).append((func, calls, cumulative))
+
+    threshold = total * MIN_SHARE
+    expanded = set()
+
+    def node(func, calls, cumulative, depth):
+        entry = {
+            'function': _function_name(func),
+            'calls': calls,
+            'cumulative_ms': round(cumulative * 1000, 3),
+            'own_ms': round(stats[func][2] * 1000, 3),
+            'children': [],
+        }
+        if func in expanded or depth >= MAX_DEPTH:
+            return entry
+        expanded.add(func)
+        for child, child_calls, child_cumulative in sorted(callees.get(func, ()), key=lambda callee: -callee[2]):
+            if child_cumulative >= threshold:
+                entry['children'].append(node(child, child_calls, child_cumulative, depth + 1))
+        return entry
+
+    for func, (_, calls, _, cumulative, _) in stats.items():
+        if func[0] == root.__code__.co_filename and func[2] == root.__name__:
+            return node(func, calls, cumulative, 0)
+    return None
+
+
+def _is_serializer_data(func):
+    filename, _, name = func
+    return name == 'data' and filename.endswith(os.path.join('rest_framework', 'serializers.py'))
+
+
+def serializer_seconds(stats):
+    """
+    Time spent producing serializer.data. Serializer.data and
+    ListSerializer.data both call BaseSerializer.data, so only the
+    outermost .data calls are counted.
+    """
+    return sum(
+        cumulative for func, (_, _, _, cumulative, callers) in stats.items()
+        if _is_serializer_data(func) and not any(_is_serializer_data(caller) for caller in callers)
+    )
+
+
+def build_report(request, response, profiler, root, log, elapsed):
+    stats = pstats.Stats(profiler).stats
+    report = {
+        'method': request.method,
+        'path': request.get_full_path(),
+        'status': response.status_code,
+        'total_ms': round(elapsed * 1000, 3),
+        'serializer_ms': round(serializer_seconds(stats) * 1000, 3),
+        'sql': {
+            'count': log.count,
+            'total_ms': round(log.duration * 1000, 3),
+            'queries': [],
+        },
+        'call_tree': call_tree(stats, root, elapsed),
+    }
+    for query in log.queries:
+        origin, own_frames = query_log.query_origin(query['stack'])
+        report['sql']['queries'].append({
+            'sql': query['sql'],
+            'ms': round(query['duration'] * 1000, 3),
+            'origin': origin,
+            'stack': own_frames,
+        })
+
+    if settings.PROFILE_DIR:
+        # Full stats for snakeviz / pstats, beyond what the JSON tree keeps
+        os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+        name = f"{timezone.now():%Y%m%d-%H%M%S-%f}-{request.path.strip('/').replace('/', '-') or 'root'}.prof"
+        path = os.path.join(settings.PROFILE_DIR, name)
+        profiler.dump_stats(path)
+        report['saved_to'] = path
+
+    return report
+
+
+class ProfilingMiddleware:
+    """
+    Profiles a request when a superuser sends "X-Profile: 1" or ?_profile=1,
+    and returns the report as JSON instead of the view's response: the call
+    tree, every SQL statement with its timing and the line that issued it,
+    and serializer time. The flag is ignored for everyone else.
+
+    Under ASGI the call tree only covers the event loop thread; queries run
+    through sync_to_async are still all captured.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not wants_profile(request):
+            return self.get_response(request)
+
+        user = profiling_user(request)
+        if user is None or not user.is_superuser:
+            return self.get_response(request)
+
+        profiler = cProfile.Profile()
+        with query_log.capture_queries(record_sql=True, record_stack=True) as log:
+            started = time.perf_counter()
+            response = profiler.runcall(_profiled, self.get_response, request)
+            elapsed = time.perf_counter() - started
+        return JsonResponse(build_report(request, response, profiler, _profiled, log, elapsed))
+
+    async def __acall__(self, request):
+        if not wants_profile(request):
+            return await self.get_response(request)
+
+        user = await sync_to_async(profiling_user)(request)
+        if user is None or not user.is_superuser:
+            return await self.get_response(request)
+
+        profiler = cProfile.Profile()
+        with query_log.capture_queries(record_sql=True, record_stack=True) as log:
+            started = time.perf_counter()
+            profiler.enable()
+            try:
+                response = await _aprofiled(self.get_response, request)
+            finally:
+                profiler.disable()
+            elapsed = time.perf_counter() - started
+        return JsonResponse(build_report(request, response, profiler, _aprofiled, log, elapsed))
@@ -0,0 +1,119 @@
+import logging
+import random
+import re
+from collections import Counter, defaultdict
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from . import query_log
+
+
+logger = logging.getLogger(__name__)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\bIN\s*\((?:\s*(?:%s|\?)\s*,?)+\)', re.IGNORECASE)
+_SPACE = re.compile(r'\s+')
+
+
+def normalize_sql(sql):
+    """Reduce a statement to its shape: literals and IN lists become placeholders"""
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = sql.replace('%s', '?')
+    sql = _IN_LIST.sub('IN (...)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+def find_problems(queries, repeat_threshold, slow_seconds):
+    """
+    Return (repeated, slow): statements of the same shape run at least
+    repeat_threshold times in one request, as (shape, queries) pairs, and
+    single queries that took at least slow_seconds.
+    """
+    groups = defaultdict(list)
+    for query in queries:
+        groups[normalize_sql(query['sql'])].append(query)
+    repeated = [(shape, group) for shape, group in groups.items() if len(group) >= repeat_threshold]
+    slow = [query for query in queries if query['duration'] >= slow_seconds]
+    return repeated, slow
+
+
+def _location(query):
+    """Our innermost frame that ran the query, or the first caller outside the ORM"""
+    origin, own_frames = query_log.query_origin(query['stack'])
+    return own_frames[-1] if own_frames else origin
+
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.view_name
+
+
+def report(request, log):
+    repeated, slow = find_problems(
+        log.queries,
+        settings.QUERY_DETECTOR_REPEAT_THRESHOLD,
+        settings.QUERY_DETECTOR_SLOW_MS / 1000,
+    )
+    view = _view_name(request)
+
+    for shape, group in repeated:
+        locations = Counter(_location(query) for query in group)
+        location, _ = locations.most_common(1)[0]
+        logger.warning(
+            'Possible N+1 in %s (%s %s): %d queries shaped like %s, from %s',
+            view, request.method, request.path, len(group), shape[:300], location,
+        )
+
+    for query in slow:
+        logger.warning(
+            'Slow query in %s (%s %s): %.1fms %s, from %s',
+            view, request.method, request.path, query['duration'] * 1000,
+            normalize_sql(query['sql'])[:300], _location(query),
+        )
+
+
+class QueryDetectorMiddleware:
+    """
+    Groups each sampled request's SQL by statement shape and logs repeated
+    shapes (N+1 patterns) and slow queries with the view and line that ran
+    them. QUERY_DETECTOR_SAMPLE_RATE sets the share of requests inspected;
+    it is 1 under "manage.py test" and 0 (off) otherwise unless configured.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def sampled(self):
+        rate = settings.QUERY_DETECTOR_SAMPLE_RATE
+        return rate >= 1 or (rate > 0 and random.random() < rate)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+
+        with query_log.capture_queries(record_sql=True, record_stack=True) as log:
+            response = self.get_response(request)
+        report(request, log)
+        return response
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+
+        with query_log.capture_queries(record_sql=True, record_stack=True) as log:
+            response = await self.get_response(request)
+        report(request, log)
+        return response
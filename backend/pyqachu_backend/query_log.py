@@ -0,0 +1,103 @@
+import os
+import time
+import traceback
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+
+
+# Active QueryLogs for the current request. A context variable, so queries
+# run by async views through sync_to_async are attributed correctly too.
+_active_logs = ContextVar('query_logs', default=())
+
+# Frames from these files are plumbing, never the origin of a query
+_PLUMBING = ('query_log.py', 'profiling.py', 'query_detector.py')
+_ORM = os.path.join('django', 'db', '')
+_SITE_PACKAGES = os.sep + 'site-packages' + os.sep
+
+
+class QueryLog:
+    """Query count and time for one request, optionally with each statement"""
+
+    def __init__(self, record_sql=False, record_stack=False):
+        self.record_sql = record_sql
+        self.record_stack = record_stack
+        self.count = 0
+        self.duration = 0.0
+        self.queries = []
+
+    def add(self, sql, duration, stack=None):
+        self.count += 1
+        self.duration += duration
+        if self.record_sql:
+            self.queries.append({'sql': sql, 'duration': duration, 'stack': stack})
+
+
+def _record_query(execute, sql, params, many, context):
+    logs = _active_logs.get()
+    if not logs:
+        return execute(sql, params, many, context)
+
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - started
+        stack = None
+        if any(log.record_stack for log in logs):
+            stack = traceback.extract_stack()[:-1]
+        for log in logs:
+            log.add(sql, duration, stack if log.record_stack else None)
+
+
+def install(connection):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+def _on_connection_created(sender, connection, **kwargs):
+    install(connection)
+
+
+connection_created.connect(_on_connection_created)
+
+
+@contextmanager
+def capture_queries(record_sql=False, record_stack=False):
+    """Collect every query run in this context (and its sync_to_async calls)"""
+    log = QueryLog(record_sql=record_sql, record_stack=record_stack)
+    token = _active_logs.set(_active_logs.get() + (log,))
+    try:
+        yield log
+    finally:
+        _active_logs.reset(token)
+
+
+def short_path(filename):
+    """Path relative to site-packages or the project, for reports"""
+    if _SITE_PACKAGES in filename:
+        return filename.split(_SITE_PACKAGES, 1)[1]
+    if filename.startswith(str(settings.BASE_DIR)):
+        return os.path.relpath(filename, settings.BASE_DIR)
+    return filename
+
+
+def _frame_name(frame):
+    return f'{short_path(frame.filename)}:{frame.lineno} in {frame.name}'
+
+
+def query_origin(stack):
+    """
+    Where a recorded query came from: the innermost caller outside the ORM
+    (often a DRF mixin or serializer evaluating a lazy queryset), plus the
+    frames of our own code on the way there, outermost first.
+    """
+    frames = [frame for frame in stack or () if not frame.filename.endswith(_PLUMBING)]
+    origin = next((frame for frame in reversed(frames) if _ORM not in frame.filename), None)
+    own = [
+        frame for frame in frames
+        if frame.filename.startswith(str(settings.BASE_DIR)) and _SITE_PACKAGES not in frame.filename
+    ]
+    return _frame_name(origin) if origin else None, [_frame_name(frame) for frame in own]
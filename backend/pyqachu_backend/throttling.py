@@ -0,0 +1,194 @@
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.throttling import BaseThrottle
+
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """'120/min' -> (120, 60), as in DRF's SimpleRateThrottle"""
+    count, period = rate.split('/')
+    return int(count), PERIODS[period[0]]
+
+
+def _window_keys(key, window, now):
+    index = int(now // window)
+    return f'throttle:{key}:{index}', f'throttle:{key}:{index - 1}', now - index * window
+
+
+def _wait(count, previous, limit, window, elapsed):
+    """
+    Sliding window estimate: the previous fixed window's count weighted by
+    how much of it still overlaps the last `window` seconds, plus the
+    current count. Returns the seconds until that drops back to the limit,
+    or None while within it.
+    """
+    remaining = window - elapsed
+    if previous * remaining / window + count <= limit:
+        return None
+    if count > limit:
+        # The current window alone is over; wait until enough of it slides out
+        wait = remaining + window * (1 - limit / count)
+    else:
+        wait = remaining - window * (limit - count) / previous
+    return max(1, math.ceil(wait))
+
+
+def hit(key, rate, amount=1):
+    """
+    Add amount to key's usage and return the seconds to wait if that puts it
+    over rate, else None. amount=0 only checks, and a negative amount gives
+    back usage. Counting uses the cache's
+    atomic add and incr, so concurrent workers sharing a cache never lose
+    updates; rejected requests count too, so hammering stays blocked.
+    """
+    limit, window = parse_rate(rate)
+    current, previous, elapsed = _window_keys(key, window, time.time())
+    cache.add(current, 0, timeout=window * 2)
+    count = cache.incr(current, amount)
+    return _wait(count, cache.get(previous, 0), limit, window, elapsed)
+
+
+async def ahit(key, rate, amount=1):
+    limit, window = parse_rate(rate)
+    current, previous, elapsed = _window_keys(key, window, time.time())
+    await cache.aadd(current, 0, timeout=window * 2)
+    count = await cache.aincr(current, amount)
+    return _wait(count, await cache.aget(previous, 0), limit, window, elapsed)
+
+
+def client_ip(request):
+    # DRF's lookup, which honours REST_FRAMEWORK['NUM_PROXIES']
+    return BaseThrottle().get_ident(request)
+
+
+def _who(request, user=None):
+    user = user if user is not None else getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return f'user:{user.pk}'
+    return f'ip:{client_ip(request)}'
+
+
+def limits(scope, request, user=None):
+    """
+    The (key, rate, amount) checks for a request in a throttle scope: one
+    per user and one per client IP, plus a check that the scope's byte
+    budget ('bytes' rate) is not already spent.
+    """
+    if not settings.THROTTLE_ENABLED:
+        return []
+    rates = settings.THROTTLE_RATES[scope]
+    who = _who(request, user)
+    checks = []
+    if 'user' in rates and who.startswith('user:'):
+        checks.append((f'{scope}:{who}', rates['user'], 1))
+    if 'ip' in rates:
+        checks.append((f'{scope}:ip:{client_ip(request)}', rates['ip'], 1))
+    if 'bytes' in rates:
+        checks.append((f'{scope}:bytes:{who}', rates['bytes'], 0))
+    return checks
+
+
+def check(scope, request, user=None):
+    """Count a request against its scope; returns the longest wait, or None"""
+    waits = [hit(key, rate, amount) for key, rate, amount in limits(scope, request, user)]
+    return max(filter(None, waits), default=None)
+
+
+async def acheck(scope, request, user=None):
+    waits = [await ahit(key, rate, amount) for key, rate, amount in limits(scope, request, user)]
+    return max(filter(None, waits), default=None)
+
+
+def _byte_charge(scope, request, response, size):
+    rate = settings.THROTTLE_RATES[scope].get('bytes') if settings.THROTTLE_ENABLED else None
+    length = response.get('Content-Length') if size is None else size
+    if rate and length:
+        return f'{scope}:bytes:{_who(request)}', rate, int(length)
+    return None
+
+
+def charge_bytes(scope, request, response, size=None):
+    """
+    Charge a served response's Content-Length to the scope's byte budget, or
+    size for responses that don't carry the bytes, like redirects to storage
+    """
+    charge = _byte_charge(scope, request, response, size)
+    if charge:
+        hit(*charge)
+
+
+async def acharge_bytes(scope, request, response, size=None):
+    charge = _byte_charge(scope, request, response, size)
+    if charge:
+        await ahit(*charge)
+
+
+def throttled_message(wait):
+    # Same wording as DRF's Throttled exception
+    return f'Request was throttled. Expected available in {wait} seconds.'
+
+
+class ScopedThrottle(BaseThrottle):
+    """
+    DRF throttle for one of the THROTTLE_RATES scopes. Unlike DRF's built-in
+    throttles it keeps counters, not request histories, in the cache, and
+    updates them atomically. DRF turns the wait into a 429 with Retry-After.
+    """
+    scope = None
+
+    def allow_request(self, request, view):
+        self.wait_seconds = check(self.scope, request)
+        return self.wait_seconds is None
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class DownloadThrottle(ScopedThrottle):
+    scope = 'download'
+
+
+class SearchThrottle(ScopedThrottle):
+    scope = 'search'
+
+
+class UploadThrottle(ScopedThrottle):
+    scope = 'upload'
+
+
+class LoginThrottle(ScopedThrottle):
+    """
+    Limits attempts per client IP, and failed attempts at a username from
+    one IP. Each attempt takes one from the username's budget up front, so
+    parallel guesses can't overrun it, and the view hands it back with
+    succeeded(); keying it by IP too means guessing from elsewhere can't lock
+    the owner out.
+    """
+    scope = 'login'
+
+    def allow_request(self, request, view):
+        if not settings.THROTTLE_ENABLED:
+            return True
+        rates = settings.THROTTLE_RATES[self.scope]
+        waits = [hit(f'login:ip:{client_ip(request)}', rates['ip'])]
+        key = self._username_key(request)
+        if key:
+            waits.append(hit(key, rates['user']))
+        self.wait_seconds = max(filter(None, waits), default=None)
+        return self.wait_seconds is None
+
+    @classmethod
+    def succeeded(cls, request):
+        key = cls._username_key(request)
+        if settings.THROTTLE_ENABLED and key:
+            hit(key, settings.THROTTLE_RATES[cls.scope]['user'], amount=-1)
+
+    @staticmethod
+    def _username_key(request):
+        username = str(request.data.get('username', '')).strip().lower()
+        return f'login:username:{username}:{client_ip(request)}' if username else None